@@ -0,0 +1,84 @@
+"""BENCHMARK - REQUEST LOGS SINK
+Measure the per-request logging overhead of the request logs persistence sink, for requests that are not persisted
+(no records reaching the persist level, which is the case for most requests). Compares:
+- none: request logs persistence disabled (baseline)
+- legacy: records serialized to JSON by loguru, sent through its queue, and parsed back by a coroutine handler
+- current: the bot sink, keeping the records as received and only serializing requests that are persisted
+Each mode runs on its own process, since the sinks are registered when the logger is imported.
+Run from the repository root: python -m tools.benchmarks.request_logs_sink
+(requires the bot settings, i.e. TOKEN and ADMIN_USERID env vars or .env file)
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import subprocess
+
+MODES = ("none", "legacy", "current")
+REQUESTS = 5000
+RECORDS_PER_REQUEST = 10
+
+
+def run_mode(mode: str):
+    """Run the benchmark for a mode on the current process, and print the time per request (microseconds)"""
+    os.environ["REQUEST_LOGS_PERSIST_ENABLED"] = "true" if mode == "current" else "false"
+    os.environ["REQUEST_LOGS_PRINT_LEVEL"] = "CRITICAL"
+    os.environ["LOG_LEVEL"] = "CRITICAL"
+
+    import cachetools
+    from vigobusbot.logger import logger
+
+    if mode == "legacy":
+        request_records = cachetools.TTLCache(maxsize=float("inf"), ttl=120)
+        persist_level_no = logger.level("ERROR").no
+
+        async def legacy_handler(record: str):
+            record = json.loads(record)["record"]
+            request_id = record["extra"]["request_id"]
+            request_records.setdefault(request_id, list()).append(record)
+            if record["extra"].get("last_record"):
+                records = request_records.pop(request_id)
+                assert not any(rec["level"]["no"] >= persist_level_no for rec in records)
+
+        logger.add(
+            legacy_handler,
+            level="TRACE",
+            filter=lambda record: bool(record["extra"].get("request_id")),
+            enqueue=True,
+            serialize=True
+        )
+
+    async def benchmark():
+        start = time.perf_counter()
+        for i in range(REQUESTS):
+            with logger.contextualize(request_id=f"request-{i}", verb="Stop", user_id=i):
+                for r in range(RECORDS_PER_REQUEST - 1):
+                    logger.bind(stop_id=r).debug("Processing request")
+                logger.bind(last_record=True).debug("Request processed")
+
+        await logger.complete()
+        return time.perf_counter() - start
+
+    elapsed = asyncio.get_event_loop().run_until_complete(benchmark())
+    print(elapsed / REQUESTS * 1e6)
+
+
+def main():
+    print(f"{REQUESTS} requests, {RECORDS_PER_REQUEST} records per request")
+    print(f"{'mode':>8} {'us/request':>12}")
+
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, "-m", "tools.benchmarks.request_logs_sink", mode],
+            check=True, capture_output=True, text=True
+        ).stdout
+        print(f"{mode:>8} {float(output.strip().splitlines()[-1]):>12.2f}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run_mode(sys.argv[1])
+    else:
+        main()
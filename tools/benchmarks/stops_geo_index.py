@@ -0,0 +1,56 @@
+"""BENCHMARK - STOPS GEO INDEX
+Compare the query latency of the Stops geo index against a linear scan, at realistic catalogue sizes.
+Run from the repository root: python -m tools.benchmarks.stops_geo_index
+(requires the bot settings, i.e. TOKEN and ADMIN_USERID env vars or .env file)
+"""
+
+import math
+import random
+import timeit
+
+from vigobusbot.entities import Stop
+from vigobusbot.vigobus_api.stops_geo_index import StopsGeoIndex
+
+# Bounding box of the Vigo urban area
+LAT_RANGE = (42.16, 42.26)
+LON_RANGE = (-8.80, -8.64)
+CATALOGUE_SIZES = (1500, 5000, 20000)
+QUERIES = 1000
+LIMIT = 5
+
+
+def random_location():
+    return random.uniform(*LAT_RANGE), random.uniform(*LON_RANGE)
+
+
+def linear_scan(stops, lat, lon, limit):
+    cos = math.cos(math.radians(lat))
+    return sorted(stops, key=lambda stop: math.hypot((stop.lon - lon) * cos, stop.lat - lat))[:limit]
+
+
+def main():
+    random.seed(0)
+    print(f"{'stops':>8} {'build (ms)':>12} {'index (us/query)':>18} {'linear (us/query)':>19}")
+
+    for size in CATALOGUE_SIZES:
+        stops = [Stop(stop_id=i, name=f"Stop {i}", lat=lat, lon=lon) for i, (lat, lon) in
+                 enumerate(random_location() for _ in range(size))]
+        locations = [random_location() for _ in range(QUERIES)]
+
+        index = StopsGeoIndex()
+        build_time = timeit.timeit(lambda: index.build(stops), number=1)
+
+        for lat, lon in locations[:50]:
+            indexed = [stop.stop_id for stop, _ in index.nearest(lat, lon, LIMIT)]
+            scanned = [stop.stop_id for stop in linear_scan(stops, lat, lon, LIMIT)]
+            assert indexed == scanned, "Geo index results differ from linear scan"
+
+        index_time = timeit.timeit(lambda: [index.nearest(lat, lon, LIMIT) for lat, lon in locations], number=1)
+        linear_time = timeit.timeit(lambda: [linear_scan(stops, lat, lon, LIMIT) for lat, lon in locations], number=1)
+
+        print(f"{size:>8} {build_time * 1000:>12.2f} "
+              f"{index_time / QUERIES * 1e6:>18.2f} {linear_time / QUERIES * 1e6:>19.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+"""FAKE BOT API - BUS ALERTS CHECK
+Create Bus Alerts against the fake Bot API and a fake Bus API, checking that the Buses of each Stop are fetched once
+per check (regardless of the amount of alerts of the Stop), the alerts are notified when their bus is close enough,
+expire if no bus arrives (even if the Buses can not be fetched), can be cancelled, adapt the delay of the next check to
+the arrival time of their buses, are persisted and loaded from the alerts file, and can be created and cancelled from
+the buttons (only on private chats).
+
+Run from the repository root: python -m tools.fake_bot_api.bus_alerts_check
+Exits with non-zero status if any check fails.
+"""
+
+import os
+import sys
+import json
+import socket
+import asyncio
+import tempfile
+import traceback
+from time import time
+
+import aiogram
+from aiohttp import web
+
+
+def _get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Bot settings must be set before importing the bot modules
+_api_port = _get_free_port()
+_bus_api_port = _get_free_port()
+os.environ["BOT_API"] = f"http://127.0.0.1:{_api_port}"
+os.environ["API_URL"] = f"http://127.0.0.1:{_bus_api_port}"
+os.environ["API_BUSES_CACHE_TTL"] = "0"
+os.environ["API_BUSES_ALL_CACHE_TTL"] = "0"
+os.environ["API_STOPS_CATALOGUE_ENABLED"] = "false"
+os.environ["BUS_ALERTS_CHECK_MIN_INTERVAL"] = "0.2"
+os.environ["BUS_ALERTS_CHECK_MAX_INTERVAL"] = "0.5"
+os.environ["BUS_ALERTS_MAX_PER_CHAT"] = "2"
+os.environ["BUS_ALERTS_PERSIST_FILE"] = os.path.join(tempfile.mkdtemp(), "bus_alerts.json")
+os.environ["OUTGOING_GLOBAL_RATE"] = "1000"
+os.environ["REQUEST_LOGS_PERSIST_ENABLED"] = "false"
+os.environ["TOKEN"] = "123456:BusAlertsCheck"
+os.environ.setdefault("ADMIN_USERID", "0")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+from vigobusbot.static_handler import load_static_files, get_messages
+from vigobusbot.settings_handler import telegram_settings
+from vigobusbot.telegram_bot import get_bot
+from vigobusbot.telegram_bot.services import bus_alerts
+from vigobusbot.telegram_bot.services.message_generators import *
+from vigobusbot.telegram_bot.handlers.callback_handlers import stop_alert, bus_alert_line, bus_alert_create
+from vigobusbot.telegram_bot.handlers.callback_handlers import bus_alert_cancel
+from .server import create_app, FakeBotAPI
+from .bus_api import create_bus_api_app, FakeBusAPI
+
+MAX_INTERVAL = telegram_settings.bus_alerts_check_max_interval
+
+
+async def _wait_for(condition, timeout: float = 5):
+    loop = asyncio.get_event_loop()
+    end = loop.time() + timeout
+    while not condition():
+        assert loop.time() < end, "Timed out waiting for condition"
+        await asyncio.sleep(0.05)
+
+
+def _get_notified_chats(fake_api: FakeBotAPI, start: int) -> set:
+    return {int(call["chat_id"]) for call in fake_api.get_calls("sendMessage")[start:]}
+
+
+async def check_batched_per_stop(fake_api: FakeBotAPI, bus_api: FakeBusAPI):
+    # 50 alerts on stop 1, 20 alerts on stop 2; the buses are far, then close enough
+    for stop_id in (1, 2):
+        bus_api.set_buses(stop_id, [{"line": "C1", "route": "Check", "time": 10}])
+    bus_api.hits.clear()
+    start = len(fake_api.get_calls("sendMessage"))
+
+    alerts = [bus_alerts.create_alert(chat_id=1000 + i, stop_id=1, line="C1", minutes=5, message_id=1)
+              for i in range(50)]
+    alerts += [bus_alerts.create_alert(chat_id=2000 + i, stop_id=2, line="c1", minutes=5, message_id=1)
+               for i in range(20)]
+    await _wait_for(lambda: bus_api.hits[1] and bus_api.hits[2])
+    assert not _get_notified_chats(fake_api, start)
+
+    for stop_id in (1, 2):
+        bus_api.set_buses(stop_id, [{"line": "C1", "route": "Check", "time": 4}])
+    await _wait_for(lambda: len(_get_notified_chats(fake_api, start)) == len(alerts))
+    # One Buses request per stop and check: one when created, one when notified
+    assert bus_api.hits == {1: 2, 2: 2}, bus_api.hits
+    assert not bus_alerts._alerts
+
+
+async def check_limit_per_chat(fake_api: FakeBotAPI, bus_api: FakeBusAPI):
+    bus_api.set_buses(3, [])
+    created = [bus_alerts.create_alert(chat_id=3000, stop_id=3, line="C1", minutes=5, message_id=1) for _ in range(3)]
+    assert created[-1] is None, created
+    for alert in created[:-1]:
+        assert bus_alerts.cancel_alert(alert_id=alert.alert_id, chat_id=3000)
+
+
+async def check_cancelled(fake_api: FakeBotAPI, bus_api: FakeBusAPI):
+    bus_api.set_buses(4, [{"line": "C1", "route": "Check", "time": 10}])
+    bus_api.hits.clear()
+    start = len(fake_api.get_calls("sendMessage"))
+
+    alert = bus_alerts.create_alert(chat_id=4000, stop_id=4, line="C1", minutes=5, message_id=1)
+    await _wait_for(lambda: bus_api.hits[4])
+    # Another chat can not cancel the alert
+    assert bus_alerts.cancel_alert(alert_id=alert.alert_id, chat_id=4001) is None
+    assert bus_alerts.cancel_alert(alert_id=alert.alert_id, chat_id=4000) is alert
+
+    bus_api.set_buses(4, [{"line": "C1", "route": "Check", "time": 1}])
+    await asyncio.sleep(MAX_INTERVAL + 0.2)
+    assert bus_api.hits[4] == 1, bus_api.hits
+    assert not _get_notified_chats(fake_api, start)
+
+
+async def check_expired(fake_api: FakeBotAPI, bus_api: FakeBusAPI):
+    bus_api.set_buses(5, [{"line": "C1", "route": "Check", "time": 1}])
+    start = len(fake_api.get_calls("sendMessage"))
+    duration = telegram_settings.bus_alerts_duration
+    telegram_settings.bus_alerts_duration = 0.3
+    try:
+        bus_alerts.create_alert(chat_id=5000, stop_id=5, line="L5", minutes=5, message_id=1)
+    finally:
+        telegram_settings.bus_alerts_duration = duration
+
+    await _wait_for(lambda: _get_notified_chats(fake_api, start) == {5000})
+    assert not bus_alerts._alerts
+
+
+async def check_expired_buses_unavailable(fake_api: FakeBotAPI, bus_api: FakeBusAPI):
+    bus_api.unavailable.add(8)
+    start = len(fake_api.get_calls("sendMessage"))
+    duration = telegram_settings.bus_alerts_duration
+    telegram_settings.bus_alerts_duration = 0.3
+    try:
+        bus_alerts.create_alert(chat_id=8000, stop_id=8, line="C1", minutes=5, message_id=1)
+    finally:
+        telegram_settings.bus_alerts_duration = duration
+
+    await _wait_for(lambda: _get_notified_chats(fake_api, start) == {8000})
+    assert not bus_alerts._alerts
+    assert 8 not in bus_alerts._checks
+    bus_api.unavailable.discard(8)
+
+
+async def check_adaptive_delay(fake_api: FakeBotAPI, bus_api: FakeBusAPI):
+    alert = bus_alerts.BusAlert(
+        alert_id="0", chat_id=0, stop_id=0, line="C1", minutes=5, created_on=time(), expires_on=time() + 3600,
+        message_id=None
+    )
+    min_interval, max_interval = telegram_settings.bus_alerts_check_min_interval, MAX_INTERVAL
+    telegram_settings.bus_alerts_check_min_interval, telegram_settings.bus_alerts_check_max_interval = 30, 300
+    try:
+        delays = [bus_alerts._get_next_check_delay(alert, minutes) for minutes in (None, 30, 9, 6)]
+    finally:
+        telegram_settings.bus_alerts_check_min_interval = min_interval
+        telegram_settings.bus_alerts_check_max_interval = max_interval
+
+    # No bus of the line (or far): the maximum delay; closer buses, shorter delays (until the minimum)
+    assert delays == [300, 300, 120, 30], delays
+
+
+async def check_persisted(fake_api: FakeBotAPI, bus_api: FakeBusAPI):
+    bus_api.set_buses(6, [])
+    alert = bus_alerts.create_alert(chat_id=6000, stop_id=6, line="C1", minutes=5, message_id=1)
+    await bus_alerts.save_bus_alerts()
+
+    # Forget the alert (as after a restart), then load it from the file
+    bus_alerts._remove_alert(alert)
+    assert not bus_alerts._alerts
+    await bus_alerts.load_bus_alerts()
+
+    assert bus_alerts._alerts == {alert.alert_id: alert}, bus_alerts._alerts
+    assert 6 in bus_alerts._checks
+    assert bus_alerts.cancel_alert(alert_id=alert.alert_id, chat_id=6000)
+
+
+def _callback_query(data: str, chat_id: int, chat_type: str = "private") -> aiogram.types.CallbackQuery:
+    return aiogram.types.CallbackQuery.to_object({
+        "id": "1",
+        "from": {"id": abs(chat_id), "is_bot": False, "first_name": "Check"},
+        "chat_instance": "1",
+        "data": data,
+        "message": {"message_id": 1, "date": 0, "chat": {"id": chat_id, "type": chat_type}, "text": "Check"}
+    })
+
+
+def _get_last_callback_data(fake_api: FakeBotAPI, method: str) -> list:
+    markup = json.loads(fake_api.get_calls(method)[-1]["reply_markup"])
+    return [button["callback_data"] for row in markup["inline_keyboard"] for button in row]
+
+
+async def check_buttons(fake_api: FakeBotAPI, bus_api: FakeBusAPI):
+    # Stop message Alert button -> line buttons -> minutes buttons -> alert created with cancel button -> cancelled
+    aiogram.Bot.set_current(get_bot())
+    bus_api.set_buses(7, [
+        {"line": "C1", "route": "Check", "time": 10}, {"line": "A", "route": "Check", "time": 20},
+        {"line": "C1", "route": "Check", "time": 30}
+    ])
+    chat_id = 7000
+    stop_callback_data = {"stop_id": "7", "get_all_buses": "0", "more_buses_available": "0"}
+
+    await stop_alert(_callback_query(StopAlertCallbackData.new(**stop_callback_data), chat_id), stop_callback_data)
+    lines_callback_data = _get_last_callback_data(fake_api, "sendMessage")
+    assert lines_callback_data == [BusAlertLineCallbackData.new(stop_id=7, line=line) for line in ("A", "C1")]
+
+    callback_data = BusAlertLineCallbackData.parse(lines_callback_data[1])
+    await bus_alert_line(_callback_query(lines_callback_data[1], chat_id), callback_data)
+    minutes_callback_data = _get_last_callback_data(fake_api, "editMessageText")
+    assert len(minutes_callback_data) == len(BUS_ALERT_MINUTES_OPTIONS), minutes_callback_data
+
+    callback_data = BusAlertCreateCallbackData.parse(minutes_callback_data[1])
+    await bus_alert_create(_callback_query(minutes_callback_data[1], chat_id), callback_data)
+    alert = next(alert for alert in bus_alerts._alerts.values() if alert.chat_id == chat_id)
+    assert (alert.stop_id, alert.line, alert.minutes) == (7, "C1", BUS_ALERT_MINUTES_OPTIONS[1]), alert
+
+    cancel_callback_data = _get_last_callback_data(fake_api, "editMessageText")
+    assert cancel_callback_data == [BusAlertCancelCallbackData.new(alert_id=alert.alert_id)]
+    await bus_alert_cancel(
+        _callback_query(cancel_callback_data[0], chat_id), BusAlertCancelCallbackData.parse(cancel_callback_data[0])
+    )
+    assert alert.alert_id not in bus_alerts._alerts
+
+
+async def check_private_chats_only(fake_api: FakeBotAPI, bus_api: FakeBusAPI):
+    # The Alert button is not shown on Stop messages of groups, and pressing it (from an older message) is rejected
+    aiogram.Bot.set_current(get_bot())
+    chat_id = -9000
+    group_message = _callback_query("", chat_id, chat_type="group").message
+    private_message = _callback_query("", 9000).message
+    for message, shown in ((group_message, False), (private_message, True)):
+        markup = generate_stop_message_buttons(
+            context=SourceContext(stop_id=9, user_id=message.chat.id, source_message=message), is_stop_saved=False
+        )
+        callback_data = [button.callback_data for row in markup.inline_keyboard for button in row]
+        alert_prefix = StopAlertCallbackData.prefix + StopAlertCallbackData.sep
+        assert any(data.startswith(alert_prefix) for data in callback_data) is shown, callback_data
+
+    bus_api.set_buses(9, [{"line": "C1", "route": "Check", "time": 10}])
+    bus_api.hits.clear()
+    sent = len(fake_api.get_calls("sendMessage"))
+    stop_callback_data = {"stop_id": "9", "get_all_buses": "0", "more_buses_available": "0"}
+    await stop_alert(
+        _callback_query(StopAlertCallbackData.new(**stop_callback_data), chat_id, chat_type="group"), stop_callback_data
+    )
+    create_callback_data = BusAlertCreateCallbackData.new(stop_id=9, line="C1", minutes=5)
+    await bus_alert_create(
+        _callback_query(create_callback_data, chat_id, chat_type="group"),
+        BusAlertCreateCallbackData.parse(create_callback_data)
+    )
+
+    assert len(fake_api.get_calls("sendMessage")) == sent
+    assert not bus_api.hits
+    assert not any(alert.chat_id == chat_id for alert in bus_alerts._alerts.values())
+    answer = fake_api.get_calls("answerCallbackQuery")[-1]
+    assert answer.get("text") == get_messages().bus_alerts.private_chat_only, answer
+
+
+_checks = (
+    check_batched_per_stop, check_limit_per_chat, check_cancelled, check_expired, check_expired_buses_unavailable,
+    check_adaptive_delay, check_persisted, check_buttons, check_private_chats_only
+)
+
+
+async def main() -> int:
+    load_static_files()
+    fake_api = FakeBotAPI()
+    bus_api = FakeBusAPI()
+    runners = [web.AppRunner(create_app(fake_api)), web.AppRunner(create_bus_api_app(bus_api))]
+    for runner, port in zip(runners, (_api_port, _bus_api_port)):
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+
+    worker = asyncio.create_task(bus_alerts.bus_alerts_worker(get_bot()))
+    failed = 0
+    for check in _checks:
+        # noinspection PyBroadException
+        try:
+            await check(fake_api, bus_api)
+            print(f"OK   {check.__name__}")
+        except Exception:
+            failed += 1
+            print(f"FAIL {check.__name__}")
+            traceback.print_exc()
+
+    worker.cancel()
+    await (await get_bot().get_session()).close()
+    for runner in runners:
+        await runner.cleanup()
+    print(f"{len(_checks) - failed} checks passed, {failed} failed")
+    return failed
+
+
+if __name__ == '__main__':
+    sys.exit(1 if asyncio.get_event_loop().run_until_complete(main()) else 0)
@@ -0,0 +1,62 @@
+"""FAKE BOT API - BUS API
+Local, minimal fake of the Bus API (Stop, Stops listing & Buses endpoints), counting the Buses requests of each Stop.
+The buses of each Stop can be set; if not set, a single bus is returned, with a different time on each request
+(so the Stop messages change on each refresh). The Buses requests of a Stop can be made to fail (HTTP 500).
+"""
+
+import itertools
+from collections import Counter
+from typing import List, Dict, Set
+
+from aiohttp import web
+
+__all__ = ("create_bus_api_app", "FakeBusAPI")
+
+
+class FakeBusAPI:
+    def __init__(self):
+        self.hits = Counter()
+        """Buses requests. Key=stop_id ; Value=requests"""
+        self._buses: Dict[int, List[dict]] = dict()
+        self.unavailable: Set[int] = set()
+        """Stops whose Buses requests fail"""
+        self.stops_listing = [1, 2, 3]
+        """stop_id of the Stops returned by the Stops listing"""
+        self.stops_listing_hits = 0
+        self._times = itertools.count()
+
+    def set_buses(self, stop_id: int, buses: List[dict]):
+        """Set the buses returned for the Stop, as dicts with line, route & time (minutes)"""
+        self._buses[stop_id] = buses
+
+    def get_buses(self, stop_id: int) -> List[dict]:
+        self.hits[stop_id] += 1
+        buses = self._buses.get(stop_id)
+        if buses is None:
+            return [{"line": "C1", "route": "Check", "time": next(self._times) % 60}]
+        return buses
+
+
+def create_bus_api_app(fake_api: FakeBusAPI) -> web.Application:
+    def stop_json(stop_id: int) -> dict:
+        return {"stop_id": stop_id, "name": f"Stop {stop_id}", "lat": None, "lon": None}
+
+    async def stop_endpoint(request: web.Request):
+        return web.json_response(stop_json(int(request.match_info["stop_id"])))
+
+    async def stops_endpoint(_):
+        fake_api.stops_listing_hits += 1
+        return web.json_response([stop_json(stop_id) for stop_id in fake_api.stops_listing])
+
+    async def buses_endpoint(request: web.Request):
+        stop_id = int(request.match_info["stop_id"])
+        if stop_id in fake_api.unavailable:
+            fake_api.hits[stop_id] += 1
+            raise web.HTTPInternalServerError()
+        return web.json_response({"buses": fake_api.get_buses(stop_id), "more_buses_available": False})
+
+    app = web.Application()
+    app.router.add_get("/stop/{stop_id}", stop_endpoint)
+    app.router.add_get("/stops", stops_endpoint)
+    app.router.add_get("/buses/{stop_id}", buses_endpoint)
+    return app
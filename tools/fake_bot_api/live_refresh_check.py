@@ -0,0 +1,177 @@
+"""FAKE BOT API - LIVE REFRESH CHECK
+Subscribe Stop messages to the live refresh against the fake Bot API and a fake Bus API, checking that the Buses of
+each Stop are fetched once per tick (regardless of the amount of subscribed messages), all the subscribed messages are
+edited, and the subscriptions end when expired or disabled by the user (Live Refresh button).
+
+Run from the repository root: python -m tools.fake_bot_api.live_refresh_check
+Exits with non-zero status if any check fails.
+"""
+
+import os
+import sys
+import json
+import socket
+import asyncio
+import tempfile
+import traceback
+from collections import Counter
+
+import aiogram
+from aiohttp import web
+
+
+def _get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Bot settings must be set before importing the bot modules
+_api_port = _get_free_port()
+_bus_api_port = _get_free_port()
+os.environ["BOT_API"] = f"http://127.0.0.1:{_api_port}"
+os.environ["API_URL"] = f"http://127.0.0.1:{_bus_api_port}"
+os.environ["API_BUSES_CACHE_TTL"] = "0"
+os.environ["API_STOPS_CATALOGUE_ENABLED"] = "false"
+os.environ["STOP_MESSAGES_LIVE_REFRESH_INTERVAL"] = "0.5"
+os.environ["STOP_MESSAGES_LIVE_REFRESH_DURATION"] = "1.2"
+os.environ["OUTGOING_GLOBAL_RATE"] = "100"
+os.environ["PERSIST_BACKEND"] = "sqlite"
+os.environ["PERSIST_SQLITE_FILE"] = os.path.join(tempfile.mkdtemp(), "saved_stops.db")
+os.environ["REQUEST_LOGS_PERSIST_ENABLED"] = "false"
+os.environ["TOKEN"] = "123456:LiveRefreshCheck"
+os.environ.setdefault("ADMIN_USERID", "0")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+from vigobusbot.static_handler import load_static_files, get_messages
+from vigobusbot.telegram_bot import get_bot
+from vigobusbot.telegram_bot.handlers.callback_handlers import stop_live_refresh
+from vigobusbot.telegram_bot.services.message_editor import get_message_key
+from vigobusbot.telegram_bot.services.message_generators import SourceContext, StopLiveRefreshCallbackData
+from vigobusbot.telegram_bot.services.stop_messages_live_refresh import *
+from vigobusbot.telegram_bot.services.stop_messages_live_refresh import _pollers
+from .server import create_app, FakeBotAPI
+from .bus_api import create_bus_api_app, FakeBusAPI
+
+INTERVAL = float(os.environ["STOP_MESSAGES_LIVE_REFRESH_INTERVAL"])
+DURATION = float(os.environ["STOP_MESSAGES_LIVE_REFRESH_DURATION"])
+
+
+async def _wait_for(condition, timeout: float = 5):
+    loop = asyncio.get_event_loop()
+    end = loop.time() + timeout
+    while not condition():
+        assert loop.time() < end, "Timed out waiting for condition"
+        await asyncio.sleep(0.05)
+
+
+def _get_last_edit_buttons_texts(fake_api: FakeBotAPI) -> list:
+    last_edit = fake_api.get_calls("editMessageText")[-1]
+    return [button["text"] for row in json.loads(last_edit["reply_markup"])["inline_keyboard"] for button in row]
+
+
+def _subscribe(stop_id: int, chat_id: int) -> LiveRefreshSubscription:
+    subscription = LiveRefreshSubscription(
+        message_key=get_message_key(chat_id=chat_id, message_id=1),
+        context=SourceContext(stop_id=stop_id, user_id=None, source_message=None),
+        chat_id=chat_id,
+        message_id=1
+    )
+    assert subscribe_live_refresh(bot=get_bot(), subscription=subscription)
+    return subscription
+
+
+async def check_fan_out(fake_api: FakeBotAPI, bus_api: FakeBusAPI):
+    # 10 messages of stop 1, 5 messages of stop 2
+    subscriptions = [_subscribe(stop_id=1, chat_id=1000 + i) for i in range(10)]
+    subscriptions += [_subscribe(stop_id=2, chat_id=2000 + i) for i in range(5)]
+    assert len(_pollers) == 2, _pollers
+
+    start = len(fake_api.get_calls("editMessageText"))
+    bus_api.hits.clear()
+
+    def get_edited_chats() -> Counter:
+        return Counter(int(call["chat_id"]) for call in fake_api.get_calls("editMessageText")[start:])
+
+    # 2 ticks: 15 messages edited on each tick, with the buses fetched once per stop and tick
+    await _wait_for(lambda: len(get_edited_chats()) == len(subscriptions) and min(get_edited_chats().values()) >= 2)
+    edited_chats = get_edited_chats()
+    assert set(edited_chats.values()) == {2}, edited_chats
+    assert bus_api.hits == {1: 2, 2: 2}, bus_api.hits
+
+
+async def check_expired(fake_api: FakeBotAPI, bus_api: FakeBusAPI):
+    # Subscriptions from the previous check expire after the duration; a last edit is sent, then the pollers end
+    await asyncio.sleep(DURATION)
+    assert not _pollers, _pollers
+    buttons_texts = _get_last_edit_buttons_texts(fake_api)
+    assert get_messages().stop.buttons.live_refresh_enable in buttons_texts, buttons_texts
+
+    bus_api.hits.clear()
+    await asyncio.sleep(INTERVAL * 2)
+    assert not bus_api.hits, bus_api.hits
+
+
+async def check_button_toggle(fake_api: FakeBotAPI, bus_api: FakeBusAPI):
+    bot = get_bot()
+    aiogram.Bot.set_current(bot)
+    callback_data = {"stop_id": "3", "get_all_buses": "0", "more_buses_available": "0"}
+    callback_query = aiogram.types.CallbackQuery.to_object({
+        "id": "1",
+        "from": {"id": 3000, "is_bot": False, "first_name": "Check"},
+        "chat_instance": "1",
+        "data": StopLiveRefreshCallbackData.new(**callback_data),
+        "message": {
+            "message_id": 1,
+            "date": 0,
+            "chat": {"id": 3000, "type": "private"},
+            "text": "Stop"
+        }
+    })
+    message_key = get_message_key(chat_id=3000, message_id=1)
+
+    await stop_live_refresh(callback_query, dict(callback_data))
+    assert get_live_refresh_subscription(message_key) is not None
+    assert 3 in _pollers, _pollers
+    buttons_texts = _get_last_edit_buttons_texts(fake_api)
+    assert get_messages().stop.buttons.live_refresh_disable in buttons_texts, buttons_texts
+
+    await stop_live_refresh(callback_query, dict(callback_data))
+    assert get_live_refresh_subscription(message_key) is None
+    await asyncio.sleep(INTERVAL + 0.1)
+    assert not _pollers, _pollers
+    assert len(fake_api.get_calls("answerCallbackQuery")) == 2
+
+
+_checks = (check_fan_out, check_expired, check_button_toggle)
+
+
+async def main() -> int:
+    load_static_files()
+    fake_api = FakeBotAPI()
+    bus_api = FakeBusAPI()
+    runners = [web.AppRunner(create_app(fake_api)), web.AppRunner(create_bus_api_app(bus_api))]
+    for runner, port in zip(runners, (_api_port, _bus_api_port)):
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+
+    failed = 0
+    for check in _checks:
+        # noinspection PyBroadException
+        try:
+            await check(fake_api, bus_api)
+            print(f"OK   {check.__name__}")
+        except Exception:
+            failed += 1
+            print(f"FAIL {check.__name__}")
+            traceback.print_exc()
+
+    await (await get_bot().get_session()).close()
+    for runner in runners:
+        await runner.cleanup()
+    print(f"{len(_checks) - failed} checks passed, {failed} failed")
+    return failed
+
+
+if __name__ == '__main__':
+    sys.exit(1 if asyncio.get_event_loop().run_until_complete(main()) else 0)
@@ -0,0 +1,117 @@
+"""FAKE BOT API - OUTGOING CHECK
+Send messages through the bot against the fake Bot API, checking that the outgoing rate limits (per chat & global)
+are enforced, flood control errors (429) are retried after the given time, and interactive messages are sent before
+background messages.
+
+Run from the repository root: python -m tools.fake_bot_api.outgoing_check
+Exits with non-zero status if any check fails.
+"""
+
+import os
+import sys
+import socket
+import asyncio
+import traceback
+
+from aiohttp import web
+
+
+def _get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Bot settings must be set before importing the bot modules
+_api_port = _get_free_port()
+os.environ["BOT_API"] = f"http://127.0.0.1:{_api_port}"
+os.environ["OUTGOING_GLOBAL_RATE"] = "20"
+os.environ["OUTGOING_CHAT_RATE"] = "5"
+os.environ["OUTGOING_CHAT_BURST"] = "1"
+os.environ["REQUEST_LOGS_PERSIST_ENABLED"] = "false"
+os.environ["TOKEN"] = "123456:OutgoingCheck"
+os.environ.setdefault("ADMIN_USERID", "0")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+from vigobusbot.telegram_bot import get_bot
+from vigobusbot.telegram_bot.outgoing_limiter import background_priority
+from .server import create_app, FakeBotAPI
+
+
+async def check_chat_rate(fake_api: FakeBotAPI):
+    bot = get_bot()
+    start = len(fake_api.get_calls("sendMessage"))
+    await asyncio.gather(*[bot.send_message(chat_id=1, text=str(i)) for i in range(6)])
+
+    times = fake_api.get_calls_times("sendMessage")[start:]
+    # 1 message at once, then 5 per second
+    assert times[-1] - times[0] >= 0.9, times[-1] - times[0]
+    assert [call["text"] for call in fake_api.get_calls("sendMessage")[start:]] == [str(i) for i in range(6)]
+
+
+async def check_global_rate(fake_api: FakeBotAPI):
+    bot = get_bot()
+    await asyncio.sleep(1)  # refill the global bucket
+    start = len(fake_api.get_calls("sendMessage"))
+    await asyncio.gather(*[bot.send_message(chat_id=100 + i, text="global") for i in range(30)])
+
+    times = fake_api.get_calls_times("sendMessage")[start:]
+    # 20 messages at once, then 20 per second
+    assert times[-1] - times[0] >= 0.45, times[-1] - times[0]
+
+
+async def check_retry_after(fake_api: FakeBotAPI):
+    bot = get_bot()
+    fake_api.flood(chat_id=7, retry_after=1)
+    before = asyncio.get_event_loop().time()
+    message = await bot.send_message(chat_id=7, text="flood")
+    assert message.chat.id == 7
+    assert asyncio.get_event_loop().time() - before >= 1
+
+
+async def check_interactive_priority(fake_api: FakeBotAPI):
+    bot = get_bot()
+    bot.outgoing_limiter.global_bucket.pause(0.2)
+    start = len(fake_api.get_calls("sendMessage"))
+
+    async def send_background(i):
+        with background_priority():
+            await bot.send_message(chat_id=200 + i, text="background")
+
+    background = [asyncio.create_task(send_background(i)) for i in range(20)]
+    await asyncio.sleep(0.05)
+    interactive = [asyncio.create_task(bot.send_message(chat_id=300 + i, text="interactive")) for i in range(5)]
+    await asyncio.gather(*background, *interactive)
+
+    texts = [call["text"] for call in fake_api.get_calls("sendMessage")[start:]]
+    assert texts[:5] == ["interactive"] * 5, texts
+
+
+_checks = (check_chat_rate, check_global_rate, check_retry_after, check_interactive_priority)
+
+
+async def main() -> int:
+    fake_api = FakeBotAPI()
+    runner = web.AppRunner(create_app(fake_api))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", _api_port).start()
+
+    failed = 0
+    for check in _checks:
+        # noinspection PyBroadException
+        try:
+            await check(fake_api)
+            print(f"OK   {check.__name__}")
+        except Exception:
+            failed += 1
+            print(f"FAIL {check.__name__}")
+            traceback.print_exc()
+
+    await (await get_bot().get_session()).close()
+    await runner.cleanup()
+    print(f"{len(_checks) - failed} checks passed, {failed} failed")
+    return failed
+
+
+if __name__ == '__main__':
+    sys.exit(1 if asyncio.get_event_loop().run_until_complete(main()) else 0)
@@ -0,0 +1,191 @@
+"""FAKE BOT API - REFRESH CHECK
+Press the Refresh button of Stop messages against the fake Bot API and a fake Bus API, through the Dispatcher of the bot
+(as the updates received from Telegram), checking that repeated presses queued on the same message are coalesced
+(the Buses are fetched once, and the message edited once), while presses after the refresh finished are processed.
+Also checks that the edits of Stop messages sent out of the refresh (deprecation reminder, Save/Delete buttons) do not
+make the following refreshes be skipped as unchanged.
+
+Run from the repository root: python -m tools.fake_bot_api.refresh_check
+Exits with non-zero status if any check fails.
+"""
+
+import os
+import sys
+import socket
+import asyncio
+import datetime
+import tempfile
+import itertools
+import traceback
+
+import aiogram
+from aiohttp import web
+
+
+def _get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Bot settings must be set before importing the bot modules
+_api_port = _get_free_port()
+_bus_api_port = _get_free_port()
+os.environ["BOT_API"] = f"http://127.0.0.1:{_api_port}"
+os.environ["API_URL"] = f"http://127.0.0.1:{_bus_api_port}"
+os.environ["API_BUSES_CACHE_TTL"] = "0"
+os.environ["API_STOPS_CATALOGUE_ENABLED"] = "false"
+os.environ["OUTGOING_GLOBAL_RATE"] = "100"
+os.environ["USER_RATE_LIMIT_AMOUNT"] = "100"
+os.environ["PERSIST_BACKEND"] = "sqlite"
+os.environ["PERSIST_SQLITE_FILE"] = os.path.join(tempfile.mkdtemp(), "saved_stops.db")
+os.environ["REQUEST_LOGS_PERSIST_ENABLED"] = "false"
+os.environ["TOKEN"] = "123456:RefreshCheck"
+os.environ.setdefault("ADMIN_USERID", "0")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+from vigobusbot.static_handler import load_static_files
+from vigobusbot.telegram_bot import get_bot
+from vigobusbot.telegram_bot.services.message_generators import StopUpdateCallbackData, generate_stop_message_buttons
+from vigobusbot.telegram_bot.services.message_generators import SourceContext
+from vigobusbot.telegram_bot.services.message_editor import edit_message_text_if_changed, edit_message_reply_markup
+from vigobusbot.telegram_bot.services.sent_messages_persistence import MessagePersist, PersistMessageTypes
+from vigobusbot.telegram_bot.services.stop_messages_deprecation_reminder import _process_deprecated_stop_message
+from .server import create_app, FakeBotAPI
+from .bus_api import create_bus_api_app, FakeBusAPI
+
+_updates_ids = itertools.count(1)
+
+
+async def _wait_for(condition, timeout: float = 5):
+    loop = asyncio.get_event_loop()
+    end = loop.time() + timeout
+    while not condition():
+        assert loop.time() < end, "Timed out waiting for condition"
+        await asyncio.sleep(0.05)
+
+
+async def _wait_processed():
+    scheduler = get_bot().dispatcher.update_scheduler
+    await _wait_for(lambda: scheduler.pending == 0 and scheduler.in_progress == 0)
+
+
+def _refresh_update(stop_id: int, chat_id: int, message_id: int = 1) -> aiogram.types.Update:
+    return aiogram.types.Update.to_object({
+        "update_id": next(_updates_ids),
+        "callback_query": {
+            "id": str(next(_updates_ids)),
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Check"},
+            "chat_instance": "1",
+            "data": StopUpdateCallbackData.new(stop_id=stop_id, get_all_buses=0, more_buses_available=0),
+            "message": {
+                "message_id": message_id,
+                "date": 0,
+                "chat": {"id": chat_id, "type": "private"},
+                "text": "Stop"
+            }
+        }
+    })
+
+
+def _get_edits(fake_api: FakeBotAPI, chat_id: int) -> list:
+    return [call for call in fake_api.get_calls("editMessageText") if int(call["chat_id"]) == chat_id]
+
+
+async def check_presses_coalesced(fake_api: FakeBotAPI, bus_api: FakeBusAPI):
+    # Two presses back-to-back on the same message: the second is coalesced with the first (queued)
+    dispatcher = get_bot().dispatcher
+    await dispatcher.process_updates([_refresh_update(stop_id=1, chat_id=1000)])
+    await dispatcher.process_updates([_refresh_update(stop_id=1, chat_id=1000)])
+    await _wait_processed()
+
+    assert bus_api.hits[1] == 1, bus_api.hits
+    assert len(_get_edits(fake_api, 1000)) == 1, _get_edits(fake_api, 1000)
+
+
+async def check_other_messages_not_coalesced(fake_api: FakeBotAPI, bus_api: FakeBusAPI):
+    # Presses on different messages of the same chat are all processed
+    await get_bot().dispatcher.process_updates([
+        _refresh_update(stop_id=2, chat_id=2000, message_id=1),
+        _refresh_update(stop_id=2, chat_id=2000, message_id=2)
+    ])
+    await _wait_processed()
+
+    assert bus_api.hits[2] == 2, bus_api.hits
+    assert len(_get_edits(fake_api, 2000)) == 2, _get_edits(fake_api, 2000)
+
+
+async def check_later_presses_processed(fake_api: FakeBotAPI, bus_api: FakeBusAPI):
+    # A press after the previous refresh finished is processed (the buses changed, so the message is edited again)
+    for _ in range(2):
+        await get_bot().dispatcher.process_updates([_refresh_update(stop_id=3, chat_id=3000)])
+        await _wait_processed()
+
+    assert bus_api.hits[3] == 2, bus_api.hits
+    assert len(_get_edits(fake_api, 3000)) == 2, _get_edits(fake_api, 3000)
+
+
+async def check_edits_out_of_refresh(fake_api: FakeBotAPI, bus_api: FakeBusAPI):
+    # The same content is edited after other edits changed the message: the edit must not be skipped
+    bot = get_bot()
+    chat_id = 4000
+    markup = generate_stop_message_buttons(
+        context=SourceContext(stop_id=4, user_id=chat_id, source_message=None), is_stop_saved=False
+    )
+    message = {"chat_id": chat_id, "message_id": 1}
+
+    assert await edit_message_text_if_changed(bot=bot, text="Stop", reply_markup=markup, **message)
+    assert await edit_message_text_if_changed(bot=bot, text="Stop", reply_markup=markup, **message) is None
+
+    # Save/Delete buttons
+    await edit_message_reply_markup(bot=bot, reply_markup=None, **message)
+    assert await edit_message_text_if_changed(bot=bot, text="Stop", reply_markup=markup, **message)
+
+    # Deprecation reminder
+    await _process_deprecated_stop_message(bot=bot, message=MessagePersist(
+        message_type=PersistMessageTypes.STOP,
+        message=aiogram.types.Message.to_object({
+            "message_id": 1, "date": 0, "chat": {"id": chat_id, "type": "private"}, "text": "Stop",
+            "reply_markup": markup.to_python()
+        }),
+        published_on=datetime.datetime.now()
+    ))
+    assert await edit_message_text_if_changed(bot=bot, text="Stop", reply_markup=markup, **message)
+    assert len(_get_edits(fake_api, chat_id)) == 4, _get_edits(fake_api, chat_id)
+
+
+_checks = (
+    check_presses_coalesced, check_other_messages_not_coalesced, check_later_presses_processed,
+    check_edits_out_of_refresh
+)
+
+
+async def main() -> int:
+    load_static_files()
+    fake_api = FakeBotAPI()
+    bus_api = FakeBusAPI()
+    runners = [web.AppRunner(create_app(fake_api)), web.AppRunner(create_bus_api_app(bus_api))]
+    for runner, port in zip(runners, (_api_port, _bus_api_port)):
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+
+    failed = 0
+    for check in _checks:
+        # noinspection PyBroadException
+        try:
+            await check(fake_api, bus_api)
+            print(f"OK   {check.__name__}")
+        except Exception:
+            failed += 1
+            print(f"FAIL {check.__name__}")
+            traceback.print_exc()
+
+    await (await get_bot().get_session()).close()
+    for runner in runners:
+        await runner.cleanup()
+    print(f"{len(_checks) - failed} checks passed, {failed} failed")
+    return failed
+
+
+if __name__ == '__main__':
+    sys.exit(1 if asyncio.get_event_loop().run_until_complete(main()) else 0)
@@ -0,0 +1,108 @@
+"""FAKE BOT API - SERVER
+Local, minimal fake of the Telegram Bot API, for running the bot (i.e. in webhook mode) without reaching Telegram.
+Every method call is accepted and recorded; methods that return a Message (sendMessage, editMessageText) return one
+built from the call parameters, getMe returns a fake bot user, and other methods return True.
+Flood control (429 with retry_after) can be simulated for the calls to a chat.
+
+Run from the repository root: python -m tools.fake_bot_api.server [--port 8081]
+Then run the bot with BOT_API=http://127.0.0.1:8081
+"""
+
+import time
+import argparse
+import itertools
+from typing import List, Tuple, Dict
+
+from aiohttp import web
+
+__all__ = ("create_app", "FakeBotAPI")
+
+MethodCall = Tuple[str, dict, float]
+"""(method name, parameters, time.monotonic when called)"""
+
+MESSAGE_METHODS = ("sendmessage", "editmessagetext")
+
+
+class FakeBotAPI:
+    def __init__(self):
+        self.calls: List[MethodCall] = list()
+        self._messages_ids = itertools.count(1)
+        self._floods: Dict[str, List[int]] = dict()
+        """Key=chat_id ; Value=[retry_after, remaining calls to reject]"""
+
+    def get_calls(self, method: str) -> List[dict]:
+        """Return the parameters of the recorded calls to the given method"""
+        return [params for name, params, _ in self.calls if name.lower() == method.lower()]
+
+    def get_calls_times(self, method: str) -> List[float]:
+        """Return the times (time.monotonic) of the recorded calls to the given method"""
+        return [called_on for name, _, called_on in self.calls if name.lower() == method.lower()]
+
+    def flood(self, chat_id: int, retry_after: int, calls: int = 1):
+        """Reject the next calls to the given chat with 429 (flood control), with the given retry_after"""
+        self._floods[str(chat_id)] = [retry_after, calls]
+
+    def get_flood_error(self, params: dict):
+        flood = self._floods.get(str(params.get("chat_id")))
+        if flood is None or flood[1] <= 0:
+            return None
+
+        flood[1] -= 1
+        return {
+            "ok": False,
+            "error_code": 429,
+            "description": f"Too Many Requests: retry after {flood[0]}",
+            "parameters": {"retry_after": flood[0]}
+        }
+
+    def handle(self, method: str, params: dict):
+        self.calls.append((method, params, time.monotonic()))
+        method = method.lower()
+
+        if method == "getme":
+            return {"id": 1, "is_bot": True, "first_name": "Fake bot", "username": "fake_bot"}
+
+        if method in MESSAGE_METHODS:
+            chat_id = int(params.get("chat_id", 0))
+            return {
+                "message_id": int(params.get("message_id") or next(self._messages_ids)),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", "")
+            }
+
+        return True
+
+
+def create_app(fake_api: FakeBotAPI) -> web.Application:
+    async def method_endpoint(request: web.Request):
+        params = dict(request.query)
+        if request.can_read_body:
+            if request.content_type == "application/json":
+                params.update(await request.json())
+            else:
+                params.update(await request.post())
+
+        flood_error = fake_api.get_flood_error(params)
+        if flood_error is not None:
+            return web.json_response(flood_error, status=429)
+
+        result = fake_api.handle(request.match_info["method"], params)
+        return web.json_response({"ok": True, "result": result})
+
+    app = web.Application()
+    app.router.add_route("*", "/bot{token}/{method}", method_endpoint)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+
+    web.run_app(create_app(FakeBotAPI()), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
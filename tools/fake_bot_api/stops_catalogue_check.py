@@ -0,0 +1,103 @@
+"""FAKE BOT API - STOPS CATALOGUE CHECK
+Run the Stops catalogue worker against a fake Bus API, checking that it keeps running while the circuit breaker of the
+Bus API is open (the loads are retried), and loads the catalogue once the circuit lets the requests through again.
+
+Run from the repository root: python -m tools.fake_bot_api.stops_catalogue_check
+Exits with non-zero status if any check fails.
+"""
+
+import os
+import sys
+import socket
+import asyncio
+import traceback
+
+from aiohttp import web
+
+
+def _get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Bot settings must be set before importing the bot modules
+_bus_api_port = _get_free_port()
+os.environ["API_URL"] = f"http://127.0.0.1:{_bus_api_port}"
+os.environ["API_STOPS_CATALOGUE_ENABLED"] = "true"
+os.environ["API_STOPS_CATALOGUE_REFRESH_SECONDS"] = "0.2"
+os.environ["API_STOPS_CATALOGUE_RETRY_SECONDS"] = "0.2"
+os.environ["API_CIRCUIT_BREAKER_ENABLED"] = "true"
+os.environ["API_CIRCUIT_BREAKER_OPEN_SECONDS"] = "1"
+os.environ["REQUEST_LOGS_PERSIST_ENABLED"] = "false"
+os.environ["TOKEN"] = "123456:StopsCatalogueCheck"
+os.environ.setdefault("ADMIN_USERID", "0")
+os.environ.setdefault("LOG_LEVEL", "CRITICAL")
+
+from vigobusbot.vigobus_api import stops_catalogue_worker
+from vigobusbot.vigobus_api.stops_catalogue import get_stops_catalogue
+from vigobusbot.vigobus_api.requester import get_circuit_breaker
+from vigobusbot.services.http import close_http_clients
+from .bus_api import create_bus_api_app, FakeBusAPI
+
+OPEN_SECONDS = float(os.environ["API_CIRCUIT_BREAKER_OPEN_SECONDS"])
+
+
+async def _wait_for(condition, timeout: float = 5):
+    loop = asyncio.get_event_loop()
+    end = loop.time() + timeout
+    while not condition():
+        assert loop.time() < end, "Timed out waiting for condition"
+        await asyncio.sleep(0.05)
+
+
+async def check_worker_survives_circuit_open(bus_api: FakeBusAPI):
+    circuit_breaker = get_circuit_breaker()
+    # noinspection PyProtectedMember
+    circuit_breaker._open()
+
+    worker = asyncio.create_task(stops_catalogue_worker())
+    try:
+        # While open, the loads are rejected without requesting the API, and retried
+        await _wait_for(lambda: circuit_breaker.rejected_requests >= 2)
+        assert not worker.done(), worker
+        assert bus_api.stops_listing_hits == 0, bus_api.stops_listing_hits
+
+        # Once the circuit lets a probe request through, the catalogue is loaded
+        await _wait_for(lambda: get_stops_catalogue(), timeout=OPEN_SECONDS + 2)
+        assert set(get_stops_catalogue()) == set(bus_api.stops_listing), get_stops_catalogue()
+        assert not worker.done(), worker
+
+    finally:
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+
+
+_checks = (check_worker_survives_circuit_open,)
+
+
+async def main() -> int:
+    bus_api = FakeBusAPI()
+    runner = web.AppRunner(create_bus_api_app(bus_api))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", _bus_api_port).start()
+
+    failed = 0
+    for check in _checks:
+        # noinspection PyBroadException
+        try:
+            await check(bus_api)
+            print(f"OK   {check.__name__}")
+        except Exception:
+            failed += 1
+            print(f"FAIL {check.__name__}")
+            traceback.print_exc()
+
+    await close_http_clients()
+    await runner.cleanup()
+    print(f"{len(_checks) - failed} checks passed, {failed} failed")
+    return failed
+
+
+if __name__ == '__main__':
+    sys.exit(1 if asyncio.get_event_loop().run_until_complete(main()) else 0)
@@ -0,0 +1,189 @@
+"""FAKE BOT API - WEBHOOK CHECK
+Run the bot in webhook mode against the fake Bot API, checking that the webhook is set on startup, updates are
+validated with the secret token and processed (the bot replies through the Bot API), the update queue is bounded,
+the updates of each chat are processed in order, and the bot stops gracefully on SIGTERM.
+
+Run from the repository root: python -m tools.fake_bot_api.webhook_check
+Exits with non-zero status if any check fails.
+"""
+
+import os
+import sys
+import signal
+import socket
+import asyncio
+import traceback
+
+import httpx
+import aiogram
+from aiohttp import web
+
+
+def _get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Bot settings must be set before importing the bot modules
+_api_port = _get_free_port()
+_webhook_port = _get_free_port()
+SECRET_TOKEN = "webhook-check-secret"
+os.environ["BOT_API"] = f"http://127.0.0.1:{_api_port}"
+os.environ["METHOD"] = "webhook"
+os.environ["WEBHOOK_URL"] = "https://example.com/webhook"
+os.environ["WEBHOOK_HOST"] = "127.0.0.1"
+os.environ["WEBHOOK_PORT"] = str(_webhook_port)
+os.environ["WEBHOOK_PATH"] = "/webhook"
+os.environ["WEBHOOK_SECRET_TOKEN"] = SECRET_TOKEN
+os.environ["REQUEST_LOGS_PERSIST_ENABLED"] = "false"
+os.environ["TOKEN"] = "123456:WebhookCheck"
+os.environ.setdefault("ADMIN_USERID", "0")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from vigobusbot.static_handler import load_static_files
+from vigobusbot.telegram_bot import get_bot
+from vigobusbot.telegram_bot.webhook import WebhookServer, SECRET_TOKEN_HEADER, _run_webhook
+from vigobusbot.telegram_bot.update_scheduler import UpdateScheduler
+from .server import create_app, FakeBotAPI
+
+WEBHOOK_URL = f"http://127.0.0.1:{_webhook_port}/webhook"
+CHAT_ID = 1234
+
+
+def _start_update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": CHAT_ID, "type": "private"},
+            "from": {"id": CHAT_ID, "is_bot": False, "first_name": "Check"},
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}]
+        }
+    }
+
+
+async def _wait_for(condition, timeout: float = 5):
+    loop = asyncio.get_event_loop()
+    end = loop.time() + timeout
+    while not condition():
+        assert loop.time() < end, "Timed out waiting for condition"
+        await asyncio.sleep(0.05)
+
+
+async def check_webhook_set(fake_api: FakeBotAPI, client: httpx.AsyncClient):
+    calls = fake_api.get_calls("setWebhook")
+    assert len(calls) == 1, calls
+    assert calls[0]["url"] == os.environ["WEBHOOK_URL"]
+    assert calls[0]["secret_token"] == SECRET_TOKEN
+
+
+async def check_invalid_secret_token_rejected(fake_api: FakeBotAPI, client: httpx.AsyncClient):
+    response = await client.post(WEBHOOK_URL, json=_start_update(1))
+    assert response.status_code == 401, response.status_code
+    response = await client.post(WEBHOOK_URL, json=_start_update(1), headers={SECRET_TOKEN_HEADER: "wrong"})
+    assert response.status_code == 401, response.status_code
+
+
+async def check_invalid_update_rejected(fake_api: FakeBotAPI, client: httpx.AsyncClient):
+    response = await client.post(WEBHOOK_URL, content=b"not json", headers={SECRET_TOKEN_HEADER: SECRET_TOKEN})
+    assert response.status_code == 400, response.status_code
+
+
+async def check_update_processed(fake_api: FakeBotAPI, client: httpx.AsyncClient):
+    response = await client.post(WEBHOOK_URL, json=_start_update(2), headers={SECRET_TOKEN_HEADER: SECRET_TOKEN})
+    assert response.status_code == 200, response.status_code
+    await _wait_for(lambda: fake_api.get_calls("sendMessage"))
+    assert all(int(call["chat_id"]) == CHAT_ID for call in fake_api.get_calls("sendMessage"))
+
+
+async def check_queue_bounded(fake_api: FakeBotAPI, client: httpx.AsyncClient):
+    # Separate server with a scheduler that blocks on processing, so the pending updates are never drained
+    blocked = asyncio.Event()
+    port = _get_free_port()
+    server = WebhookServer(
+        bot=get_bot(), host="127.0.0.1", port=port, path="/webhook", secret_token=None, queue_size=2,
+        scheduler=UpdateScheduler(process=lambda update: blocked.wait(), max_concurrency=1)
+    )
+    await server.start()
+    try:
+        statuses = [
+            (await client.post(f"http://127.0.0.1:{port}/webhook", json=_start_update(10 + i))).status_code
+            for i in range(4)
+        ]
+        # The first update is being processed (not pending)
+        assert statuses == [200, 200, 200, 503], statuses
+    finally:
+        await server.stop(timeout=0.1)
+
+
+async def check_chat_order(fake_api: FakeBotAPI, client: httpx.AsyncClient):
+    # Updates of the same chat are processed in order (even if the first one is slower), other chats concurrently
+    processed = list()
+
+    async def process(update):
+        chat_id = update.message.chat.id
+        await asyncio.sleep(0.2 if update.update_id % 2 else 0)
+        processed.append((chat_id, update.update_id))
+
+    scheduler = UpdateScheduler(process=process, max_concurrency=10)
+    for chat_id in (1, 2):
+        for update_id in (1, 2, 3, 4):
+            update = _start_update(update_id)
+            update["message"]["chat"]["id"] = chat_id
+            scheduler.submit(aiogram.types.Update.to_object(update))
+
+    await scheduler.close(timeout=5)
+    for chat_id in (1, 2):
+        assert [u for c, u in processed if c == chat_id] == [1, 2, 3, 4], processed
+    # Both chats were processed concurrently
+    assert [c for c, u in processed[:2]] == [1, 2], processed
+
+
+_checks = (
+    check_webhook_set, check_invalid_secret_token_rejected, check_invalid_update_rejected, check_update_processed,
+    check_queue_bounded, check_chat_order
+)
+
+
+async def main() -> int:
+    load_static_files()
+    fake_api = FakeBotAPI()
+    runner = web.AppRunner(create_app(fake_api))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", _api_port).start()
+
+    webhook_task = asyncio.create_task(_run_webhook(get_bot()))
+    failed = 0
+    async with httpx.AsyncClient() as client:
+        # Wait for the webhook server to start
+        await _wait_for(lambda: fake_api.get_calls("setWebhook") or webhook_task.done())
+
+        for check in _checks:
+            # noinspection PyBroadException
+            try:
+                await check(fake_api, client)
+                print(f"OK   {check.__name__}")
+            except Exception:
+                failed += 1
+                print(f"FAIL {check.__name__}")
+                traceback.print_exc()
+
+    os.kill(os.getpid(), signal.SIGTERM)
+    try:
+        await asyncio.wait_for(webhook_task, timeout=15)
+        print("OK   check_graceful_stop")
+    except Exception:
+        failed += 1
+        print("FAIL check_graceful_stop")
+        traceback.print_exc()
+
+    await runner.cleanup()
+    print(f"{len(_checks) + 1 - failed} checks passed, {failed} failed")
+    return failed
+
+
+if __name__ == '__main__':
+    sys.exit(1 if asyncio.get_event_loop().run_until_complete(main()) else 0)
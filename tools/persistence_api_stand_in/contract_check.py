@@ -0,0 +1,173 @@
+"""PERSISTENCE API STAND-IN - CONTRACT CHECK
+Run the bot Saved Stops manager against the stand-in server (with in-memory and SQLite storages), checking that
+both sides agree on the Persistence API contract. The same checks run against the embedded SQLite backend of the bot.
+The Saved Stops cache of the bot is disabled, so every operation reaches the backend.
+
+Run from the repository root: python -m tools.persistence_api_stand_in.contract_check
+Exits with non-zero status if any check fails.
+"""
+
+import os
+import sys
+import socket
+import asyncio
+import tempfile
+import traceback
+
+from aiohttp import web
+
+
+def _get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Bot settings must be set before importing the bot modules
+_port = _get_free_port()
+os.environ["PERSIST_URL"] = f"http://127.0.0.1:{_port}"
+os.environ["PERSIST_SAVED_STOPS_CACHE_SIZE"] = "0"
+os.environ.setdefault("TOKEN", "0:ContractCheck")
+os.environ.setdefault("ADMIN_USERID", "0")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from vigobusbot.persistence_api import saved_stops
+from vigobusbot.persistence_api.saved_stops.services.encoder import encode_user_id
+from vigobusbot.persistence_api.saved_stops import backends
+from vigobusbot.services.http import close_http_clients
+from .server import create_app, MemoryStorage, SQLiteStorage
+
+_checks = list()
+
+
+def contract_check(function):
+    _checks.append(function)
+    return function
+
+
+@contract_check
+async def check_user_without_stops(read_persisted, user_id: int):
+    assert await saved_stops.get_user_saved_stops(user_id) == []
+    assert await saved_stops.get_stop(user_id=user_id, stop_id=1) is None
+    assert await saved_stops.is_stop_saved(user_id=user_id, stop_id=1) is False
+
+
+@contract_check
+async def check_save_and_read_stops(read_persisted, user_id: int):
+    saved = await saved_stops.save_stop(user_id=user_id, stop_id=10)
+    assert saved.stop_id == 10 and saved.stop_name is None
+    await saved_stops.save_stop(user_id=user_id, stop_id=20, stop_name="Casa ñ 🏠")
+
+    stops = {stop.stop_id: stop for stop in await saved_stops.get_user_saved_stops(user_id)}
+    assert set(stops) == {10, 20}
+    assert stops[10].stop_name is None
+    assert stops[20].stop_name == "Casa ñ 🏠"
+    assert all(stop.user_id == user_id for stop in stops.values())
+
+    stop = await saved_stops.get_stop(user_id=user_id, stop_id=20)
+    assert stop.stop_name == "Casa ñ 🏠" and stop.user_id == user_id
+
+
+@contract_check
+async def check_data_persisted_encoded(read_persisted, user_id: int):
+    await saved_stops.save_stop(user_id=user_id, stop_id=30, stop_name="Traballo")
+    persisted = await read_persisted(encode_user_id(user_id))
+    assert len(persisted) == 1 and persisted[0]["stop_id"] == 30
+    assert persisted[0]["stop_name"] != "Traballo", "Stop name must be persisted encoded"
+    assert await read_persisted(str(user_id)) == [], "User ID must be persisted encoded"
+
+
+@contract_check
+async def check_rename_and_unname_stop(read_persisted, user_id: int):
+    await saved_stops.save_stop(user_id=user_id, stop_id=40, stop_name="Old")
+    await saved_stops.save_stop(user_id=user_id, stop_id=40, stop_name="New")
+    assert (await saved_stops.get_stop(user_id=user_id, stop_id=40)).stop_name == "New"
+
+    await saved_stops.save_stop(user_id=user_id, stop_id=40, stop_name=None)
+    assert (await saved_stops.get_stop(user_id=user_id, stop_id=40)).stop_name is None
+    assert len(await saved_stops.get_user_saved_stops(user_id)) == 1
+
+
+@contract_check
+async def check_delete_stop(read_persisted, user_id: int):
+    await saved_stops.save_stop(user_id=user_id, stop_id=50)
+    await saved_stops.save_stop(user_id=user_id, stop_id=51)
+
+    assert await saved_stops.delete_stop(user_id=user_id, stop_id=50) is True
+    assert await saved_stops.delete_stop(user_id=user_id, stop_id=50) is False
+    assert await saved_stops.is_stop_saved(user_id=user_id, stop_id=50) is False
+    assert [stop.stop_id for stop in await saved_stops.get_user_saved_stops(user_id)] == [51]
+
+
+@contract_check
+async def check_delete_all_stops(read_persisted, user_id: int):
+    other_user_id = user_id + 1
+    for stop_id in (60, 61, 62):
+        await saved_stops.save_stop(user_id=user_id, stop_id=stop_id)
+    await saved_stops.save_stop(user_id=other_user_id, stop_id=60)
+
+    await saved_stops.delete_all_stops(user_id)
+    await saved_stops.delete_all_stops(user_id)
+    assert await saved_stops.get_user_saved_stops(user_id) == []
+    assert [stop.stop_id for stop in await saved_stops.get_user_saved_stops(other_user_id)] == [60]
+
+
+async def run_checks(name: str, read_persisted) -> int:
+    """Run all the checks against the current Saved Stops backend. Return the amount of failed checks.
+    read_persisted is an async function returning the persisted stops (as JSON) of an encoded user ID."""
+    failed = 0
+
+    for i, check in enumerate(_checks):
+        user_id = 1000 * (i + 1)
+        try:
+            await check(read_persisted, user_id)
+            print(f"[{name}] OK    {check.__name__}")
+        except BaseException:
+            failed += 1
+            print(f"[{name}] FAIL  {check.__name__}\n{traceback.format_exc()}")
+
+    return failed
+
+
+async def run_checks_on_server(name: str, storage) -> int:
+    """Run all the checks against a stand-in server with the given storage, using the bot API backend"""
+    runner = web.AppRunner(create_app(storage))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", _port).start()
+
+    try:
+        return await run_checks(name, storage.get_stops)
+    finally:
+        await runner.cleanup()
+
+
+async def run_checks_on_sqlite_backend(path: str) -> int:
+    """Run all the checks using the bot SQLite backend"""
+    backend = backends.SQLiteBackend(path)
+
+    async def read_persisted(encoded_user_id: str):
+        return [stop.dict(include={"stop_id", "stop_name"}) for stop in await backend.get_user_stops(encoded_user_id)]
+
+    backends._backend = backend
+    try:
+        return await run_checks("bot-sqlite", read_persisted)
+    finally:
+        await backends.close_backend()
+
+
+async def main() -> int:
+    failed = 0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        failed += await run_checks_on_server("api-memory", MemoryStorage())
+        failed += await run_checks_on_server("api-sqlite", SQLiteStorage(os.path.join(tmp_dir, "server.db")))
+        await backends.close_backend()
+        failed += await run_checks_on_sqlite_backend(os.path.join(tmp_dir, "bot.db"))
+
+    await close_http_clients()
+    print(f"{len(_checks) * 3 - failed} checks passed, {failed} failed")
+    return failed
+
+
+if __name__ == '__main__':
+    sys.exit(1 if asyncio.run(main()) else 0)
@@ -0,0 +1,152 @@
+"""PERSISTENCE API STAND-IN - SERVER
+Local, async implementation of the Persistence API, for running the bot or benchmarks without the real API.
+Data is kept in memory, or optionally on a SQLite database file (using the SQLite backend of the bot).
+
+Endpoints (same as the Persistence API used by the bot):
+- GET /stops/{user_id}: list the Saved Stops of a user
+- GET /stops/{user_id}/{stop_id}: get a single Saved Stop of a user (404 if not saved)
+- POST /stops: save or update a Saved Stop (body: SavedStopEncoded)
+- DELETE /stops/{user_id}/{stop_id}: delete a single Saved Stop of a user (404 if not saved)
+- DELETE /stops/{user_id}: delete all the Saved Stops of a user
+
+Run from the repository root: python -m tools.persistence_api_stand_in.server [--port 5001] [--sqlite stops.db]
+"""
+
+import os
+import argparse
+from typing import Optional, List, Dict
+
+from aiohttp import web
+
+# The SQLite storage uses the SQLite backend of the bot; the bot settings required on import are not used by it
+os.environ.setdefault("TOKEN", "0:PersistenceStandIn")
+os.environ.setdefault("ADMIN_USERID", "0")
+
+from vigobusbot.persistence_api.saved_stops.entities import SavedStopEncoded
+from vigobusbot.persistence_api.saved_stops.backends import SQLiteBackend
+
+__all__ = ("create_app", "MemoryStorage", "SQLiteStorage")
+
+SavedStopJSON = Dict[str, object]
+"""{"stop_id": int, "stop_name": Optional[str]}"""
+
+
+class MemoryStorage:
+    def __init__(self):
+        self._stops: Dict[str, Dict[int, Optional[str]]] = dict()
+        """Key=user_id ; Value={stop_id: stop_name}"""
+
+    async def get_stops(self, user_id: str) -> List[SavedStopJSON]:
+        return [
+            {"stop_id": stop_id, "stop_name": stop_name}
+            for stop_id, stop_name in self._stops.get(user_id, {}).items()
+        ]
+
+    async def get_stop(self, user_id: str, stop_id: int) -> Optional[SavedStopJSON]:
+        user_stops = self._stops.get(user_id, {})
+        if stop_id in user_stops:
+            return {"stop_id": stop_id, "stop_name": user_stops[stop_id]}
+
+    async def save_stop(self, user_id: str, stop_id: int, stop_name: Optional[str]):
+        self._stops.setdefault(user_id, dict())[stop_id] = stop_name
+
+    async def delete_stop(self, user_id: str, stop_id: int) -> bool:
+        return self._stops.get(user_id, {}).pop(stop_id, ...) is not ...
+
+    async def delete_stops(self, user_id: str):
+        self._stops.pop(user_id, None)
+
+    async def close(self):
+        pass
+
+
+class SQLiteStorage:
+    """Storage on a SQLite database file, through the SQLite backend of the bot (same schema, pragmas and queries)"""
+
+    def __init__(self, path: str):
+        self._backend = SQLiteBackend(path)
+
+    async def get_stops(self, user_id: str) -> List[SavedStopJSON]:
+        return [
+            {"stop_id": stop.stop_id, "stop_name": stop.stop_name}
+            for stop in await self._backend.get_user_stops(user_id)
+        ]
+
+    async def get_stop(self, user_id: str, stop_id: int) -> Optional[SavedStopJSON]:
+        stop = await self._backend.get_stop(user_id, stop_id)
+        if stop is not None:
+            return {"stop_id": stop.stop_id, "stop_name": stop.stop_name}
+
+    async def save_stop(self, user_id: str, stop_id: int, stop_name: Optional[str]):
+        await self._backend.save_stop(SavedStopEncoded(user_id=user_id, stop_id=stop_id, stop_name=stop_name))
+
+    async def delete_stop(self, user_id: str, stop_id: int) -> bool:
+        return await self._backend.delete_stop(user_id, stop_id)
+
+    async def delete_stops(self, user_id: str):
+        await self._backend.delete_all_stops(user_id)
+
+    async def close(self):
+        await self._backend.close()
+
+
+def create_app(storage=None) -> web.Application:
+    """Create the aiohttp application of the stand-in server, using the given storage (in memory by default)"""
+    storage = storage or MemoryStorage()
+    routes = web.RouteTableDef()
+
+    @routes.get("/stops/{user_id}")
+    async def get_stops(request: web.Request):
+        return web.json_response(await storage.get_stops(request.match_info["user_id"]))
+
+    @routes.get("/stops/{user_id}/{stop_id:\\d+}")
+    async def get_stop(request: web.Request):
+        stop = await storage.get_stop(request.match_info["user_id"], int(request.match_info["stop_id"]))
+        if stop is None:
+            raise web.HTTPNotFound(text="Saved stop not exists")
+        return web.json_response(stop)
+
+    @routes.post("/stops")
+    async def save_stop(request: web.Request):
+        body = await request.json()
+        try:
+            user_id, stop_id, stop_name = str(body["user_id"]), int(body["stop_id"]), body.get("stop_name")
+        except (KeyError, TypeError, ValueError):
+            raise web.HTTPUnprocessableEntity(text="Invalid saved stop")
+
+        await storage.save_stop(user_id, stop_id, stop_name)
+        return web.json_response({"user_id": user_id, "stop_id": stop_id, "stop_name": stop_name})
+
+    @routes.delete("/stops/{user_id}/{stop_id:\\d+}")
+    async def delete_stop(request: web.Request):
+        if not await storage.delete_stop(request.match_info["user_id"], int(request.match_info["stop_id"])):
+            raise web.HTTPNotFound(text="Saved stop not exists")
+        return web.Response(status=204)
+
+    @routes.delete("/stops/{user_id}")
+    async def delete_stops(request: web.Request):
+        await storage.delete_stops(request.match_info["user_id"])
+        return web.Response(status=204)
+
+    async def close_storage(_):
+        await storage.close()
+
+    app = web.Application()
+    app.add_routes(routes)
+    app.on_cleanup.append(close_storage)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Persistence API stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--sqlite", help="SQLite database file (if not given, data is kept in memory)")
+    args = parser.parse_args()
+
+    storage = SQLiteStorage(args.sqlite) if args.sqlite else MemoryStorage()
+    web.run_app(create_app(storage), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -44,3 +44,6 @@ class BusesResponse(pydantic.BaseModel):
     """List of Bus objects (if no buses available, is empty array)"""
     more_buses_available: bool = False
     """If True, more buses are available to fetch"""
+    outdated_since: Optional[datetime.datetime] = None
+    """If set, the buses could not be fetched from the API and were served from cache (fetched on this date),
+    thus they may be outdated"""
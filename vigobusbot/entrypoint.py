@@ -6,10 +6,31 @@ Start Telegram bot using Polling/Webhook methods depending on the settings
 import asyncio
 
 # # Project # #
-from vigobusbot.telegram_bot import get_bot, start_polling
+from vigobusbot.telegram_bot import get_bot, start_polling, start_webhook
+from vigobusbot.telegram_bot.services.bus_alerts import save_bus_alerts
 from vigobusbot.static_handler import load_static_files
+from vigobusbot.services.http import close_http_clients
+from vigobusbot.persistence_api.saved_stops.backends import close_backend
+from vigobusbot.services.cache import get_caches_stats
+from vigobusbot.services.mongo import close_client as close_mongo_client
+from vigobusbot.services.metrics import stop_metrics_server
 from vigobusbot.settings_handler import telegram_settings as settings
-from vigobusbot.logger import logger
+from vigobusbot.logger import logger, flush_records, get_logs_writer_stats
+
+
+async def shutdown():
+    """Release the resources used by the services (connection pools...). Must run after the bot stopped."""
+    logger.bind(caches_stats=get_caches_stats()).info("Closing services...")
+    await save_bus_alerts()
+    await stop_metrics_server()
+    await close_http_clients()
+    await close_backend()
+
+    # Let the pending request records reach the writer, and persist them before closing the Mongo client
+    await asyncio.sleep(0)
+    await flush_records()
+    close_mongo_client()
+    logger.bind(logs_writer_stats=get_logs_writer_stats()).debug("Services closed")
 
 
 def run():
@@ -18,12 +39,16 @@ def run():
     asyncio.get_event_loop().run_until_complete(bot.set_commands())
     asyncio.get_event_loop().run_until_complete(bot.start_background_services())
 
-    if settings.method == "webhook":
-        logger.debug("Starting the bot with the Webhook method...")
-        raise Exception("Webhook method not yet implemented")
-    else:
-        logger.debug("Starting the bot with the Polling method...")
-        start_polling(bot)
+    try:
+        if settings.method == "webhook":
+            logger.debug("Starting the bot with the Webhook method...")
+            start_webhook(bot)
+        else:
+            logger.debug("Starting the bot with the Polling method...")
+            start_polling(bot)
+
+    finally:
+        asyncio.get_event_loop().run_until_complete(shutdown())
 
     logger.debug("Bye!")
 
@@ -7,7 +7,7 @@ from aiogram.utils.exceptions import MessageNotModified
 
 __all__ = (
     "GetterException", "GetterInternalException", "GetterAPIException", "GetterTimedOut", "StopNotExist",
-    "MessageNotModified", "UserRateLimit", "BusBotException"
+    "MessageNotModified", "UserRateLimit", "DeadlineExceeded", "CircuitOpen", "BusBotException"
 )
 
 
@@ -44,3 +44,13 @@ class GetterTimedOut(TimeoutError, GetterException):
 class UserRateLimit(BusBotException):
     """A user exceeded the request rate limit of the bot"""
     pass
+
+
+class DeadlineExceeded(TimeoutError, BusBotException):
+    """The deadline for processing a request passed before completing an operation"""
+    pass
+
+
+class CircuitOpen(BusBotException):
+    """A request to an upstream service was rejected because its circuit breaker is open (the upstream is failing)"""
+    pass
@@ -1,16 +1,21 @@
 """LOGGER
-Loggers initialization and self-utils
+Loggers initialization and self-utils.
+Request records are kept in memory until the request ends, and then persisted if the request had any record reaching
+the persist level, or (sampled) if the request was slow. The memory used is bounded: each request keeps only its
+first and last records, and the oldest requests are discarded when too many records are kept for all the requests.
 """
 
 # # Native # #
 import sys
-import json
+import random
+import asyncio
 import logging
 import contextlib
-from typing import Optional
+import contextvars
+import collections
+from typing import Optional, List
 
 # # Installed # #
-import cachetools
 from loguru import logger
 # noinspection PyProtectedMember
 from loguru._logger import context as loguru_context
@@ -19,15 +24,20 @@ from loguru._logger import context as loguru_context
 from vigobusbot.repositories.logs import *
 from vigobusbot.settings_handler import system_settings as settings
 
-__all__ = ("logger", "get_request_id", "get_request_verb")
+__all__ = (
+    "logger", "get_request_id", "get_request_verb", "set_request_logs_loop", "flush_records", "get_logs_writer_stats",
+    "get_request_logs_stats"
+)
 
 LoggerFormat = "<green>{time:YY-MM-DD HH:mm:ss}</green> | " \
                "<level>{level}</level> | " \
                "{function}: <level>{message}</level> | " \
                "{extra}"
 
-_request_records = cachetools.TTLCache(maxsize=float("inf"), ttl=settings.request_logs_persist_record_timeout)
-"""Local cache for the request records organized by request id: { request_id: record[] }"""
+_persist_level_no = logger.level(settings.request_logs_persist_level.upper()).no
+"""Minimum level number for a request to have its records persisted"""
+_loop: Optional[asyncio.AbstractEventLoop] = None
+"""Event loop where the request records are persisted, for records received out of it (set when the bot starts)"""
 
 
 def get_request_id() -> Optional[str]:
@@ -44,6 +54,22 @@ def get_request_verb() -> Optional[str]:
         return context.get("verb")
 
 
+def set_request_logs_loop():
+    """Set the running event loop as the loop where the request records are persisted.
+    Must be called from the event loop when the bot starts."""
+    global _loop
+    _loop = asyncio.get_running_loop()
+
+
+def _get_persist_loop() -> Optional[asyncio.AbstractEventLoop]:
+    """Return the event loop where the request records must be persisted: the running loop, if the record comes from
+    it, or else the loop set when the bot started (if still running). None if no loop is available."""
+    with contextlib.suppress(RuntimeError):
+        return asyncio.get_running_loop()
+    if _loop is not None and _loop.is_running():
+        return _loop
+
+
 def _set_request_filter(is_request_logger: bool):
     """Set filter for virtual loggers, depending if the virtual logger is for request logs or system logs"""
     def record_filter(record: dict):
@@ -52,40 +78,229 @@ def _set_request_filter(is_request_logger: bool):
     return record_filter
 
 
-async def _request_record_handler(record: str):
-    """Handler for any Request record received"""
-    request_id = None
+class _RequestRecords:
+    """Records of a request, kept as the original loguru records until the request ends.
+    Only the first (head) and last (tail) records are kept; the records between them are dropped, and counted."""
+    __slots__ = ("head", "tail", "dropped", "max_level_no", "started_on", "last_on")
+
+    def __init__(self, started_on: float):
+        self.head = list()
+        self.tail = collections.deque(maxlen=settings.request_logs_persist_record_tail)
+        self.dropped = 0
+        self.max_level_no = 0
+        self.started_on = started_on
+        self.last_on = started_on
+        """Time of the first & last records, as seconds elapsed since the logger started"""
+
+    @property
+    def records(self) -> List[dict]:
+        return self.head + list(self.tail)
+
+    @property
+    def duration(self) -> float:
+        return self.last_on - self.started_on
+
+    def __len__(self):
+        return len(self.head) + len(self.tail)
+
+    def append(self, record: dict, elapsed: float) -> int:
+        """Add a record. Return the change on the amount of records kept (0 or 1)."""
+        self.max_level_no = max(self.max_level_no, record["level"].no)
+        self.last_on = elapsed
+
+        if len(self.head) < settings.request_logs_persist_record_head:
+            self.head.append(record)
+            return 1
+
+        kept = len(self.tail)
+        if kept == self.tail.maxlen:
+            self.dropped += 1
+        self.tail.append(record)
+        return len(self.tail) - kept
+
+
+class _RequestRecordsBuffer:
+    """Records of all the requests in progress, by request id (sorted by start).
+    Requests are discarded when expired (not ended after the timeout), or when the buffer has too many records
+    (starting with the oldest requests).
+    """
+
+    def __init__(self, timeout: float, max_records: int):
+        self.timeout = timeout
+        self.max_records = max_records
+        self.records_count = 0
+        self.dropped_records = 0
+        self.expired_requests = 0
+        self.evicted_requests = 0
+        self.persisted_requests = 0
+        self.unpersisted_requests = 0
+        self.sampled_slow_requests = 0
+        self._requests: "collections.OrderedDict[str, _RequestRecords]" = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._requests)
+
+    def add(self, request_id: str, record: dict) -> _RequestRecords:
+        elapsed = record["elapsed"].total_seconds()
+        request_records = self._requests.get(request_id)
+        if request_records is None:
+            self._expire(elapsed)
+            request_records = self._requests[request_id] = _RequestRecords(started_on=elapsed)
+
+        dropped = request_records.dropped
+        self.records_count += request_records.append(record, elapsed)
+        self.dropped_records += request_records.dropped - dropped
+
+        while self.records_count > self.max_records and len(self._requests) > 1:
+            _, evicted = self._requests.popitem(last=False)
+            self.records_count -= len(evicted)
+            self.evicted_requests += 1
+        return request_records
+
+    def pop(self, request_id: str) -> Optional[_RequestRecords]:
+        request_records = self._requests.pop(request_id, None)
+        if request_records is not None:
+            self.records_count -= len(request_records)
+        return request_records
+
+    def _expire(self, elapsed: float):
+        while self._requests:
+            request_id, request_records = next(iter(self._requests.items()))
+            if elapsed - request_records.started_on < self.timeout:
+                break
+            self.pop(request_id)
+            self.expired_requests += 1
+
+    def stats(self) -> dict:
+        return {
+            "requests_in_progress": len(self._requests),
+            "records_kept": self.records_count,
+            "records_dropped": self.dropped_records,
+            "requests_expired": self.expired_requests,
+            "requests_evicted": self.evicted_requests,
+            "requests_persisted": self.persisted_requests,
+            "requests_unpersisted": self.unpersisted_requests,
+            "requests_sampled_slow": self.sampled_slow_requests
+        }
+
 
+_request_records = _RequestRecordsBuffer(
+    timeout=settings.request_logs_persist_record_timeout,
+    max_records=settings.request_logs_persist_max_records
+)
+
+
+def get_request_logs_stats() -> dict:
+    """Return the current stats (requests in progress, records kept & dropped...) of the request records"""
+    return _request_records.stats()
+
+
+def _to_serializable(value):
+    """Convert the given value into a JSON/BSON-serializable value. Unknown types are converted to str."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, dict):
+        return {str(k): _to_serializable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [_to_serializable(v) for v in value]
+    return str(value)
+
+
+def _serialize_exception(exception) -> Optional[dict]:
+    if exception is None:
+        return None
+    return {
+        "type": None if exception.type is None else exception.type.__name__,
+        "value": str(exception.value),
+        "traceback": bool(exception.traceback)
+    }
+
+
+def _serialize_record(record: dict) -> dict:
+    """Serialize a loguru record for persisting (same schema as the records serialized by loguru)"""
+    return {
+        "elapsed": {"repr": str(record["elapsed"]), "seconds": record["elapsed"].total_seconds()},
+        "exception": record["exception"],  # serialized when the record is received
+        "extra": _to_serializable(record["extra"]),
+        "file": {"name": record["file"].name, "path": record["file"].path},
+        "function": record["function"],
+        "level": {"icon": record["level"].icon, "name": record["level"].name, "no": record["level"].no},
+        "line": record["line"],
+        "message": record["message"],
+        "module": record["module"],
+        "name": record["name"],
+        "process": {"id": record["process"].id, "name": record["process"].name},
+        "thread": {"id": record["thread"].id, "name": record["thread"].name},
+        "time": {"repr": str(record["time"]), "timestamp": record["time"].timestamp()}
+    }
+
+
+def _request_record_sink(message):
+    """Sink for any Request record received. Records are kept as received (without serializing them) until the last
+    record of the request; then, if the request must be persisted, they are serialized and persisted on the event loop.
+    The sink must not log anything: it runs on the context of the request, so the records would come back to the sink.
+    """
+    record: dict = message.record
+    request_id = record["extra"]["request_id"]
+
+    if record["exception"] is not None:
+        # Serialize the exception right away, to avoid keeping the traceback (and its frames) alive
+        record = dict(record, exception=_serialize_exception(record["exception"]))
+
+    request_records = _request_records.add(request_id, record)
+
+    # If this was last request record, pop from buffer and persist if exceeds level or (sampled) if slow
+    if record["extra"].get("last_record"):
+        _request_records.pop(request_id)
+        if _must_persist(request_records):
+            loop = _get_persist_loop()
+            if loop is None:
+                # The records can only be buffered for persisting from an event loop (i.e. records after shutdown)
+                _request_records.unpersisted_requests += 1
+                contextvars.Context().run(
+                    logger.bind(logs_request_id=request_id).warning,
+                    "Request log records not persisted: no event loop running"
+                )
+                return
+
+            _request_records.persisted_requests += 1
+            # Run outside the request context (empty context), and from the loop (records may come from other threads)
+            loop.call_soon_threadsafe(
+                _persist_request_records, request_id, request_records,
+                context=contextvars.Context()
+            )
+
+
+def _must_persist(request_records: _RequestRecords) -> bool:
+    if request_records.max_level_no >= _persist_level_no:
+        return True
+
+    slow_seconds = settings.request_logs_persist_slow_seconds
+    if slow_seconds > 0 and request_records.duration >= slow_seconds:
+        if random.random() < settings.request_logs_persist_slow_sample_rate:
+            _request_records.sampled_slow_requests += 1
+            return True
+
+    return False
+
+
+def _persist_request_records(request_id: str, request_records: _RequestRecords):
     # noinspection PyBroadException
     try:
-        record = json.loads(record)["record"]
-        request_id = record["extra"]["request_id"]
-
-        with logger.contextualize(logs_request_id=request_id):
-            try:
-                _request_records[request_id].append(record)
-            except KeyError:
-                _request_records[request_id] = [record]
-
-            # If this was last request record, pop from cache and persist if exceeds level
-            if record["extra"].get("last_record"):
-                records = _request_records.pop(request_id)
-                logger.debug(f"Processing {len(records)} records for request")
-
-                if any(
-                        rec for rec in records
-                        if rec["level"]["no"] >= logger.level(settings.request_logs_persist_level.upper()).no
-                ):
-                    logger.debug(f"Inserting {len(records)} request log records on Mongo")
-                    result = await persist_records(request_id=request_id, records=records)
-                    assert result.acknowledged
-
-                else:
-                    logger.debug("No records must be persisted from this request")
+        records = [_serialize_record(record) for record in request_records.records]
+        logger.bind(logs_request_id=request_id).debug(
+            f"Buffering {len(records)} request log records for persisting on Mongo"
+        )
+        persist_records(
+            request_id=request_id,
+            records=records,
+            records_dropped=request_records.dropped,
+            duration=round(request_records.duration, 4)
+        )
 
     except Exception:
         logger.opt(exception=True).bind(logs_request_id=request_id).error(
-            "Could not insert request log records on Mongo"
+            "Could not persist request log records on Mongo"
         )
 
 
@@ -112,9 +327,8 @@ logger.add(
 # Request logger (persist)
 if settings.request_logs_persist_enabled:
     logger.add(
-        _request_record_handler,
+        _request_record_sink,
         level="TRACE",
         filter=_set_request_filter(is_request_logger=True),
-        enqueue=True,
-        serialize=True  # record provided as JSON string to the handler
+        format="{message}"  # the sink uses the record, not the formatted message
     )
@@ -6,14 +6,39 @@ Helpers to request the HTTP Persistence API
 import urllib.parse
 from typing import Optional
 
+# # Installed # #
+import httpx
+
 # # Project # #
 from vigobusbot.services.http import http_request as _http_request
-from vigobusbot.services.http import Methods, Response
+from vigobusbot.services.http import get_http_client, Methods, Response
+from vigobusbot.services.circuit_breaker import CircuitBreaker, get_circuit_breaker as _get_circuit_breaker
 from vigobusbot.settings_handler import persistence_settings as settings
 
 __all__ = ("http_request", "Methods")
 
 
+def get_client() -> httpx.AsyncClient:
+    return get_http_client(
+        name="persistence_api",
+        max_connections=settings.pool_max_connections,
+        max_keepalive_connections=settings.pool_max_keepalive_connections,
+        keepalive_expiry=settings.pool_keepalive_expiry
+    )
+
+
+def get_circuit_breaker() -> Optional[CircuitBreaker]:
+    if not settings.circuit_breaker_enabled:
+        return None
+    return _get_circuit_breaker(
+        name="persistence_api",
+        error_rate=settings.circuit_breaker_error_rate,
+        min_requests=settings.circuit_breaker_min_requests,
+        window=settings.circuit_breaker_window,
+        open_seconds=settings.circuit_breaker_open_seconds
+    )
+
+
 async def http_request(
         method, endpoint,
         query_params: Optional[dict] = None, body: Optional[dict] = None,
@@ -21,5 +46,6 @@ async def http_request(
 ) -> Response:
     url = urllib.parse.urljoin(settings.url, endpoint)
     return await _http_request(
-        method=method, url=url, query_params=query_params, body=body, timeout=timeout, retries=retries
+        method=method, url=url, query_params=query_params, body=body, timeout=timeout, retries=retries,
+        client=get_client(), circuit_breaker=get_circuit_breaker()
     )
@@ -0,0 +1,45 @@
+"""SAVED STOPS BACKENDS
+Backends where the Saved Stops are persisted, selected with the "backend" Persistence setting:
+- api: HTTP Persistence API
+- sqlite: embedded SQLite database file
+"""
+
+# # Native # #
+from typing import Optional
+
+# # Package # #
+from .base import *
+from .api_backend import *
+from .sqlite_backend import *
+
+# # Project # #
+from vigobusbot.settings_handler import persistence_settings as settings
+from vigobusbot.logger import logger
+
+__all__ = ("SavedStopsBackend", "APIBackend", "SQLiteBackend", "get_backend", "close_backend")
+
+_backend: Optional[SavedStopsBackend] = None
+
+
+def get_backend() -> SavedStopsBackend:
+    """Get the Saved Stops backend chosen on settings, or create it if not exists"""
+    global _backend
+    if _backend is None:
+        if settings.backend == "api":
+            _backend = APIBackend()
+        elif settings.backend == "sqlite":
+            _backend = SQLiteBackend(path=settings.sqlite_file)
+        else:
+            raise ValueError(f"Invalid Saved Stops backend \"{settings.backend}\"")
+
+        logger.bind(saved_stops_backend=_backend.name).debug("Created Saved Stops backend")
+    return _backend
+
+
+async def close_backend():
+    """Close the Saved Stops backend, if created. Must be called on shutdown."""
+    global _backend
+    if _backend is not None:
+        backend, _backend = _backend, None
+        await backend.close()
+        logger.bind(saved_stops_backend=backend.name).debug("Closed Saved Stops backend")
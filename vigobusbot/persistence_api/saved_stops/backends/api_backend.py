@@ -0,0 +1,67 @@
+"""SAVED STOPS BACKENDS - API
+Backend persisting the Saved Stops on the HTTP Persistence API
+"""
+
+# # Native # #
+from typing import Optional, List
+
+# # Installed # #
+import httpx
+
+# # Package # #
+from .base import SavedStopsBackend
+
+# # Project # #
+from vigobusbot.persistence_api.saved_stops.entities import SavedStopEncoded
+from vigobusbot.persistence_api.requester import http_request, Methods
+
+__all__ = ("APIBackend",)
+
+
+class APIBackend(SavedStopsBackend):
+    name = "api"
+
+    async def get_user_stops(self, encoded_user_id: str) -> List[SavedStopEncoded]:
+        result = await http_request(
+            method=Methods.GET,
+            endpoint=f"/stops/{encoded_user_id}"
+        )
+        return [SavedStopEncoded(**stop_json, user_id=encoded_user_id) for stop_json in result.json()]
+
+    async def get_stop(self, encoded_user_id: str, stop_id: int) -> Optional[SavedStopEncoded]:
+        try:
+            result = await http_request(
+                method=Methods.GET,
+                endpoint=f"/stops/{encoded_user_id}/{stop_id}"
+            )
+        except httpx.HTTPStatusError as error:
+            if error.response.status_code == 404:
+                return None
+            raise error
+
+        return SavedStopEncoded(**result.json(), user_id=encoded_user_id)
+
+    async def save_stop(self, encoded_stop: SavedStopEncoded):
+        await http_request(
+            method=Methods.POST,
+            endpoint="/stops",
+            body=encoded_stop.dict()
+        )
+
+    async def delete_stop(self, encoded_user_id: str, stop_id: int) -> bool:
+        try:
+            await http_request(
+                method=Methods.DELETE,
+                endpoint=f"/stops/{encoded_user_id}/{stop_id}"
+            )
+            return True
+        except httpx.HTTPStatusError as error:
+            if error.response.status_code != 404:
+                raise error
+            return False
+
+    async def delete_all_stops(self, encoded_user_id: str):
+        await http_request(
+            method=Methods.DELETE,
+            endpoint=f"/stops/{encoded_user_id}"
+        )
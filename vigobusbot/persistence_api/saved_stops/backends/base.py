@@ -0,0 +1,42 @@
+"""SAVED STOPS BACKENDS - BASE
+Base class for the backends where the Saved Stops are persisted.
+Backends only handle encoded data (user IDs and Stop names are encoded/decoded by the Saved Stops manager).
+"""
+
+# # Native # #
+import abc
+from typing import Optional, List
+
+# # Project # #
+from vigobusbot.persistence_api.saved_stops.entities import SavedStopEncoded
+
+__all__ = ("SavedStopsBackend",)
+
+
+class SavedStopsBackend(abc.ABC):
+    """Backends must implement all the abstract methods; incomplete backends can not be created"""
+    name = "base"
+
+    @abc.abstractmethod
+    async def get_user_stops(self, encoded_user_id: str) -> List[SavedStopEncoded]:
+        """Get all the Saved Stops of the user (empty if none saved)"""
+
+    @abc.abstractmethod
+    async def get_stop(self, encoded_user_id: str, stop_id: int) -> Optional[SavedStopEncoded]:
+        """Get a single Saved Stop of the user, or None if not saved"""
+
+    @abc.abstractmethod
+    async def save_stop(self, encoded_stop: SavedStopEncoded):
+        """Save or update a Saved Stop"""
+
+    @abc.abstractmethod
+    async def delete_stop(self, encoded_user_id: str, stop_id: int) -> bool:
+        """Delete a Saved Stop of the user. Return True if deleted, False if it was not saved"""
+
+    @abc.abstractmethod
+    async def delete_all_stops(self, encoded_user_id: str):
+        """Delete all the Saved Stops of the user"""
+
+    async def close(self):
+        """Release the resources used by the backend (connections...). Must be called on shutdown."""
+        pass
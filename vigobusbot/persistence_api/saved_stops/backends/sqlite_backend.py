@@ -0,0 +1,95 @@
+"""SAVED STOPS BACKENDS - SQLITE
+Backend persisting the Saved Stops on an embedded SQLite database file, for single-node deployments without the
+Persistence API. Data is stored encoded, as on the Persistence API, so it can be migrated between both backends.
+The database runs in WAL mode, and all the queries run on a single background thread, out of the event loop.
+"""
+
+# # Native # #
+import asyncio
+import sqlite3
+import concurrent.futures
+from typing import Optional, List, Tuple
+
+# # Package # #
+from .base import SavedStopsBackend
+
+# # Project # #
+from vigobusbot.persistence_api.saved_stops.entities import SavedStopEncoded
+from vigobusbot.logger import logger
+
+__all__ = ("SQLiteBackend",)
+
+
+class SQLiteBackend(SavedStopsBackend):
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="saved_stops_sqlite")
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Get the database connection, or open it (and create the schema) if not opened yet.
+        Must run on the executor thread."""
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS saved_stops ("
+                "user_id TEXT NOT NULL, stop_id INTEGER NOT NULL, stop_name TEXT, PRIMARY KEY (user_id, stop_id))"
+            )
+            self._connection = connection
+            logger.bind(saved_stops_sqlite_file=self.path).debug("Opened Saved Stops SQLite database")
+        return self._connection
+
+    async def _execute(self, query: str, *params) -> Tuple[List[tuple], int]:
+        """Execute the query on the executor thread and return the (fetched rows, affected rows count)"""
+        def _run():
+            cursor = self._get_connection().execute(query, params)
+            return cursor.fetchall(), cursor.rowcount
+        return await asyncio.get_running_loop().run_in_executor(self._executor, _run)
+
+    async def get_user_stops(self, encoded_user_id: str) -> List[SavedStopEncoded]:
+        rows, _ = await self._execute(
+            "SELECT stop_id, stop_name FROM saved_stops WHERE user_id = ?",
+            encoded_user_id
+        )
+        return [
+            SavedStopEncoded(user_id=encoded_user_id, stop_id=stop_id, stop_name=stop_name)
+            for stop_id, stop_name in rows
+        ]
+
+    async def get_stop(self, encoded_user_id: str, stop_id: int) -> Optional[SavedStopEncoded]:
+        rows, _ = await self._execute(
+            "SELECT stop_name FROM saved_stops WHERE user_id = ? AND stop_id = ?",
+            encoded_user_id, stop_id
+        )
+        if rows:
+            return SavedStopEncoded(user_id=encoded_user_id, stop_id=stop_id, stop_name=rows[0][0])
+
+    async def save_stop(self, encoded_stop: SavedStopEncoded):
+        await self._execute(
+            "INSERT INTO saved_stops (user_id, stop_id, stop_name) VALUES (?, ?, ?) "
+            "ON CONFLICT (user_id, stop_id) DO UPDATE SET stop_name = excluded.stop_name",
+            encoded_stop.user_id, encoded_stop.stop_id, encoded_stop.stop_name
+        )
+
+    async def delete_stop(self, encoded_user_id: str, stop_id: int) -> bool:
+        _, affected_rows = await self._execute(
+            "DELETE FROM saved_stops WHERE user_id = ? AND stop_id = ?",
+            encoded_user_id, stop_id
+        )
+        return affected_rows > 0
+
+    async def delete_all_stops(self, encoded_user_id: str):
+        await self._execute("DELETE FROM saved_stops WHERE user_id = ?", encoded_user_id)
+
+    async def close(self):
+        def _close():
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+        await asyncio.get_running_loop().run_in_executor(self._executor, _close)
+        self._executor.shutdown()
@@ -1,47 +1,134 @@
 """SAVED STOPS MANAGER
-Functions to interact with the Persistence API and read, save or delete Saved Stops.
+Functions to read, save or delete Saved Stops, persisted on the backend chosen on settings (Persistence API or SQLite).
 The persisted stop data is encoded/decoded as following:
 - User ID encoded using encode_user_id() -> str
 - Stop ID saved as raw -> int
 - Stop Name encoded/decoded on encode_stop()/decode_stop()
+The decoded Saved Stops of each user are cached locally, and updated on every write, so reads after writes are
+consistent without requesting the API again.
 """
 
 # # Native # #
 import contextlib
-from typing import Optional
+from typing import Optional, Dict
+
+# # Installed # #
+import cachetools
 
 # # Package # #
-from vigobusbot.persistence_api.saved_stops.entities import SavedStop, SavedStops, SavedStopEncoded
+from vigobusbot.persistence_api.saved_stops.entities import SavedStop, SavedStops
 from vigobusbot.persistence_api.saved_stops.services import *
+from vigobusbot.persistence_api.saved_stops.backends import get_backend
 
 # # Project # #
-from vigobusbot.persistence_api.requester import http_request, Methods
+from vigobusbot.settings_handler import persistence_settings as settings
 from vigobusbot.logger import logger
 
 __all__ = ("get_user_saved_stops", "get_stop", "save_stop", "delete_stop", "is_stop_saved", "delete_all_stops")
 
+_saved_stops_cache = cachetools.TTLCache(
+    maxsize=settings.saved_stops_cache_size,
+    ttl=settings.saved_stops_cache_ttl
+) if settings.saved_stops_cache_size > 0 and settings.saved_stops_cache_ttl > 0 else None
+"""Local cache for the decoded Saved Stops of the users (None if disabled)
+Key=user_id
+Value=Dict[stop_id, SavedStop]
+"""
+_cacheable_reads: Dict[int, object] = dict()
+"""Reads of Saved Stops in progress, by user. Writes remove the read of the user, so the read result
+(which might not include the write) is not cached.
+Key=user_id
+Value=unique token of the read
+"""
+
+
+def _get_cached_user_saved_stops(user_id: int) -> Optional[Dict[int, SavedStop]]:
+    if _saved_stops_cache is not None:
+        return _saved_stops_cache.get(user_id)
+
+
+def _set_cached_user_saved_stops(user_id: int, saved_stops: SavedStops):
+    if _saved_stops_cache is not None:
+        _saved_stops_cache[user_id] = {saved_stop.stop_id: saved_stop.copy() for saved_stop in saved_stops}
+
+
+def _invalidate_cached_user_saved_stops(user_id: int):
+    """Remove the Saved Stops of the user from the cache (when the result of a write is unknown)"""
+    _cacheable_reads.pop(user_id, None)
+    if _saved_stops_cache is not None:
+        _saved_stops_cache.pop(user_id, None)
+
+
+@contextlib.contextmanager
+def _invalidate_cache_on_error(user_id: int):
+    """Invalidate the cached Saved Stops of the user if the write does not finish cleanly (failed or cancelled),
+    since the backend could have applied it anyway."""
+    finished = False
+    try:
+        yield
+        finished = True
+    finally:
+        if not finished:
+            _invalidate_cached_user_saved_stops(user_id)
+
+
+def _update_cached_user_saved_stops(user_id: int, stop_id: int, saved_stop: Optional[SavedStop]):
+    """Update a Saved Stop (or remove it, if saved_stop is None) for the user on the cache, if the user is cached.
+    """
+    _cacheable_reads.pop(user_id, None)
+    cached_stops = _get_cached_user_saved_stops(user_id)
+    if cached_stops is None:
+        return
+
+    if saved_stop is None:
+        cached_stops.pop(stop_id, None)
+    else:
+        cached_stops[stop_id] = saved_stop.copy()
+
 
 async def get_user_saved_stops(user_id: int) -> SavedStops:
+    cached_stops = _get_cached_user_saved_stops(user_id)
+    if cached_stops is not None:
+        logger.debug(f"Read {len(cached_stops)} Saved Stops of user from cache")
+        return [saved_stop.copy() for saved_stop in cached_stops.values()]
+
     logger.debug("Getting Saved Stops of user")
     encoded_user_id = encode_user_id(user_id)
+    read_token = _cacheable_reads[user_id] = object()
 
-    result = await http_request(
-        method=Methods.GET,
-        endpoint=f"/stops/{encoded_user_id}"
-    )
-    stops_json = result.json()
-    logger.debug(f"Read {len(stops_json)} Saved Stops")
+    try:
+        encoded_stops = await get_backend().get_user_stops(encoded_user_id)
+        logger.debug(f"Read {len(encoded_stops)} Saved Stops")
 
-    return [
-        decode_stop(encoded_stop=SavedStopEncoded(**stop_json, user_id=str(user_id)), user_id=user_id)
-        for stop_json in stops_json
-    ]
+        saved_stops = [decode_stop(encoded_stop=encoded_stop, user_id=user_id) for encoded_stop in encoded_stops]
+
+        if _cacheable_reads.get(user_id) is read_token:
+            _set_cached_user_saved_stops(user_id, saved_stops)
+        return saved_stops
+
+    finally:
+        if _cacheable_reads.get(user_id) is read_token:
+            _cacheable_reads.pop(user_id)
 
 
 async def get_stop(user_id: int, stop_id: int) -> Optional[SavedStop]:
-    saved_stops = await get_user_saved_stops(user_id)
-    with contextlib.suppress(StopIteration):
-        return next(saved_stop for saved_stop in saved_stops if saved_stop.stop_id == stop_id)
+    """Get a single Saved Stop of the user, or None if the user has not saved the Stop.
+    Read from the cached Saved Stops of the user if available, otherwise read the single Stop from the backend.
+    """
+    cached_stops = _get_cached_user_saved_stops(user_id)
+    if cached_stops is not None:
+        saved_stop = cached_stops.get(stop_id)
+        return saved_stop.copy() if saved_stop else None
+
+    logger.debug("Getting Saved Stop of user")
+    encoded_user_id = encode_user_id(user_id)
+
+    encoded_stop = await get_backend().get_stop(encoded_user_id=encoded_user_id, stop_id=stop_id)
+    if encoded_stop is None:
+        logger.debug("Saved Stop not found")
+        return None
+
+    return decode_stop(encoded_stop=encoded_stop, user_id=user_id)
 
 
 async def is_stop_saved(user_id: int, stop_id: int) -> bool:
@@ -49,7 +136,9 @@ async def is_stop_saved(user_id: int, stop_id: int) -> bool:
     return bool(saved_stop)
 
 
-async def save_stop(user_id: int, stop_id: int, stop_name: Optional[str] = None):
+async def save_stop(user_id: int, stop_id: int, stop_name: Optional[str] = None) -> SavedStop:
+    """Save or update a Stop of the user. Return the Saved Stop as persisted.
+    """
     logger.debug("Saving/Updating Stop")
     stop = SavedStop(
         user_id=user_id,
@@ -58,31 +147,34 @@ async def save_stop(user_id: int, stop_id: int, stop_name: Optional[str] = None)
     )
     stop_encoded = encode_stop(raw_stop=stop, user_id=user_id)
 
-    await http_request(
-        method=Methods.POST,
-        endpoint="/stops",
-        body=stop_encoded.dict()
-    )
+    with _invalidate_cache_on_error(user_id):
+        await get_backend().save_stop(stop_encoded)
+    _update_cached_user_saved_stops(user_id=user_id, stop_id=stop_id, saved_stop=stop)
     logger.debug(f"Saved/Updated Stop")
+    return stop
 
 
-async def delete_stop(user_id: int, stop_id: int):
+async def delete_stop(user_id: int, stop_id: int) -> bool:
+    """Delete a Saved Stop of the user. After this, the Stop is not saved, even if it was not saved before.
+    Return True if the Stop was deleted, False if it was not saved.
+    """
     logger.debug("Deleting Saved Stop of user")
     encoded_user_id = encode_user_id(user_id)
 
-    await http_request(
-        method=Methods.DELETE,
-        endpoint=f"/stops/{encoded_user_id}/{stop_id}"
-    )
-    logger.debug("Deleted Saved Stop")
+    with _invalidate_cache_on_error(user_id):
+        deleted = await get_backend().delete_stop(encoded_user_id=encoded_user_id, stop_id=stop_id)
+
+    _update_cached_user_saved_stops(user_id=user_id, stop_id=stop_id, saved_stop=None)
+    logger.debug("Deleted Saved Stop" if deleted else "Saved Stop to delete not found")
+    return deleted
 
 
 async def delete_all_stops(user_id: int):
     logger.debug("Deleting ALL Saved Stops of user")
     encoded_user_id = encode_user_id(user_id)
 
-    await http_request(
-        method=Methods.DELETE,
-        endpoint=f"/stops/{encoded_user_id}"
-    )
+    with _invalidate_cache_on_error(user_id):
+        await get_backend().delete_all_stops(encoded_user_id)
+    _cacheable_reads.pop(user_id, None)
+    _set_cached_user_saved_stops(user_id, [])
     logger.debug(f"Deleted ALL Saved Stops")
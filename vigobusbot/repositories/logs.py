@@ -1,19 +1,31 @@
 """LOGS Repository
-Repository for Log persistence
+Repository for Log persistence.
+Request log records are not inserted right away: they are buffered in memory and flushed in batches (insert_many),
+when enough documents are buffered or periodically. The buffer has a bounded size (in bytes); when Mongo falls behind
+and the buffer is full, the oldest documents are dropped.
 """
 
 # # Native # #
 import asyncio
-from typing import List
+import contextvars
+import collections
+from typing import List, Deque, Optional
 
 # # Installed # #
+import bson
+import pymongo.errors
+from bson.raw_bson import RawBSONDocument
 from pydantic import BaseModel, Field
+# loguru logger imported directly, since vigobusbot.logger depends on this module
+from loguru import logger
 
 # # Project # #
 from vigobusbot.services.mongo import get_logs_collection
+from vigobusbot.settings_handler import system_settings as settings
+from vigobusbot.settings_handler import mongo_settings
 from vigobusbot.utils import *
 
-__all__ = ("persist_records",)
+__all__ = ("persist_records", "flush_records", "get_logs_writer_stats")
 
 
 class RequestLogRecords(BaseModel):
@@ -21,6 +33,10 @@ class RequestLogRecords(BaseModel):
     # TODO Move to another location if possible
     request_id: str
     records: List[dict]
+    records_dropped: int = 0
+    """Records not persisted (from the middle of the request), due to the per-request records limit"""
+    duration: Optional[float] = None
+    """Time (seconds) between the first and last records of the request"""
     timestamp: int = Field(default_factory=get_time)
 
     def dict(self, **kwargs):
@@ -29,7 +45,212 @@ class RequestLogRecords(BaseModel):
         return d
 
 
-async def persist_records(request_id: str, records: List[dict]):
-    """Persist an array of records, identified by an unique request_id"""
-    records_obj = RequestLogRecords(request_id=request_id, records=records)
-    return await get_logs_collection(asyncio.get_event_loop()).insert_one(records_obj.dict())
+class LogsWriterStats:
+    def __init__(self):
+        self.flushed_documents = 0
+        self.flushed_batches = 0
+        self.dropped_documents = 0
+        self.failed_documents = 0
+        self.flush_errors = 0
+
+    def dict(self) -> dict:
+        return {
+            "flushed_documents": self.flushed_documents,
+            "flushed_batches": self.flushed_batches,
+            "dropped_documents": self.dropped_documents,
+            "failed_documents": self.failed_documents,
+            "flush_errors": self.flush_errors
+        }
+
+
+class BufferedLogsWriter:
+    """Buffer for log documents, flushed in batches on a background task (started on the first document buffered).
+    Documents are encoded to BSON when buffered, to account their size and avoid encoding them again on insert.
+    Batches that fail to insert due to errors on Mongo are buffered again, to retry them on the next flush.
+    """
+
+    def __init__(self, max_bytes: int, batch_size: int, flush_interval: float):
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats = LogsWriterStats()
+        self._buffer: Deque[RawBSONDocument] = collections.deque()
+        self._buffer_bytes = 0
+        self._batch_ready: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._closing = False
+        self._dropped_unreported = 0
+        """Documents dropped since the last warning about it (reported on flush, to avoid one warning per drop)"""
+
+    @property
+    def buffered_documents(self) -> int:
+        return len(self._buffer)
+
+    @property
+    def buffered_bytes(self) -> int:
+        return self._buffer_bytes
+
+    def write(self, document: dict):
+        """Buffer a document for inserting it on the next flush. Must be called from the event loop."""
+        self._push(RawBSONDocument(bson.encode(document)), left=False)
+
+        if self._worker is None or self._worker.done():
+            self._batch_ready = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            # Start the worker on an empty context, so it does not inherit the context of the current record
+            self._worker = contextvars.Context().run(asyncio.create_task, self._flush_worker())
+        if len(self._buffer) >= self.batch_size:
+            self._batch_ready.set()
+
+    def _push(self, document: RawBSONDocument, left: bool):
+        size = len(document.raw)
+        if size > self.max_bytes:
+            self._drop(1)
+            return
+
+        if left:
+            self._buffer.appendleft(document)
+        else:
+            self._buffer.append(document)
+        self._buffer_bytes += size
+
+        # Drop oldest documents until the buffer fits the budget
+        dropped = 0
+        while self._buffer_bytes > self.max_bytes:
+            self._buffer_bytes -= len(self._buffer.popleft().raw)
+            dropped += 1
+
+        if dropped:
+            self._drop(dropped)
+
+    def _drop(self, count: int):
+        self.stats.dropped_documents += count
+        self._dropped_unreported += count
+
+    def _report_dropped(self):
+        if self._dropped_unreported:
+            logger.bind(
+                dropped_documents=self._dropped_unreported,
+                dropped_documents_total=self.stats.dropped_documents
+            ).warning("Log documents dropped since the last flush, the buffer was full")
+            self._dropped_unreported = 0
+
+    def _pop_batch(self) -> List[RawBSONDocument]:
+        batch = list()
+        while self._buffer and len(batch) < self.batch_size:
+            document = self._buffer.popleft()
+            self._buffer_bytes -= len(document.raw)
+            batch.append(document)
+        return batch
+
+    async def flush(self, retry_failed: bool = True) -> bool:
+        """Insert all the buffered documents (in batches). If retry_failed, batches failed due to errors on Mongo are
+        buffered again and the flush stops; otherwise, they are discarded. Return False if any batch failed."""
+        if self._flush_lock is None:
+            return True
+        succeeded = True
+
+        async with self._flush_lock:
+            self._report_dropped()
+            while self._buffer:
+                batch = self._pop_batch()
+                if await self._insert_batch(batch):
+                    continue
+
+                succeeded = False
+                if not retry_failed:
+                    self.stats.failed_documents += len(batch)
+                    continue
+
+                # Push back (in the original order) for retrying later
+                for document in reversed(batch):
+                    self._push(document, left=True)
+                break
+
+        return succeeded
+
+    async def _insert_batch(self, batch: List[RawBSONDocument]) -> bool:
+        """Insert a batch of documents. Return False if the batch could not be inserted, and must be retried."""
+        documents = batch
+        if mongo_settings.mock:
+            # The stand-in Mongo client does not support raw BSON documents
+            documents = [bson.decode(document.raw) for document in batch]
+
+        # noinspection PyBroadException
+        try:
+            await get_logs_collection().insert_many(documents, ordered=False)
+            self.stats.flushed_documents += len(batch)
+            self.stats.flushed_batches += 1
+            logger.debug(f"Inserted {len(batch)} log documents on Mongo")
+            return True
+
+        except pymongo.errors.BulkWriteError as error:
+            # Some documents were rejected by Mongo (i.e. duplicated); they would be rejected again if retried
+            inserted = error.details.get("nInserted", 0)
+            self.stats.flushed_documents += inserted
+            self.stats.failed_documents += len(batch) - inserted
+            self.stats.flushed_batches += 1
+            logger.bind(write_errors=error.details.get("writeErrors")).error(
+                f"{len(batch) - inserted} log documents rejected by Mongo"
+            )
+            return True
+
+        except Exception:
+            self.stats.flush_errors += 1
+            logger.opt(exception=True).error(f"Could not insert {len(batch)} log documents on Mongo")
+            return False
+
+    async def _flush_worker(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self._batch_ready.clear()
+            if not await self.flush() and not self._closing:
+                # Mongo is failing: wait a full interval before retrying, even if new batches are ready
+                await asyncio.sleep(self.flush_interval)
+
+    async def close(self):
+        """Stop the background flushing, and flush the remaining documents (once). Must be called on shutdown."""
+        if self._worker is not None:
+            # Let the worker finish its current flush, so the batch being inserted is not lost
+            self._closing = True
+            self._batch_ready.set()
+            await self._worker
+            self._worker = None
+            self._closing = False
+
+        await self.flush(retry_failed=False)
+
+
+_writer = BufferedLogsWriter(
+    max_bytes=settings.request_logs_persist_buffer_max_bytes,
+    batch_size=settings.request_logs_persist_batch_size,
+    flush_interval=settings.request_logs_persist_flush_interval
+)
+
+
+def persist_records(request_id: str, records: List[dict], records_dropped: int = 0, duration: Optional[float] = None):
+    """Persist an array of records, identified by an unique request_id.
+    Records are buffered and inserted on background, in batches."""
+    records_obj = RequestLogRecords(
+        request_id=request_id, records=records, records_dropped=records_dropped, duration=duration
+    )
+    _writer.write(records_obj.dict())
+
+
+async def flush_records():
+    """Flush the buffered records and stop the background writer. Must be called on shutdown."""
+    await _writer.close()
+
+
+def get_logs_writer_stats() -> dict:
+    """Return the current stats (flushed, dropped documents...) of the buffered log writer"""
+    return dict(
+        **_writer.stats.dict(),
+        buffered_documents=_writer.buffered_documents,
+        buffered_bytes=_writer.buffered_bytes
+    )
@@ -0,0 +1,191 @@
+"""CACHE SERVICE
+Local caches for values fetched with async functions, with TTL expiration, optional refresh-ahead, optional serving of
+stale values when the loader fails, and hit/miss stats
+"""
+
+# # Native # #
+import time
+import asyncio
+from typing import Callable, Awaitable, Dict, Hashable, Any, Set, Tuple, Type, Optional
+
+# # Installed # #
+import cachetools
+
+# # Project # #
+from vigobusbot.exceptions import BusBotException
+from vigobusbot.services.metrics import Counter, Gauge
+from vigobusbot.services.deadline import without_deadline
+from vigobusbot.logger import logger
+
+__all__ = ("AsyncCache", "CacheStats", "get_caches_stats")
+
+Loader = Callable[[], Awaitable[Any]]
+StaleMapper = Callable[[Any, float], Any]
+"""Function that receives a stale value and the time (time.time) it was loaded on, returning the value to serve"""
+
+_caches: Dict[str, "AsyncCache"] = dict()
+"""Storage for all the AsyncCache instances created, to expose their stats.
+Key=cache name
+Value=AsyncCache
+"""
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.stale_served = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0
+
+    def dict(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hit_ratio, 4),
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "stale_served": self.stale_served
+        }
+
+
+class _CacheEntry:
+    __slots__ = ("value", "loaded_on", "loaded_on_time")
+
+    def __init__(self, value: Any):
+        self.value = value
+        self.loaded_on = time.monotonic()
+        self.loaded_on_time = time.time()
+
+
+class AsyncCache:
+    """Cache for values loaded by async functions (loaders). Entries expire after the TTL.
+    If refresh_ahead > 0, entries read during the last refresh_ahead seconds of their TTL are reloaded on background,
+    so frequently read entries never expire while still being refreshed periodically.
+    If stale_ttl > 0, expired entries are kept for stale_ttl more seconds; if loading them again fails with any of the
+    stale_on exceptions (i.e. the upstream is unavailable), the stale value is served, passed through the stale_mapper
+    (if any; i.e. for marking the value as outdated).
+    If ttl <= 0, the cache is disabled and the loader is always called.
+    """
+
+    def __init__(
+            self, name: str, ttl: float, maxsize: float = float("inf"), refresh_ahead: float = 0,
+            stale_ttl: float = 0, stale_on: Tuple[Type[BaseException], ...] = (),
+            stale_mapper: Optional[StaleMapper] = None
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.stale_ttl = max(0.0, stale_ttl)
+        self.stale_on = stale_on
+        self.stale_mapper = stale_mapper
+        self.stats = CacheStats()
+        self._entries = cachetools.TTLCache(maxsize=maxsize, ttl=ttl + self.stale_ttl) if ttl > 0 else None
+        self._refreshing: Set[Hashable] = set()
+        _caches[name] = self
+
+    @property
+    def enabled(self) -> bool:
+        return self._entries is not None
+
+    def __len__(self):
+        """Return the amount of entries stored (including stale entries)"""
+        return len(self._entries) if self.enabled else 0
+
+    async def get(self, key: Hashable, loader: Loader) -> Any:
+        """Get the value for the given key from the cache. If not cached or expired, load it using the given loader
+        (an async function without arguments), and store the value on the cache.
+        """
+        if not self.enabled:
+            return await loader()
+
+        entry: _CacheEntry = self._entries.get(key)
+        age = time.monotonic() - entry.loaded_on if entry is not None else None
+        if entry is not None and age < self.ttl:
+            self.stats.hits += 1
+            if self.refresh_ahead > 0 and age >= self.ttl - self.refresh_ahead:
+                self._refresh_background(key, loader)
+            return entry.value
+
+        self.stats.misses += 1
+        try:
+            value = await loader()
+        except self.stale_on:
+            if entry is None:
+                raise
+
+            self.stats.stale_served += 1
+            logger.opt(exception=True).bind(cache_name=self.name, cache_key=key, cache_entry_age=round(age, 2)).info(
+                "Could not load cache entry, serving stale value"
+            )
+            if self.stale_mapper is not None:
+                return self.stale_mapper(entry.value, entry.loaded_on_time)
+            return entry.value
+
+        self.set(key, value)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        if self.enabled:
+            self._entries[key] = _CacheEntry(value)
+
+    def pop(self, key: Hashable):
+        if self.enabled:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        if self.enabled:
+            self._entries.clear()
+
+    def _refresh_background(self, key: Hashable, loader: Loader):
+        if key in self._refreshing:
+            return
+
+        self._refreshing.add(key)
+        # The refresh is not bound to the deadline of the request that triggered it
+        with without_deadline():
+            # noinspection PyAsyncCall
+            asyncio.create_task(self._refresh(key, loader))
+
+    async def _refresh(self, key: Hashable, loader: Loader):
+        # noinspection PyBroadException
+        try:
+            self.set(key, await loader())
+            self.stats.refreshes += 1
+            logger.bind(cache_name=self.name, cache_key=key).debug("Cache entry refreshed on background")
+
+        except (Exception, BusBotException):
+            self.stats.refresh_errors += 1
+            logger.opt(exception=True).bind(cache_name=self.name, cache_key=key).warning(
+                "Cache entry could not be refreshed on background"
+            )
+
+        finally:
+            self._refreshing.discard(key)
+
+
+def get_caches_stats() -> Dict[str, dict]:
+    """Return the current stats (hits, misses, refreshes...) of all the caches, by cache name"""
+    return {name: dict(**cache.stats.dict(), size=len(cache)) for name, cache in _caches.items()}
+
+
+Counter("vigobusbot_cache_hits_total", "Cache hits", labels=("cache",)).set_function(
+    lambda: {(name,): cache.stats.hits for name, cache in _caches.items()}
+)
+Counter("vigobusbot_cache_misses_total", "Cache misses", labels=("cache",)).set_function(
+    lambda: {(name,): cache.stats.misses for name, cache in _caches.items()}
+)
+Gauge("vigobusbot_cache_hit_ratio", "Cache hit ratio (0~1) since start", labels=("cache",)).set_function(
+    lambda: {(name,): cache.stats.hit_ratio for name, cache in _caches.items()}
+)
+Gauge("vigobusbot_cache_size", "Entries stored on the cache", labels=("cache",)).set_function(
+    lambda: {(name,): len(cache) for name, cache in _caches.items()}
+)
+Counter("vigobusbot_cache_stale_total", "Stale values served (loading failed)", labels=("cache",)).set_function(
+    lambda: {(name,): cache.stats.stale_served for name, cache in _caches.items()}
+)
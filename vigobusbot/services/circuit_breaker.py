@@ -0,0 +1,162 @@
+"""CIRCUIT BREAKER SERVICE
+Circuit breakers for upstream services. When the error rate of the requests to an upstream exceeds a threshold within
+a time window, the circuit opens and further requests fail fast (without waiting through timeouts and retries), giving
+the upstream time to recover. After some time, the circuit turns half-open and lets a probe request through: if it
+succeeds, the circuit closes again; otherwise, it opens again.
+"""
+
+# # Native # #
+import time
+import collections
+from typing import Dict, Deque, Optional, List
+
+# # Project # #
+from vigobusbot.exceptions import CircuitOpen
+from vigobusbot.services.metrics import Counter, Gauge
+from vigobusbot.logger import logger
+
+__all__ = ("CircuitBreaker", "CircuitOpen", "get_circuit_breaker", "get_circuit_breakers_stats")
+
+_circuit_breakers: Dict[str, "CircuitBreaker"] = dict()
+"""Storage for the circuit breakers, one per upstream.
+Key=circuit breaker (upstream) name
+Value=CircuitBreaker
+"""
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+            self, name: str, error_rate: float, min_requests: int, window: float, open_seconds: float,
+            half_open_max_requests: int = 1
+    ):
+        """
+        :param error_rate: ratio (0~1) of failed requests within the window that opens the circuit
+        :param min_requests: minimum requests within the window for the error rate to be considered
+        :param window: time window (seconds) for computing the error rate
+        :param open_seconds: time (seconds) the circuit stays open until letting probe requests through
+        :param half_open_max_requests: probe requests allowed at the same time while half-open
+        """
+        self.name = name
+        self.error_rate = error_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.open_seconds = open_seconds
+        self.half_open_max_requests = half_open_max_requests
+        self.rejected_requests = 0
+        self.opened_count = 0
+        self._state = self.CLOSED
+        self._opened_on = 0.0
+        self._probes = 0
+        self._buckets: Deque[List] = collections.deque()
+        """Requests results within the window, by second: [second, successes, failures]"""
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_on >= self.open_seconds:
+            self._set_state(self.HALF_OPEN)
+        return self._state
+
+    def allow_request(self) -> bool:
+        """Return True if a request can be performed. If True, the result must be reported with record()."""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and self._probes < self.half_open_max_requests:
+            self._probes += 1
+            return True
+
+        self.rejected_requests += 1
+        return False
+
+    def record(self, success: Optional[bool]):
+        """Report the result of a request allowed by allow_request().
+        If success is None (i.e. the request was cancelled), the request is not accounted."""
+        if self._state == self.HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+            if success is True:
+                self._set_state(self.CLOSED)
+            elif success is False:
+                self._open()
+            return
+
+        if success is None or self._state != self.CLOSED:
+            return
+
+        now = int(time.monotonic())
+        if not self._buckets or self._buckets[-1][0] != now:
+            self._buckets.append([now, 0, 0])
+        self._buckets[-1][1 if success else 2] += 1
+
+        if not success:
+            successes, failures = self._get_window_counts()
+            total = successes + failures
+            if total >= self.min_requests and failures / total >= self.error_rate:
+                self._open()
+
+    def _get_window_counts(self):
+        oldest = time.monotonic() - self.window
+        while self._buckets and self._buckets[0][0] < oldest:
+            self._buckets.popleft()
+        return sum(bucket[1] for bucket in self._buckets), sum(bucket[2] for bucket in self._buckets)
+
+    def _open(self):
+        self._opened_on = time.monotonic()
+        self.opened_count += 1
+        self._set_state(self.OPEN)
+
+    def _set_state(self, state: str):
+        if state == self._state:
+            return
+
+        self._state = state
+        self._probes = 0
+        self._buckets.clear()
+        log = logger.bind(circuit_breaker_name=self.name, circuit_breaker_state=state)
+        if state == self.OPEN:
+            log.warning("Circuit breaker opened, requests will fail fast")
+        else:
+            log.info(f"Circuit breaker {state.replace('_', '-')}")
+
+    def dict(self) -> dict:
+        return {
+            "state": self.state,
+            "opened_count": self.opened_count,
+            "rejected_requests": self.rejected_requests
+        }
+
+
+def get_circuit_breaker(
+        name: str, error_rate: float, min_requests: int, window: float, open_seconds: float
+) -> CircuitBreaker:
+    """Get the circuit breaker with the given name, or create it if not exists.
+    The parameters are only applied when the circuit breaker is created."""
+    try:
+        return _circuit_breakers[name]
+    except KeyError:
+        circuit_breaker = _circuit_breakers[name] = CircuitBreaker(
+            name=name, error_rate=error_rate, min_requests=min_requests, window=window, open_seconds=open_seconds
+        )
+        return circuit_breaker
+
+
+def get_circuit_breakers_stats() -> Dict[str, dict]:
+    """Return the current stats (state, rejected requests...) of all the circuit breakers, by name"""
+    return {name: circuit_breaker.dict() for name, circuit_breaker in _circuit_breakers.items()}
+
+
+_STATES_VALUES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.OPEN: 1, CircuitBreaker.HALF_OPEN: 2}
+
+Gauge(
+    "vigobusbot_circuit_breaker_state",
+    "State of the circuit breaker of each upstream (0=closed, 1=open, 2=half-open)",
+    labels=("upstream",)
+).set_function(lambda: {(name,): _STATES_VALUES[cb.state] for name, cb in _circuit_breakers.items()})
+Counter(
+    "vigobusbot_circuit_breaker_rejected_requests_total",
+    "Requests to upstreams rejected (failed fast) by their circuit breaker",
+    labels=("upstream",)
+).set_function(lambda: {(name,): cb.rejected_requests for name, cb in _circuit_breakers.items()})
@@ -0,0 +1,65 @@
+"""DEADLINE SERVICE
+Deadlines for processing requests, propagated through the context (contextvars) to the operations performed while
+processing them (i.e. HTTP requests to upstream services, which use the remaining time as their maximum timeout).
+"""
+
+# # Native # #
+import time
+import contextlib
+import contextvars
+from typing import Optional
+
+# # Project # #
+from vigobusbot.exceptions import DeadlineExceeded
+
+__all__ = ("deadline", "without_deadline", "get_remaining_time", "check_deadline")
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+"""Deadline (time.monotonic) of the current context, if any"""
+
+
+@contextlib.contextmanager
+def deadline(seconds: Optional[float]):
+    """Set a deadline for the operations performed within the context, in seconds from now.
+    If a deadline is already set, the earliest one is kept. If seconds is None or <= 0, the deadline is not changed.
+    """
+    current = _deadline.get()
+    new = current
+    if seconds is not None and seconds > 0:
+        new = time.monotonic() + seconds
+        if current is not None:
+            new = min(current, new)
+
+    token = _deadline.set(new)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextlib.contextmanager
+def without_deadline():
+    """Remove the deadline for the operations performed within the context (i.e. for starting background tasks)"""
+    token = _deadline.set(None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def get_remaining_time() -> Optional[float]:
+    """Return the time (seconds) until the deadline of the current context, or None if no deadline is set"""
+    current = _deadline.get()
+    if current is None:
+        return None
+    return current - time.monotonic()
+
+
+def check_deadline() -> Optional[float]:
+    """Return the time (seconds) until the deadline of the current context, or None if no deadline is set.
+    :raises: DeadlineExceeded if the deadline passed
+    """
+    remaining = get_remaining_time()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded()
+    return remaining
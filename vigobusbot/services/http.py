@@ -1,19 +1,65 @@
 """HTTP SERVICE
-Perform HTTP requests with logging, error handling & retries support
+Perform HTTP requests with logging, error handling & retries support (with backoff and a global retry budget).
+Requests are performed through long-lived, pooled HTTP clients (one per upstream), which must be closed on shutdown.
+Requests can have timeouts adapted to their recent latency, and be hedged; and are limited by the deadline of the
+current context. Requests to failing upstreams can fail fast, using circuit breakers.
 """
 
 # # Native # #
 import time
-from typing import Optional
+import asyncio
+import functools
+import urllib.parse
+from typing import Optional, Dict, Callable, Awaitable
 
 # # Installed # #
 import httpx
 from httpx import Response
 
 # # Project # #
+from vigobusbot.services.metrics import Counter, Histogram
+from vigobusbot.services.latency import AdaptiveTimeout
+from vigobusbot.services.deadline import check_deadline, get_remaining_time
+from vigobusbot.services.retry import RetryPolicy, get_retry_budget
+from vigobusbot.services.circuit_breaker import CircuitBreaker, CircuitOpen
+from vigobusbot.settings_handler import system_settings as settings
 from vigobusbot.logger import logger
 
-__all__ = ("http_request", "Methods", "Response")
+__all__ = ("http_request", "get_http_client", "close_http_clients", "Methods", "Response", "RetryPolicy")
+
+_clients: Dict[str, httpx.AsyncClient] = dict()
+"""Storage for the long-lived HTTP clients, one per upstream.
+Key=client name
+Value=httpx.AsyncClient
+"""
+
+_requests_duration = Histogram(
+    "vigobusbot_upstream_request_duration_seconds",
+    "Duration of the HTTP requests (attempts) to upstream services",
+    labels=("host", "status")
+)
+_requests_retries = Counter(
+    "vigobusbot_upstream_request_retries_total",
+    "HTTP requests to upstream services retried, by the cause of the attempt retried (status code, timeout or "
+    "connection_error)",
+    labels=("host", "status")
+)
+_requests_hedged = Counter(
+    "vigobusbot_upstream_request_hedged_total",
+    "Hedged HTTP requests sent to upstream services (when the first request was slower than usual)",
+    labels=("host",)
+)
+
+
+Counter(
+    "vigobusbot_upstream_request_retries_rejected_total",
+    "Retries of HTTP requests to upstream services not performed, due to the retry budget being exhausted"
+).set_function(lambda: get_retry_budget().rejected_retries)
+
+_default_retry_policy = RetryPolicy(
+    backoff_base=settings.http_retry_backoff_base,
+    backoff_max=settings.http_retry_backoff_max
+)
 
 
 class Methods:
@@ -22,19 +68,172 @@ class Methods:
     DELETE = "DELETE"
 
 
+def get_http_client(
+        name: str,
+        max_connections: Optional[int] = None,
+        max_keepalive_connections: Optional[int] = None,
+        keepalive_expiry: Optional[float] = None
+) -> httpx.AsyncClient:
+    """Get the long-lived HTTP client for the given upstream name, or create it if not exists.
+    The connection pool limits are only applied when the client is created.
+    """
+    try:
+        return _clients[name]
+
+    except KeyError:
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        client = httpx.AsyncClient(limits=limits)
+        _clients[name] = client
+
+        logger.bind(
+            http_client_name=name,
+            http_client_max_connections=max_connections,
+            http_client_max_keepalive_connections=max_keepalive_connections,
+            http_client_keepalive_expiry=keepalive_expiry
+        ).debug("Created new HTTP client")
+        return client
+
+
+async def close_http_clients():
+    """Close all the HTTP clients created, and their connection pools. Must be called on shutdown."""
+    while _clients:
+        name, client = _clients.popitem()
+        await client.aclose()
+        logger.bind(http_client_name=name).debug("Closed HTTP client")
+
+
+async def _send(
+        client: httpx.AsyncClient, method: str, url: str, query_params: Optional[dict], body: Optional[dict],
+        timeout: float, host: str, adaptive_timeout: Optional[AdaptiveTimeout]
+) -> httpx.Response:
+    """Send a single HTTP request, limiting its total time to the given timeout, and record its latency"""
+    start_time = time.perf_counter()
+    status = "error"
+
+    try:
+        result = await asyncio.wait_for(
+            client.request(method=method, url=url, params=query_params, json=body, timeout=timeout),
+            timeout=timeout
+        )
+        status = result.status_code
+        return result
+
+    except (httpx.TimeoutException, asyncio.TimeoutError) as error:
+        status = "timeout"
+        if isinstance(error, httpx.TimeoutException):
+            raise error
+        raise httpx.TimeoutException(f"Request exceeded the timeout of {round(timeout, 3)}s") from error
+
+    except asyncio.CancelledError:
+        status = None
+        raise
+
+    finally:
+        if status is not None:
+            elapsed = time.perf_counter() - start_time
+            _requests_duration.observe(elapsed, host=host, status=status)
+            if adaptive_timeout:
+                # Timed out requests are accounted with their timeout, so adaptive timeouts can grow if needed
+                adaptive_timeout.tracker.observe(timeout if status == "timeout" else elapsed)
+
+
+async def _send_hedged(send: Callable[[], Awaitable[httpx.Response]], hedge_delay: float, host: str) -> httpx.Response:
+    """Send a request; if no response is received after the hedge_delay, send another one (hedged request).
+    Return the first response received, cancelling the other request. If both fail, raise the last error."""
+    pending = {asyncio.ensure_future(send())}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=hedge_delay)
+        if not done:
+            logger.bind(hedge_delay=round(hedge_delay, 4)).debug("Sending hedged request")
+            _requests_hedged.inc(host=host)
+            pending.add(asyncio.ensure_future(send()))
+
+        last_error = None
+        while True:
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+            if not pending:
+                raise last_error
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+    finally:
+        for task in pending:
+            task.cancel()
+
+
 async def http_request(
         method: str, url: str,
         timeout: float, retries: int,
         query_params: Optional[dict] = None, body: Optional[dict] = None,
-        raise_status: bool = True
+        raise_status: bool = True,
+        client: Optional[httpx.AsyncClient] = None,
+        adaptive_timeout: Optional[AdaptiveTimeout] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        retry_policy: Optional[RetryPolicy] = None
 ) -> httpx.Response:
+    """Perform an HTTP request with the given client (if not given, a generic shared client is used).
+    The timeout is the maximum time for each attempt, and retries the maximum attempts. Failed attempts are retried
+    according to the RetryPolicy (if not given, a default policy is used), waiting a backoff delay between attempts,
+    and only while the process-wide retry budget allows it.
+    If an AdaptiveTimeout is given, the timeout is adapted to the recent latency of the request, and the attempts are
+    hedged if enabled on the AdaptiveTimeout.
+    Attempts are also limited by the deadline of the current context (if any).
+    If a CircuitBreaker is given, the attempts are rejected while it is open; timeouts, connection errors and 5xx
+    responses are accounted as failures.
+    :raises: DeadlineExceeded if the deadline of the current context passed
+    :raises: CircuitOpen if the circuit breaker is open
+    """
     last_error = None
+    last_result: Optional[httpx.Response] = None
+    last_status: Optional[str] = None
+    """Cause of the last failed attempt (status code, timeout or connection_error), labelling the retries"""
+    if client is None:
+        client = get_http_client("default")
+    if retry_policy is None:
+        retry_policy = _default_retry_policy
+    host = urllib.parse.urlsplit(url).netloc
+    retry_budget = get_retry_budget()
+    retry_budget.record_request()
 
     for retry_count in range(retries):
+        if retry_count > 0:
+            if not retry_budget.try_retry():
+                logger.bind(request_url=url).warning("Request not retried, the retry budget is exhausted")
+                break
+
+            backoff = retry_policy.get_backoff(retry_count)
+            remaining_time = get_remaining_time()
+            if remaining_time is not None and backoff >= remaining_time:
+                break
+
+            await asyncio.sleep(backoff)
+            _requests_retries.inc(host=host, status=last_status)
+
+        attempt_timeout = adaptive_timeout.get_timeout(timeout) if adaptive_timeout else timeout
+        remaining_time = check_deadline()
+        if remaining_time is not None and remaining_time < attempt_timeout:
+            attempt_timeout = remaining_time
+            # Timeouts caused by the deadline do not represent the latency of the request
+            adaptive_timeout = None
+        hedge_delay = adaptive_timeout.get_hedge_delay() if adaptive_timeout else None
+
+        if circuit_breaker is not None and not circuit_breaker.allow_request():
+            logger.bind(request_url=url, circuit_breaker_name=circuit_breaker.name).debug(
+                "Request rejected, circuit breaker is open"
+            )
+            raise CircuitOpen(circuit_breaker.name)
+        success = None
+
         with logger.contextualize(
             request_method=method,
             request_url=url,
-            request_timeout=timeout,
+            request_timeout=round(attempt_timeout, 4),
             request_attempt=retry_count+1,
             request_max_attempts=retries,
             request_params=query_params,
@@ -42,17 +241,20 @@ async def http_request(
         ):
             logger.debug("Requesting URL")
             result: httpx.Response
+            send = functools.partial(
+                _send,
+                client=client, method=method, url=url, query_params=query_params, body=body,
+                timeout=attempt_timeout, host=host, adaptive_timeout=adaptive_timeout
+            )
 
             try:
                 start_time = time.time()
-                async with httpx.AsyncClient(timeout=timeout) as client:
-                    if method == Methods.GET:
-                        result = await client.get(url=url, params=query_params)
-                    elif method == Methods.POST:
-                        result = await client.post(url=url, params=query_params, json=body)
-                    elif method == Methods.DELETE:
-                        result = await client.delete(url=url, params=query_params)
+                if hedge_delay is not None and hedge_delay < attempt_timeout:
+                    result = await _send_hedged(send, hedge_delay=hedge_delay, host=host)
+                else:
+                    result = await send()
 
+                success = result.status_code < 500
                 response_time = round(time.time() - start_time, 4)
                 logger.bind(
                     response_elapsed_time=response_time,
@@ -60,13 +262,21 @@ async def http_request(
                     response_body=result.text
                 ).debug("Response received")
 
+                if retry_policy.must_retry_status(result.status_code):
+                    logger.warning("Request failed with retryable status code")
+                    last_result, last_error, last_status = result, None, str(result.status_code)
+                    continue
+
                 if raise_status:
                     result.raise_for_status()
                 return result
 
             except httpx.TimeoutException as error:
+                success = False
                 logger.warning("Request timed out")
-                last_error = error
+                if not retry_policy.must_retry_error(method, timeout=True, request_sent=True):
+                    raise error
+                last_result, last_error, last_status = None, error, "timeout"
 
             except httpx.HTTPStatusError as error:
                 status_code = error.response.status_code
@@ -78,8 +288,25 @@ async def http_request(
 
                 raise error
 
+            except httpx.TransportError as error:
+                success = False
+                logger.opt(exception=True).warning("Request failed")
+                request_sent = not isinstance(error, httpx.ConnectError)
+                if not retry_policy.must_retry_error(method, timeout=False, request_sent=request_sent):
+                    raise error
+                last_result, last_error, last_status = None, error, "connection_error"
+
             except Exception as error:
                 logger.opt(exception=True).warning("Request failed")
                 raise error
 
+            finally:
+                if circuit_breaker is not None:
+                    circuit_breaker.record(success)
+
+    check_deadline()
+    if last_result is not None:
+        if raise_status:
+            last_result.raise_for_status()
+        return last_result
     raise last_error
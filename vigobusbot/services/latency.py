@@ -0,0 +1,93 @@
+"""LATENCY SERVICE
+Track the latency of operations (i.e. requests to each upstream endpoint) over a window of recent samples, to derive
+adaptive timeouts and hedging delays from their percentiles.
+"""
+
+# # Native # #
+import math
+import collections
+from typing import Dict, Optional, List
+
+__all__ = ("LatencyTracker", "AdaptiveTimeout", "get_latency_tracker")
+
+MIN_SAMPLES = 20
+"""Samples required before percentiles are available"""
+
+_trackers: Dict[str, "LatencyTracker"] = dict()
+"""Storage for the latency trackers, by name.
+Key=tracker name
+Value=LatencyTracker
+"""
+
+
+class LatencyTracker:
+    def __init__(self, window: int):
+        self._samples = collections.deque(maxlen=window)
+        self._sorted: Optional[List[float]] = None
+        """Samples sorted, cached until a new sample is added"""
+
+    def __len__(self):
+        return len(self._samples)
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+        self._sorted = None
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Return the given percentile (0~100) of the recent samples, or None if there are not enough samples"""
+        if len(self._samples) < MIN_SAMPLES:
+            return None
+
+        if self._sorted is None:
+            self._sorted = sorted(self._samples)
+        index = min(len(self._sorted) - 1, math.ceil(percent / 100 * len(self._sorted)) - 1)
+        return self._sorted[max(0, index)]
+
+    def get_timeout(self, multiplier: float, min_timeout: float, max_timeout: float) -> float:
+        """Return a timeout adapted to the recent samples (p99 * multiplier, within the given limits).
+        If there are not enough samples, return the max_timeout."""
+        p99 = self.percentile(99)
+        if p99 is None:
+            return max_timeout
+        return min(max_timeout, max(min_timeout, p99 * multiplier))
+
+
+def get_latency_tracker(name: str, window: int) -> LatencyTracker:
+    """Get the latency tracker with the given name, or create it if not exists"""
+    try:
+        return _trackers[name]
+    except KeyError:
+        tracker = _trackers[name] = LatencyTracker(window=window)
+        return tracker
+
+
+class AdaptiveTimeout:
+    """Policy for requests with timeouts adapted to their recent latency (p99 * multiplier, within a minimum and the
+    maximum timeout given on each request), and optionally hedged: if a request takes longer than the recent p95,
+    a second request is sent, and the first response received is used.
+    """
+
+    def __init__(
+            self, name: str, window: int, multiplier: float, min_timeout: float,
+            hedge: bool = False, hedge_min_delay: float = 0
+    ):
+        self.name = name
+        self.tracker = get_latency_tracker(name, window=window)
+        self.multiplier = multiplier
+        self.min_timeout = min_timeout
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+
+    def get_timeout(self, max_timeout: float) -> float:
+        return self.tracker.get_timeout(
+            multiplier=self.multiplier,
+            min_timeout=min(self.min_timeout, max_timeout),
+            max_timeout=max_timeout
+        )
+
+    def get_hedge_delay(self) -> Optional[float]:
+        """Return the time to wait for a response before sending a hedged request, or None if must not hedge"""
+        if not self.hedge:
+            return None
+        p95 = self.tracker.percentile(95)
+        return None if p95 is None else max(p95, self.hedge_min_delay)
@@ -0,0 +1,226 @@
+"""METRICS SERVICE
+In-process metrics registry (counters, gauges & histograms), exposed in the Prometheus text format through an optional
+local HTTP endpoint (/metrics). Metrics can also be computed on scrape, from a function (i.e. sizes of caches).
+"""
+
+# # Native # #
+import time
+import asyncio
+import bisect
+from typing import Callable, Dict, Tuple, Iterable, Optional, Union, List
+
+# # Installed # #
+from aiohttp import web
+
+# # Project # #
+from vigobusbot.settings_handler import system_settings as settings
+from vigobusbot.logger import logger, get_logs_writer_stats, get_request_logs_stats
+
+__all__ = (
+    "Counter", "Gauge", "Histogram", "render_metrics",
+    "start_metrics_server", "stop_metrics_server", "event_loop_lag_monitor"
+)
+
+LabelsValues = Tuple[str, ...]
+MetricFunction = Callable[[], Union[float, Dict[LabelsValues, float]]]
+"""Function returning the current value of a metric: a number (metrics without labels), or a dict with the value
+for each combination of labels values"""
+Sample = Tuple[str, Dict[str, str], float]
+"""(name suffix, labels, value)"""
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+"""Default histogram buckets (seconds)"""
+
+_metrics: Dict[str, "_Metric"] = dict()
+"""Storage for all the metrics created, to render them.
+Key=metric name
+Value=metric
+"""
+_runner: Optional[web.AppRunner] = None
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[LabelsValues, float] = dict()
+        self._function: Optional[MetricFunction] = None
+        if not self.labels:
+            self._values[()] = 0
+        _metrics[name] = self
+
+    def _get_labels_values(self, labels: Dict[str, object]) -> LabelsValues:
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def set_function(self, function: MetricFunction):
+        """Compute the values of the metric with the given function, when rendered"""
+        self._function = function
+
+    def _get_values(self) -> Dict[LabelsValues, float]:
+        if self._function is None:
+            return self._values
+
+        values = self._function()
+        return values if isinstance(values, dict) else {(): values}
+
+    def samples(self) -> List[Sample]:
+        return [
+            ("", dict(zip(self.labels, labels_values)), value)
+            for labels_values, value in self._get_values().items()
+        ]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._get_labels_values(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._get_labels_values(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._get_labels_values(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+            self, name: str, documentation: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._histograms: Dict[LabelsValues, List[float]] = dict()
+        """Key=labels values ; Value=[count per bucket (non-cumulative; last for +Inf)..., sum]"""
+
+    def observe(self, value: float, **labels):
+        key = self._get_labels_values(labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = [0] * (len(self.buckets) + 2)
+
+        histogram[bisect.bisect_left(self.buckets, value)] += 1
+        histogram[-1] += value
+
+    def samples(self) -> List[Sample]:
+        samples = list()
+        for labels_values, histogram in self._histograms.items():
+            labels = dict(zip(self.labels, labels_values))
+            cumulative = 0
+            for bucket, count in zip(self.buckets + (float("inf"),), histogram):
+                cumulative += count
+                samples.append(("_bucket", dict(labels, le=_format_value(bucket)), cumulative))
+            samples.append(("_sum", labels, histogram[-1]))
+            samples.append(("_count", labels, cumulative))
+        return samples
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def render_metrics() -> str:
+    """Render all the metrics in the Prometheus text format"""
+    lines = list()
+    for metric in _metrics.values():
+        # noinspection PyBroadException
+        try:
+            samples = metric.samples()
+        except Exception:
+            logger.opt(exception=True).bind(metric_name=metric.name).warning("Metric could not be collected")
+            continue
+
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for suffix, labels, value in samples:
+            labels_text = ",".join(f"{key}=\"{_escape_label_value(str(val))}\"" for key, val in labels.items())
+            labels_text = "{" + labels_text + "}" if labels_text else ""
+            lines.append(f"{metric.name}{suffix}{labels_text} {_format_value(value)}")
+
+    return "\n".join(lines) + "\n"
+
+
+async def _metrics_endpoint(_: web.Request):
+    return web.Response(
+        body=render_metrics().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
+
+
+async def start_metrics_server():
+    """Start the local HTTP server exposing the metrics on /metrics, if enabled on settings"""
+    global _runner
+    if not settings.metrics_enabled or _runner is not None:
+        return
+
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_endpoint)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, settings.metrics_host, settings.metrics_port).start()
+    _runner = runner
+    logger.bind(metrics_host=settings.metrics_host, metrics_port=settings.metrics_port).info("Started metrics server")
+
+
+async def stop_metrics_server():
+    """Stop the metrics HTTP server, if started. Must be called on shutdown."""
+    global _runner
+    if _runner is not None:
+        runner, _runner = _runner, None
+        await runner.cleanup()
+        logger.debug("Stopped metrics server")
+
+
+_event_loop_lag = Histogram(
+    "vigobusbot_event_loop_lag_seconds",
+    "Delay of the event loop running a scheduled callback",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+
+async def event_loop_lag_monitor():
+    """Measure the event loop lag periodically (how late a sleep wakes up). Runs forever as a background task."""
+    interval = settings.metrics_event_loop_lag_interval
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        _event_loop_lag.observe(max(0.0, time.perf_counter() - started - interval))
+
+
+Gauge(
+    "vigobusbot_request_logs_in_progress",
+    "Requests in progress with their log records kept in memory"
+).set_function(lambda: get_request_logs_stats()["requests_in_progress"])
+Gauge(
+    "vigobusbot_request_logs_records_kept",
+    "Log records kept in memory for the requests in progress"
+).set_function(lambda: get_request_logs_stats()["records_kept"])
+Counter(
+    "vigobusbot_request_logs_persisted_documents_total",
+    "Request log documents inserted on Mongo"
+).set_function(lambda: get_logs_writer_stats()["flushed_documents"])
+Counter(
+    "vigobusbot_request_logs_dropped_documents_total",
+    "Request log documents dropped before being inserted on Mongo, due to the buffer being full"
+).set_function(lambda: get_logs_writer_stats()["dropped_documents"])
@@ -1,24 +1,62 @@
 """MONGO SERVICE
-Low level utils for Mongo interaction
+Low level utils for Mongo interaction.
+A single, process-wide Mongo client is created lazily on first use (on the running event loop), and must be closed on
+shutdown. If the "mock" Mongo setting is enabled, an in-memory stand-in client (mongomock-motor) is used instead.
 """
 
 # # Native # #
-import asyncio
+from typing import Optional
 
 # # Installed # #
 from motor import motor_asyncio
-from pymongo.collection import Collection
+# loguru logger imported directly, since vigobusbot.logger depends on this module
+from loguru import logger
 
 # # Project # #
 from vigobusbot.settings_handler import mongo_settings
 
-__all__ = ("get_collection", "get_logs_collection")
+__all__ = ("get_client", "get_collection", "get_logs_collection", "close_client")
 
+_client: Optional[motor_asyncio.AsyncIOMotorClient] = None
 
-def get_collection(collection: str, loop: asyncio.AbstractEventLoop) -> Collection:
-    client = motor_asyncio.AsyncIOMotorClient(mongo_settings.uri, io_loop=loop)
-    return client[mongo_settings.database][collection]
 
+def get_client() -> motor_asyncio.AsyncIOMotorClient:
+    """Get the Mongo client, or create it if not exists. Must be called from the event loop the client is used on."""
+    global _client
+    if _client is None:
+        if mongo_settings.mock:
+            # mongomock-motor is only required when using the stand-in client
+            from mongomock_motor import AsyncMongoMockClient
+            _client = AsyncMongoMockClient()
+        else:
+            _client = motor_asyncio.AsyncIOMotorClient(
+                mongo_settings.uri,
+                maxPoolSize=mongo_settings.pool_max_size,
+                minPoolSize=mongo_settings.pool_min_size,
+                maxIdleTimeMS=int(mongo_settings.pool_max_idle_time * 1000),
+                serverSelectionTimeoutMS=int(mongo_settings.server_selection_timeout * 1000)
+            )
 
-def get_logs_collection(loop: asyncio.AbstractEventLoop) -> Collection:
-    return get_collection(mongo_settings.collection_logs, loop)
+        logger.bind(
+            mongo_mock=mongo_settings.mock,
+            mongo_pool_max_size=mongo_settings.pool_max_size,
+            mongo_pool_min_size=mongo_settings.pool_min_size
+        ).debug("Created Mongo client")
+    return _client
+
+
+def get_collection(collection: str) -> motor_asyncio.AsyncIOMotorCollection:
+    return get_client()[mongo_settings.database][collection]
+
+
+def get_logs_collection() -> motor_asyncio.AsyncIOMotorCollection:
+    return get_collection(mongo_settings.collection_logs)
+
+
+def close_client():
+    """Close the Mongo client (if created) and its connection pool. Must be called on shutdown."""
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        client.close()
+        logger.debug("Closed Mongo client")
@@ -0,0 +1,100 @@
+"""RETRY SERVICE
+Retry policies (which failures are retried, and the backoff between attempts) and the process-wide retry budget,
+that limits the retries to a ratio of the recent requests, so retries never multiply the load on failing upstreams.
+"""
+
+# # Native # #
+import time
+import random
+import collections
+from typing import Deque, List, Iterable, Optional
+
+# # Project # #
+from vigobusbot.settings_handler import system_settings as settings
+
+__all__ = ("RetryPolicy", "RetryBudget", "get_retry_budget", "IDEMPOTENT_METHODS")
+
+IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "OPTIONS", "PUT", "DELETE"))
+
+
+class RetryPolicy:
+    """Policy for retrying failed HTTP requests.
+    Connection errors (the request was not sent) and timeouts are always retryable; other network errors (the request
+    may have been processed) only on idempotent methods. Responses are only retried for the given status codes.
+    The delay before each retry follows an exponential backoff with full jitter: random(0, min(max, base * 2^retry)).
+    """
+
+    def __init__(
+            self, backoff_base: float, backoff_max: float,
+            retry_status_codes: Iterable[int] = (502, 503, 504), retry_timeouts: bool = True
+    ):
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_status_codes = frozenset(retry_status_codes)
+        self.retry_timeouts = retry_timeouts
+
+    def get_backoff(self, retry: int) -> float:
+        """Return the delay (seconds) before the given retry (1 for the first retry)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (retry - 1)))
+
+    def must_retry_status(self, status_code: int) -> bool:
+        return status_code in self.retry_status_codes
+
+    def must_retry_error(self, method: str, timeout: bool, request_sent: bool) -> bool:
+        if timeout:
+            return self.retry_timeouts
+        return not request_sent or method.upper() in IDEMPOTENT_METHODS
+
+
+class RetryBudget:
+    """Limit the retries performed within a time window to a ratio of the requests performed within the window,
+    plus a minimum amount of retries per second (so low traffic can still retry).
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, window: float):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        self.rejected_retries = 0
+        self._buckets: Deque[List] = collections.deque()
+        """Requests & retries within the window, by second: [second, requests, retries]"""
+
+    def _get_bucket(self) -> List:
+        now = int(time.monotonic())
+        if not self._buckets or self._buckets[-1][0] != now:
+            self._buckets.append([now, 0, 0])
+
+        oldest = now - self.window
+        while self._buckets[0][0] < oldest:
+            self._buckets.popleft()
+        return self._buckets[-1]
+
+    def record_request(self):
+        self._get_bucket()[1] += 1
+
+    def try_retry(self) -> bool:
+        """Return True if a retry can be performed (and account it), or False if the budget is exhausted"""
+        bucket = self._get_bucket()
+        requests = sum(b[1] for b in self._buckets)
+        retries = sum(b[2] for b in self._buckets)
+        if retries >= self.min_per_second * self.window + self.ratio * requests:
+            self.rejected_retries += 1
+            return False
+
+        bucket[2] += 1
+        return True
+
+
+_retry_budget: Optional[RetryBudget] = None
+
+
+def get_retry_budget() -> RetryBudget:
+    """Get the process-wide retry budget, shared by all the HTTP requests"""
+    global _retry_budget
+    if _retry_budget is None:
+        _retry_budget = RetryBudget(
+            ratio=settings.http_retry_budget_ratio,
+            min_per_second=settings.http_retry_budget_min_per_second,
+            window=settings.http_retry_budget_window
+        )
+    return _retry_budget
@@ -0,0 +1,54 @@
+"""SINGLE FLIGHT SERVICE
+Deduplicate concurrent calls to an async function: callers with the same key share one in-flight execution,
+and all of them get its result (or its exception).
+"""
+
+# # Native # #
+import asyncio
+import functools
+from typing import Callable, Dict, Hashable
+
+# # Project # #
+from vigobusbot.logger import logger
+
+__all__ = ("single_flight",)
+
+
+def single_flight(key_function: Callable[..., Hashable]):
+    """Decorator for async functions that must coalesce concurrent calls.
+    :param key_function: function that receives the same arguments as the decorated function, and returns the key
+                         that identifies equivalent calls (calls with same key share the same execution)
+    """
+    def _real_decorator(function):
+        in_flight: Dict[Hashable, asyncio.Task] = dict()
+        """Storage for the executions in progress.
+        Key=call key returned by key_function
+        Value=asyncio.Task running the decorated function
+        """
+
+        def _on_done(key: Hashable, task: asyncio.Task):
+            if in_flight.get(key) is task:
+                in_flight.pop(key)
+            # Retrieve the exception, avoiding warnings if all the callers got cancelled
+            if not task.cancelled():
+                task.exception()
+
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            key = key_function(*args, **kwargs)
+
+            try:
+                task = in_flight[key]
+                logger.bind(single_flight_key=key).debug(f"Joined in-flight call of {function.__name__}")
+
+            except KeyError:
+                task = asyncio.create_task(function(*args, **kwargs))
+                task.add_done_callback(functools.partial(_on_done, key))
+                in_flight[key] = task
+
+            # Shield the shared execution, so cancelling one caller does not cancel it for the rest of callers
+            return await asyncio.shield(task)
+
+        return wrapper
+
+    return _real_decorator
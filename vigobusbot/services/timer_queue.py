@@ -0,0 +1,121 @@
+"""TIMER QUEUE
+Keys scheduled to be due at a certain time, kept on a heap ordered by time, so getting the due keys only touches those
+keys (not all the scheduled ones). Rescheduling or cancelling a key does not search it on the heap: the new entry is
+pushed (O(log n)), and the previous one is left behind and discarded when it reaches the top of the heap.
+"""
+
+# # Native # #
+import time
+import heapq
+import asyncio
+import itertools
+import contextlib
+from typing import Optional, Callable, Hashable, Dict, List, Tuple
+
+__all__ = ("TimerQueue",)
+
+
+class TimerQueue:
+    COMPACT_MIN_ENTRIES = 1000
+    """Minimum entries on the heap for compacting it (removing the discarded entries)"""
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        """
+        :param clock: function returning the current time, on the same scale as the times the keys are scheduled at
+        """
+        self.clock = clock
+        self._heap: List[Tuple[float, int, Hashable]] = list()
+        """Entries (time, sequence, key); the sequence breaks ties, so the keys are never compared"""
+        self._scheduled: Dict[Hashable, Tuple[float, int]] = dict()
+        """Current entry of each scheduled key.
+        Key=key
+        Value=(time, sequence)
+        """
+        self._sequence = itertools.count()
+        self._changed: Optional[asyncio.Event] = None
+
+    def __len__(self):
+        return len(self._scheduled)
+
+    def __contains__(self, key: Hashable):
+        return key in self._scheduled
+
+    def get_time(self, key: Hashable) -> Optional[float]:
+        """Return the time the key is scheduled at (None if not scheduled)"""
+        entry = self._scheduled.get(key)
+        return entry[0] if entry else None
+
+    def schedule(self, key: Hashable, when: float):
+        """Schedule the key at the given time, replacing its previous time if already scheduled"""
+        entry = (when, next(self._sequence))
+        self._scheduled[key] = entry
+        heapq.heappush(self._heap, (*entry, key))
+        self._compact()
+
+        if self._changed is not None:
+            self._changed.set()
+
+    def schedule_earliest(self, key: Hashable, when: float):
+        """Schedule the key at the given time, unless already scheduled before it"""
+        current = self.get_time(key)
+        if current is None or when < current:
+            self.schedule(key, when)
+
+    def cancel(self, key: Hashable) -> bool:
+        """Unschedule the key. Return True if it was scheduled."""
+        return self._scheduled.pop(key, None) is not None
+
+    def next_time(self) -> Optional[float]:
+        """Return the time of the next scheduled key (None if nothing is scheduled)"""
+        self._discard_top()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: Optional[float] = None) -> List[Hashable]:
+        """Unschedule and return the keys due at the given time (now, if not given), ordered by time"""
+        if now is None:
+            now = self.clock()
+
+        due = list()
+        while True:
+            self._discard_top()
+            if not self._heap or self._heap[0][0] > now:
+                return due
+
+            _, _, key = heapq.heappop(self._heap)
+            del self._scheduled[key]
+            due.append(key)
+
+    async def wait_due(self) -> List[Hashable]:
+        """Wait until any key is due, then unschedule and return the due keys.
+        Keys scheduled while waiting are considered (the wait is shortened if they are due sooner)."""
+        if self._changed is None:
+            self._changed = asyncio.Event()
+
+        while True:
+            now = self.clock()
+            due = self.pop_due(now)
+            if due:
+                return due
+
+            next_time = self.next_time()
+            self._changed.clear()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    self._changed.wait(),
+                    timeout=None if next_time is None else next_time - now
+                )
+
+    def _is_current(self, heap_entry: Tuple[float, int, Hashable]) -> bool:
+        when, sequence, key = heap_entry
+        return self._scheduled.get(key) == (when, sequence)
+
+    def _discard_top(self):
+        """Remove the entries on top of the heap that were rescheduled or cancelled"""
+        while self._heap and not self._is_current(self._heap[0]):
+            heapq.heappop(self._heap)
+
+    def _compact(self):
+        """Rebuild the heap without the discarded entries, when they are the majority"""
+        if len(self._heap) > max(self.COMPACT_MIN_ENTRIES, 2 * len(self._scheduled)):
+            self._heap = [(when, sequence, key) for key, (when, sequence) in self._scheduled.items()]
+            heapq.heapify(self._heap)
@@ -23,9 +23,29 @@ class TelegramSettings(BaseBotSettings):
     admin_userid: int
     bot_api: str = "https://api.telegram.org"
     method = "polling"
+    """Method for receiving updates from Telegram ("polling" or "webhook")"""
+    webhook_url: Optional[str]
+    """Public URL of the webhook, set on Telegram on startup. If not set, the webhook is not set by this instance
+    (i.e. when running multiple instances behind a load balancer)"""
+    webhook_host = "0.0.0.0"
+    webhook_port: int = 8080
+    webhook_path = "/webhook"
+    webhook_secret_token: Optional[str]
+    """Secret token sent by Telegram on each webhook request, for validating them (1-256 characters: A-Z, a-z, 0-9,
+    _ and -). Can be a secret file path"""
+    webhook_queue_size: int = 1000
+    """Maximum updates pending to process; when reached, new updates are rejected and Telegram delivers them later"""
+    webhook_max_connections: int = 40
+    """Maximum simultaneous connections from Telegram to the webhook"""
     skip_prev_updates = True
     polling_fast = True
     polling_timeout: float = 30
+    polling_queue_size: int = 1000
+    """Maximum updates pending to process; when reached, no more updates are requested until some are processed"""
+    updates_max_concurrency: int = 32
+    """Maximum updates processed at the same time (updates of the same chat are always processed in order)"""
+    updates_shutdown_timeout: float = 10
+    """Maximum time (seconds) to wait for the pending updates to be processed on shutdown"""
     force_reply_ttl: int = 3600
     """Timeout for Force Reply requests until cleanup"""
     user_rate_limit_amount: int = 5
@@ -34,19 +54,63 @@ class TelegramSettings(BaseBotSettings):
     """Timeout for User Rate counter to reset"""
     typing_safe_limit_time: float = 30
     """Timeout for a Typing chat action to end"""
+    outgoing_global_rate: float = 25
+    """Maximum messages sent or edited per second, for all the chats (Telegram limit is about 30)"""
+    outgoing_chat_rate: float = 1
+    """Maximum messages sent or edited per second, on each private chat"""
+    outgoing_chat_burst: int = 3
+    """Messages that can be sent or edited at once on each private chat, before limiting to outgoing_chat_rate"""
+    outgoing_group_rate: float = 0.33
+    """Maximum messages sent or edited per second, on each group chat (Telegram limit is 20 per minute)"""
+    outgoing_retry_after_max_retries: int = 2
+    """Retries for messages rejected by Telegram due to flood control (429), after waiting the given time"""
     inline_cache_time: int = 300
     stop_messages_deprecation_reminder_after_seconds: int = 0
     """Time for a Stop message to be considered deprecated, thus update with a warning about it being deprecated.
     If 0, disable this feature."""
     stop_messages_deprecation_reminder_loop_delay_seconds: int = 60
     """Delay for the loop that checks for deprecated Stop messages."""
+    stop_messages_live_refresh_interval: float = 20
+    """Delay (seconds) between the automatic refreshes of the Stop messages that users subscribe to the live refresh.
+    If 0, disable this feature."""
+    stop_messages_live_refresh_duration: float = 600
+    """Time (seconds) a Stop message is refreshed automatically after the user subscribes it to the live refresh"""
+    stop_messages_live_refresh_max_subscriptions: int = 1000
+    """Maximum Stop messages subscribed to the live refresh at the same time"""
+    bus_alerts_enabled: bool = True
+    """If True, users can request alerts for being notified when a bus of a line is arriving to a Stop"""
+    bus_alerts_duration: float = 3600
+    """Time (seconds) an alert is kept pending; if no bus of its line arrives within this time, the alert expires"""
+    bus_alerts_max_per_chat: int = 5
+    """Maximum pending alerts of each user"""
+    bus_alerts_max: int = 50000
+    """Maximum pending alerts, for all the users"""
+    bus_alerts_check_min_interval: float = 30
+    """Minimum delay (seconds) between the checks of the Buses of a Stop with pending alerts"""
+    bus_alerts_check_max_interval: float = 300
+    """Maximum delay (seconds) between the checks of the Buses of a Stop with pending alerts (when its buses are far)"""
+    bus_alerts_max_concurrent_checks: int = 20
+    """Maximum Stops with pending alerts being checked at the same time"""
+    bus_alerts_persist_file: Optional[str] = None
+    """Local file where the pending alerts are persisted, for keeping them between restarts. If empty, not persisted."""
+    bus_alerts_persist_interval: float = 5
+    """Delay (seconds) between the saves of the pending alerts on the persist file (only saved if changed)"""
     stop_messages_include_arrival_hour_after_minutes: int = -1
     """Buses arriving after this amount of minutes will include the calculated hour of arrival.
     Negative values to disable the feature."""
+    nearest_stops_limit: int = 6
+    """Maximum Stops returned when users send a location"""
+    nearest_stops_max_distance: float = 2000
+    """Maximum distance (meters) from the location sent by users to the returned Stops. If 0, unlimited."""
+    request_deadline: float = 20
+    """Maximum time (seconds) for processing each request; operations performed while processing it (i.e. requests to
+    the API) are limited by the remaining time. If 0, unlimited."""
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.token = load_secrets_file(path=self.token.strip(), path_startswith=True)
+        if self.webhook_secret_token:
+            self.webhook_secret_token = load_secrets_file(path=self.webhook_secret_token.strip(), path_startswith=True)
 
     @property
     def bot_api_server(self):
@@ -57,19 +121,98 @@ class APISettings(BaseBotSettings):
     url = "http://localhost:5000"
     timeout: float = 30
     retries: int = 2
+    pool_max_connections: int = 100
+    """Maximum concurrent connections opened against the API"""
+    pool_max_keepalive_connections: int = 20
+    """Maximum idle connections kept alive against the API, for reuse on further requests"""
+    pool_keepalive_expiry: float = 30
+    """Time (seconds) until idle connections kept alive are closed"""
+    adaptive_timeout_enabled: bool = True
+    """If True, the timeout of each request is adapted to the recent latency of its endpoint (p99 * multiplier),
+    between timeout_min and timeout"""
+    adaptive_timeout_multiplier: float = 3
+    timeout_min: float = 2
+    """Minimum timeout (seconds) of requests with adaptive timeout"""
+    latency_window: int = 200
+    """Amount of recent requests, per endpoint, used for computing the latency percentiles"""
+    hedge_enabled: bool = True
+    """If True, when a request takes longer than the recent p95 latency of its endpoint, send a second (hedged)
+    request, using the first response received. Requires adaptive_timeout_enabled."""
+    hedge_min_delay: float = 0.2
+    """Minimum time (seconds) to wait for a response before sending a hedged request"""
+    circuit_breaker_enabled: bool = True
+    """If True, requests to the API fail fast while it is failing (its error rate is above the threshold)"""
+    circuit_breaker_error_rate: float = 0.5
+    """Ratio (0~1) of failed requests (timeouts, connection errors, 5xx) that opens the circuit breaker"""
+    circuit_breaker_min_requests: int = 10
+    """Minimum requests within the circuit breaker window for considering the error rate"""
+    circuit_breaker_window: float = 30
+    """Time window (seconds) for computing the error rate of the circuit breaker"""
+    circuit_breaker_open_seconds: float = 15
+    """Time (seconds) the circuit breaker stays open (failing fast) until probing the API again"""
+    buses_cache_ttl: float = 15
+    """Time (seconds) the buses of a stop (short list) are cached locally. If 0, disable the cache."""
+    buses_all_cache_ttl: float = 30
+    """Time (seconds) the buses of a stop (complete list, get_all_buses) are cached locally. If 0, disable the cache."""
+    buses_cache_refresh_ahead: float = 5
+    """Cached buses read during the last seconds of their TTL are refreshed on background. If 0, disable refresh-ahead."""
+    buses_cache_size: int = 2000
+    """Maximum amount of stops with cached buses (for each buses cache)"""
+    buses_cache_stale_ttl: float = 600
+    """Time (seconds) the buses of a stop are kept after expiring, to serve them (marked as outdated) when the API
+    is unavailable. If 0, disable serving stale buses."""
+    stops_cache_ttl: float = 86400
+    """Time (seconds) the stops are cached locally. Should be greater than stops_catalogue_refresh_seconds.
+    If 0, disable the cache."""
+    stops_cache_stale_ttl: float = 86400
+    """Time (seconds) the stops are kept after expiring, to serve them when the API is unavailable.
+    If 0, disable serving stale stops."""
+    stops_catalogue_enabled: bool = True
+    """If True, load the complete Stops catalogue on startup, and revalidate it periodically"""
+    stops_catalogue_refresh_seconds: float = 21600
+    """Delay between Stops catalogue revalidations from the API"""
+    stops_catalogue_retry_seconds: float = 300
+    """Delay for retrying the Stops catalogue load from the API, when it failed"""
+    stops_catalogue_snapshot_file: Optional[str]
+    """Local JSON file where the Stops catalogue is saved, and loaded from on startup (optional)"""
 
     class Config(BaseBotSettings.Config):
         env_prefix = "API_"
 
 
 class PersistenceSettings(BaseBotSettings):
+    backend = "api"
+    """Backend for persisting Saved Stops: "api" (Persistence API on the url) or "sqlite" (embedded SQLite database on
+    the sqlite_file)"""
     url = "http://localhost:5001"
+    sqlite_file = "saved_stops.db"
+    """Path of the SQLite database file, when using the sqlite backend"""
     salt = "FixedSalt"
     """Fixed salt value for hashing stored user data (saved stops) in local persistence
     (cannot change once there is data stored)"""
     timeout: float = 30
     retries: int = 2
+    pool_max_connections: int = 100
+    """Maximum concurrent connections opened against the Persistence API"""
+    pool_max_keepalive_connections: int = 20
+    """Maximum idle connections kept alive against the Persistence API, for reuse on further requests"""
+    pool_keepalive_expiry: float = 30
+    """Time (seconds) until idle connections kept alive are closed"""
+    circuit_breaker_enabled: bool = True
+    """If True, requests to the Persistence API fail fast while it is failing (its error rate is above the threshold)"""
+    circuit_breaker_error_rate: float = 0.5
+    """Ratio (0~1) of failed requests (timeouts, connection errors, 5xx) that opens the circuit breaker"""
+    circuit_breaker_min_requests: int = 10
+    """Minimum requests within the circuit breaker window for considering the error rate"""
+    circuit_breaker_window: float = 30
+    """Time window (seconds) for computing the error rate of the circuit breaker"""
+    circuit_breaker_open_seconds: float = 15
+    """Time (seconds) the circuit breaker stays open (failing fast) until probing the Persistence API again"""
     key_cache_size: int = 100
+    saved_stops_cache_size: int = 10000
+    """Maximum amount of users with their Saved Stops cached locally. If 0, disable the cache."""
+    saved_stops_cache_ttl: float = 3600
+    """Time (seconds) the Saved Stops of a user are cached locally. If 0, disable the cache."""
 
     class Config(BaseBotSettings.Config):
         env_prefix = "PERSIST_"
@@ -84,6 +227,17 @@ class MongoSettings(BaseBotSettings):
     database: str = "vigobusbot"
     collection_logs: str = "logs"
     """Collection for log records"""
+    pool_max_size: int = 10
+    """Maximum concurrent connections opened against Mongo"""
+    pool_min_size: int = 0
+    """Minimum connections kept opened against Mongo"""
+    pool_max_idle_time: float = 60
+    """Time (seconds) until idle connections are closed"""
+    server_selection_timeout: float = 30
+    """Time (seconds) to wait for an available Mongo server before failing an operation"""
+    mock: bool = False
+    """If True, use an in-memory stand-in Mongo client instead of connecting to the uri (for development & testing;
+    requires mongomock-motor installed)"""
 
     class Config(BaseBotSettings.Config):
         env_prefix = "MONGO_"
@@ -100,8 +254,42 @@ class SystemSettings(BaseBotSettings):
     """Minimum record level to persist all records for a request (at least one record with this level)"""
     request_logs_persist_record_timeout: float = 120
     """Timeout for request records in logger cache until cleanup"""
+    request_logs_persist_record_head: int = 100
+    """Maximum records kept from the start of each request. Records between the head & tail are dropped."""
+    request_logs_persist_record_tail: int = 100
+    """Maximum records kept from the end of each request. Records between the head & tail are dropped."""
+    request_logs_persist_max_records: int = 50000
+    """Maximum records kept in memory for all the requests in progress. When exceeded, the oldest requests are
+    discarded."""
+    request_logs_persist_slow_seconds: float = 0
+    """Requests taking at least this time (seconds) are persisted (sampled), even without records reaching the persist
+    level. If 0, disable persisting slow requests."""
+    request_logs_persist_slow_sample_rate: float = 1
+    """Ratio (0~1) of slow requests persisted"""
+    request_logs_persist_buffer_max_bytes: int = 16 * 1024 * 1024
+    """Maximum size (bytes) of the request records buffered for persisting. When full, the oldest are dropped."""
+    request_logs_persist_batch_size: int = 100
+    """Maximum request records inserted at once. The buffer is flushed as soon as it has this amount of records."""
+    request_logs_persist_flush_interval: float = 5
+    """Interval (seconds) for flushing the buffered request records"""
     request_logs_print_level: str = "WARNING"
     """Log level for printing individual request log records"""
+    metrics_enabled: bool = False
+    """If True, expose the metrics on a local HTTP endpoint (/metrics, in the Prometheus text format)"""
+    metrics_host: str = "127.0.0.1"
+    metrics_port: int = 9180
+    metrics_event_loop_lag_interval: float = 1
+    """Interval (seconds) for measuring the event loop lag"""
+    http_retry_backoff_base: float = 0.1
+    """Base delay (seconds) before retrying failed HTTP requests; doubled on each retry, with random jitter"""
+    http_retry_backoff_max: float = 2
+    """Maximum delay (seconds) before retrying failed HTTP requests"""
+    http_retry_budget_ratio: float = 0.2
+    """Maximum ratio of HTTP retries over the requests performed within the retry budget window (process-wide)"""
+    http_retry_budget_min_per_second: float = 1
+    """Retries per second always allowed by the retry budget, regardless of the requests performed"""
+    http_retry_budget_window: float = 10
+    """Time window (seconds) for the retry budget"""
     test: bool = False
     """If True, run the test handlers"""
 
@@ -1,2 +1,3 @@
 from .bot import Bot, get_bot
 from .polling import start_polling
+from .webhook import start_webhook
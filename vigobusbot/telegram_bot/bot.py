@@ -1,23 +1,85 @@
 """BOT
-Bot class and bot instance getter and generator
+Bot & Dispatcher classes and bot instance getter and generator
 """
 
 import asyncio
+import inspect
+import functools
 from typing import Optional
 
 import aiogram
+from aiogram.utils.exceptions import RetryAfter
 
-from .handlers import register_handlers
+from .handlers import register_handlers, get_update_coalesce_key
+from .update_scheduler import UpdateScheduler
+from .outgoing_limiter import OutgoingLimiter
 from vigobusbot.telegram_bot.services.stop_messages_deprecation_reminder import stop_messages_deprecation_reminder_worker
+from vigobusbot.telegram_bot.services.bus_alerts import bus_alerts_worker
+from vigobusbot.vigobus_api import stops_catalogue_worker
+from vigobusbot.services.metrics import start_metrics_server, event_loop_lag_monitor
+from vigobusbot.services.deadline import get_remaining_time
 from vigobusbot.settings_handler import telegram_settings as settings
+from vigobusbot.settings_handler import system_settings
 from vigobusbot.static_handler import get_messages
-from vigobusbot.logger import logger
+from vigobusbot.logger import logger, set_request_logs_loop
+
+
+class Dispatcher(aiogram.Dispatcher):
+    """Dispatcher that processes the updates through an UpdateScheduler (concurrently across chats, in order within
+    each chat, coalescing repeated Refresh button presses)"""
+
+    def __init__(self, bot: aiogram.Bot, **kwargs):
+        super().__init__(bot, **kwargs)
+        self.update_scheduler = UpdateScheduler(
+            process=self._process_scheduled_update,
+            max_concurrency=settings.updates_max_concurrency,
+            get_coalesce_key=get_update_coalesce_key
+        )
+        self._polling_task: Optional[asyncio.Task] = None
+
+    async def start_polling(self, *args, **kwargs):
+        self._polling_task = asyncio.current_task()
+        try:
+            return await super().start_polling(*args, **kwargs)
+        finally:
+            self._polling_task = None
+
+    async def close_polling(self):
+        """Stop polling: cancel the request for updates in progress (the updates not received yet are delivered again
+        by Telegram on the next start), and wait for the polling to end"""
+        self.stop_polling()
+        polling_task = self._polling_task
+        if polling_task is not None:
+            polling_task.cancel()
+            await asyncio.gather(polling_task, return_exceptions=True)
+
+    async def process_updates(self, updates, fast: bool = True):
+        """Schedule the updates for processing; return without waiting for them to be processed"""
+        for update in updates:
+            self.update_scheduler.submit(update)
+        return []
+
+    async def _process_scheduled_update(self, update: aiogram.types.Update):
+        aiogram.Bot.set_current(self.bot)
+        aiogram.Dispatcher.set_current(self)
+        return await self.process_update(update)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_signature(method) -> inspect.Signature:
+    return inspect.signature(method)
 
 
 class Bot(aiogram.Bot):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.dispatcher = aiogram.Dispatcher(self)
+        self.dispatcher = Dispatcher(self)
+        self.outgoing_limiter = OutgoingLimiter(
+            global_rate=settings.outgoing_global_rate,
+            chat_rate=settings.outgoing_chat_rate,
+            chat_burst=settings.outgoing_chat_burst,
+            group_rate=settings.outgoing_group_rate
+        )
         logger.debug(f"Created new Bot instance with token {kwargs['token'][:4]}...{kwargs['token'][-4:]}, "
                      f"using Bot API {kwargs['server']}")
 
@@ -26,13 +88,44 @@ class Bot(aiogram.Bot):
         kwargs.setdefault("parse_mode", "HTML")
         kwargs.setdefault("disable_web_page_preview", True)
 
+    async def _send_limited(self, method, *args, **kwargs):
+        """Call a Bot API method that sends (or edits) messages, within the outgoing rate limits.
+        When Telegram replies with 429 (retry after), the chat is paused and the request retried, if the deadline of the
+        current context (if any) allows it."""
+        chat_id = _get_signature(method).bind(*args, **kwargs).arguments.get("chat_id")
+        chat_id = int(chat_id) if chat_id is not None else None
+
+        for retry in range(settings.outgoing_retry_after_max_retries + 1):
+            await self.outgoing_limiter.acquire(chat_id)
+            try:
+                return await method(*args, **kwargs)
+
+            except RetryAfter as error:
+                self.outgoing_limiter.pause(chat_id, error.timeout)
+                remaining_time = get_remaining_time()
+                if retry == settings.outgoing_retry_after_max_retries or \
+                        (remaining_time is not None and error.timeout >= remaining_time):
+                    raise error
+
+    async def get_updates(self, *args, **kwargs):
+        """Request updates for polling, once the updates pending to process are below the polling queue size (so the
+        updates are left on Telegram while the bot is overloaded, instead of buffered in memory without limit)"""
+        await self.dispatcher.update_scheduler.wait_pending_below(settings.polling_queue_size)
+        return await super().get_updates(*args, **kwargs)
+
     async def send_message(self, *args, **kwargs):
         self.__set_message_kwargs(kwargs)
-        return await super().send_message(*args, **kwargs)
+        return await self._send_limited(super().send_message, *args, **kwargs)
 
     async def edit_message_text(self, *args, **kwargs):
         self.__set_message_kwargs(kwargs)
-        return await super().edit_message_text(*args, **kwargs)
+        return await self._send_limited(super().edit_message_text, *args, **kwargs)
+
+    async def edit_message_reply_markup(self, *args, **kwargs):
+        return await self._send_limited(super().edit_message_reply_markup, *args, **kwargs)
+
+    async def send_document(self, *args, **kwargs):
+        return await self._send_limited(super().send_document, *args, **kwargs)
 
     async def set_commands(self) -> bool:
         # noinspection PyBroadException
@@ -51,8 +144,18 @@ class Bot(aiogram.Bot):
             return False
 
     async def start_background_services(self):
+        set_request_logs_loop()
         # noinspection PyAsyncCall
         asyncio.create_task(stop_messages_deprecation_reminder_worker(self))
+        # noinspection PyAsyncCall
+        asyncio.create_task(bus_alerts_worker(self))
+        # noinspection PyAsyncCall
+        asyncio.create_task(stops_catalogue_worker())
+
+        if system_settings.metrics_enabled:
+            await start_metrics_server()
+            # noinspection PyAsyncCall
+            asyncio.create_task(event_loop_lag_monitor())
 
 
 _bot: Optional[Bot] = None
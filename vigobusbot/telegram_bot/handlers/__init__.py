@@ -7,8 +7,9 @@ import aiogram
 
 # # Package # #
 from . import message_handlers, callback_handlers, inline_handlers
+from .callback_handlers import get_update_coalesce_key
 
-__all__ = ("register_handlers",)
+__all__ = ("register_handlers", "get_update_coalesce_key")
 
 
 def register_handlers(dispatcher: aiogram.Dispatcher):
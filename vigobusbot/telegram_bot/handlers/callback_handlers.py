@@ -3,6 +3,7 @@ Callback Handlers for the Callback Queries, produced when users press buttons fr
 """
 
 import asyncio
+from typing import Optional, Tuple, Hashable
 
 import aiogram
 
@@ -11,45 +12,91 @@ from vigobusbot.telegram_bot.services.status_sender import start_typing, stop_ty
 from vigobusbot.telegram_bot.services.stop_rename_request_handler import StopRenameRequestContext
 from vigobusbot.telegram_bot.services.stop_rename_request_handler import register_stop_rename_request
 from vigobusbot.telegram_bot.services.sent_messages_persistence import persist_sent_stop_message
+from vigobusbot.telegram_bot.services.message_editor import get_message_key, edit_message_text_if_changed
+from vigobusbot.telegram_bot.services.message_editor import edit_message_reply_markup
+from vigobusbot.telegram_bot.services.stop_messages_live_refresh import *
+from vigobusbot.telegram_bot.services.bus_alerts import create_alert, cancel_alert
 from vigobusbot.telegram_bot.services.message_generators import *
 from vigobusbot.persistence_api import saved_stops
 from vigobusbot.static_handler import get_messages
-from vigobusbot.vigobus_api import get_stop
+from vigobusbot.settings_handler import telegram_settings
+from vigobusbot.vigobus_api import get_stop, get_buses
+from vigobusbot.services.single_flight import single_flight
 from vigobusbot.exceptions import MessageNotModified
 from vigobusbot.logger import logger
 
-__all__ = ("register_handlers",)
+__all__ = ("register_handlers", "get_update_coalesce_key")
 
 
 @request_handler("Button stop_refresh")
 async def stop_refresh(callback_query: aiogram.types.CallbackQuery, callback_data: dict, *args, **kwargs):
     """Refresh button on Stop messages. Must generate a new Stop message content and edit the original message.
     The Stop message can be on a private chat or come from Inline Mode.
+    Repeated presses queued while the message is being refreshed are coalesced by the update scheduler
+    (see get_update_coalesce_key); presses from different users on the same inline message, processed concurrently,
+    join the refresh in progress instead of refreshing again.
     """
+    message_key = _get_callback_message_key(callback_query)
+    await _refresh_stop_message(callback_query, callback_data, message_key=message_key)
+
+
+def _get_stop_message_context(
+        callback_query: aiogram.types.CallbackQuery, callback_data: dict
+) -> Tuple[SourceContext, Optional[int], Optional[int], Optional[str]]:
+    """Return the SourceContext of the Stop message where a button was pressed,
+    and the chat_id, message_id & inline_message_id identifying the message."""
+    # Private Chat
+    if not callback_query.inline_message_id:
+        logger.debug("Request comes from private chat")
+        chat_id = callback_query.message.chat.id
+        context = SourceContext(
+            user_id=chat_id,
+            source_message=callback_query.message,
+            **callback_data
+        )
+        return context, chat_id, callback_query.message.message_id, None
+
+    # Inline Mode
+    logger.debug("Request comes from inline mode")
+    context = SourceContext(
+        from_inline=True,
+        **callback_data
+    )
+    return context, None, None, callback_query.inline_message_id
+
+
+def _get_callback_message_key(callback_query: aiogram.types.CallbackQuery):
+    if callback_query.inline_message_id:
+        return get_message_key(inline_message_id=callback_query.inline_message_id)
+    return get_message_key(chat_id=callback_query.message.chat.id, message_id=callback_query.message.message_id)
+
+
+def get_update_coalesce_key(update: aiogram.types.Update) -> Optional[Hashable]:
+    """Return the key identifying equivalent updates, for coalescing them while queued on the update scheduler:
+    presses of the Refresh button on the same Stop message, with the same callback data.
+    Return None for other updates (always processed)."""
+    callback_query = update.callback_query
+    if callback_query is None or not callback_query.data:
+        return None
+
     try:
-        # Private Chat
-        if not callback_query.inline_message_id:
-            logger.debug("Request comes from private chat")
-            chat_id = callback_query.message.chat.id
-            message_id = callback_query.message.message_id
-            inline_message_id = None
-
-            context = SourceContext(
-                user_id=chat_id,
-                source_message=callback_query.message,
-                **callback_data
-            )
+        callback_data = StopUpdateCallbackData.parse(callback_query.data)
+    except ValueError:
+        return None
+    return _get_callback_message_key(callback_query), tuple(sorted(callback_data.items()))
 
-        # Inline Mode
-        else:
-            logger.debug("Request comes from inline mode")
-            chat_id = message_id = None
-            inline_message_id = callback_query.inline_message_id
 
-            context = SourceContext(
-                from_inline=True,
-                **callback_data
-            )
+@single_flight(lambda callback_query, callback_data, message_key: (message_key, tuple(sorted(callback_data.items()))))
+async def _refresh_stop_message(
+        callback_query: aiogram.types.CallbackQuery, callback_data: dict, message_key
+):
+    try:
+        context, chat_id, message_id, inline_message_id = _get_stop_message_context(callback_query, callback_data)
+        subscription = get_live_refresh_subscription(message_key)
+        if subscription:
+            # Following live refreshes use the context requested now (i.e. more/less buses)
+            subscription.context = context
+            context.live_refresh = True
 
         # TODO Review:
         # For now, not sending "typing" status, since after message is updated it can still show "typing"...
@@ -57,14 +104,17 @@ async def stop_refresh(callback_query: aiogram.types.CallbackQuery, callback_dat
 
         text, markup = await generate_stop_message(context)
 
-        msg = await callback_query.bot.edit_message_text(
+        msg = await edit_message_text_if_changed(
+            bot=callback_query.bot,
             text=text,
             chat_id=chat_id,
             message_id=message_id,
             inline_message_id=inline_message_id,
             reply_markup=markup
         )
-        await persist_sent_stop_message(msg)
+        # Edits of inline messages return True instead of the Message
+        if isinstance(msg, aiogram.types.Message):
+            await persist_sent_stop_message(msg)
 
     except MessageNotModified:
         # MessageNotModified exceptions can be triggered when user presses Update button many times too quickly,
@@ -116,36 +166,35 @@ async def _stop_save_delete(
         chat_id = callback_query.message.chat.id
         message_id = callback_query.message.message_id
 
-        is_stop_saved = await saved_stops.is_stop_saved(user_id=chat_id, stop_id=data.stop_id)
-        persisted = False
-
         context = SourceContext(
             user_id=chat_id,
             source_message=callback_query.message,
+            live_refresh=bool(get_live_refresh_subscription(get_message_key(chat_id=chat_id, message_id=message_id))),
             **callback_data
         )
 
-        if save_stop and not is_stop_saved:
-            await saved_stops.save_stop(
-                user_id=chat_id,
-                stop_id=data.stop_id,
-                stop_name=None
-            )
-            persisted = True
+        if save_stop:
+            # Only save if not saved, to avoid removing the custom name of an already saved stop
+            saved_stop = await saved_stops.get_stop(user_id=chat_id, stop_id=data.stop_id)
+            if not saved_stop:
+                saved_stop = await saved_stops.save_stop(
+                    user_id=chat_id,
+                    stop_id=data.stop_id,
+                    stop_name=None
+                )
+            is_stop_saved = bool(saved_stop)
 
-        elif not save_stop and is_stop_saved:
+        else:
+            # Deleting is idempotent: the stop is not saved afterwards, whether it was saved or not
             await saved_stops.delete_stop(
                 user_id=chat_id,
                 stop_id=data.stop_id
             )
-            persisted = True
-
-        if persisted:
-            is_stop_saved = await saved_stops.is_stop_saved(user_id=chat_id, stop_id=data.stop_id)
-            assert is_stop_saved == save_stop
+            is_stop_saved = False
 
         markup = generate_stop_message_buttons(context=context, is_stop_saved=is_stop_saved)
-        await callback_query.bot.edit_message_reply_markup(
+        await edit_message_reply_markup(
+            bot=callback_query.bot,
             chat_id=chat_id,
             message_id=message_id,
             reply_markup=markup
@@ -206,7 +255,8 @@ async def stop_rename(callback_query: aiogram.types.CallbackQuery, callback_data
                     show_alert=True
                 ),
                 # Also update source message
-                callback_query.bot.edit_message_reply_markup(
+                edit_message_reply_markup(
+                    bot=callback_query.bot,
                     chat_id=chat_id,
                     message_id=source_message.message_id,
                     reply_markup=generate_stop_message_buttons(
@@ -265,6 +315,212 @@ async def stop_show_less_buses(callback_query: aiogram.types.CallbackQuery, call
     await stop_refresh(callback_query, callback_data)
 
 
+@request_handler("Button stop_live_refresh")
+async def stop_live_refresh(callback_query: aiogram.types.CallbackQuery, callback_data: dict, *args, **kwargs):
+    """Live Refresh button on Stop messages. Must subscribe the Stop message to the live refresh (so it gets refreshed
+    automatically for a while), or unsubscribe it if subscribed; then refresh the message, switching the button.
+    The Stop message can be on a private chat or come from Inline Mode.
+    """
+    messages = get_messages()
+    answer_text = None
+
+    try:
+        context, chat_id, message_id, inline_message_id = _get_stop_message_context(callback_query, callback_data)
+        message_key = _get_callback_message_key(callback_query)
+
+        if unsubscribe_live_refresh(message_key):
+            answer_text = messages.stop.live_refresh_disabled
+        else:
+            subscription = LiveRefreshSubscription(
+                message_key=message_key,
+                context=context,
+                chat_id=chat_id,
+                message_id=message_id,
+                inline_message_id=inline_message_id
+            )
+            if not subscribe_live_refresh(bot=callback_query.bot, subscription=subscription):
+                answer_text = messages.stop.live_refresh_unavailable
+                return
+
+            context.live_refresh = True
+            answer_text = messages.stop.live_refresh_enabled.format(
+                minutes=round(telegram_settings.stop_messages_live_refresh_duration / 60)
+            )
+
+        text, markup = await generate_stop_message(context)
+        msg = await edit_message_text_if_changed(
+            bot=callback_query.bot,
+            text=text,
+            chat_id=chat_id,
+            message_id=message_id,
+            inline_message_id=inline_message_id,
+            reply_markup=markup
+        )
+        # Edits of inline messages return True instead of the Message
+        if isinstance(msg, aiogram.types.Message):
+            await persist_sent_stop_message(msg)
+
+    finally:
+        await callback_query.bot.answer_callback_query(
+            callback_query_id=callback_query.id,
+            text=answer_text
+        )
+
+
+def _is_private_chat(callback_query: aiogram.types.CallbackQuery) -> bool:
+    """Return True if the button was pressed on a message of a private chat (Bus Alerts are only available there)"""
+    return callback_query.message is not None and \
+        callback_query.message.chat.type == aiogram.types.ChatType.PRIVATE
+
+
+@request_handler("Button stop_alert")
+async def stop_alert(callback_query: aiogram.types.CallbackQuery, callback_data: dict, *args, **kwargs):
+    """Alert button on Stop messages. Must send a message asking the user for the line of the Bus Alert,
+    with the lines of the buses currently arriving to the Stop as buttons.
+    """
+    messages = get_messages()
+    data = CallbackDataExtractor.extract(callback_data)
+    answer_text = None
+
+    try:
+        if not _is_private_chat(callback_query):
+            answer_text = messages.bus_alerts.private_chat_only
+            return
+
+        chat_id = callback_query.message.chat.id
+        stop, buses_response = await asyncio.gather(
+            get_stop(data.stop_id),
+            get_buses(stop_id=data.stop_id, get_all_buses=True)
+        )
+        lines = sorted({bus.line for bus in buses_response.buses})
+        if not lines:
+            answer_text = messages.bus_alerts.no_buses
+            return
+
+        await callback_query.bot.send_message(
+            chat_id=chat_id,
+            text=messages.bus_alerts.select_line.format(stop_id=stop.stop_id, stop_name=stop.name),
+            reply_markup=generate_bus_alert_lines_buttons(stop_id=stop.stop_id, lines=lines)
+        )
+
+    finally:
+        await callback_query.bot.answer_callback_query(
+            callback_query_id=callback_query.id,
+            text=answer_text,
+            show_alert=bool(answer_text)
+        )
+
+
+@request_handler("Button bus_alert_line")
+async def bus_alert_line(callback_query: aiogram.types.CallbackQuery, callback_data: dict, *args, **kwargs):
+    """A line button on a Bus Alert creation message. Must edit the message asking the user for the minutes
+    before the bus arrival to be notified at.
+    """
+    messages = get_messages()
+    stop_id = int(callback_data["stop_id"])
+    line = callback_data["line"]
+    answer_text = None
+
+    try:
+        if not _is_private_chat(callback_query):
+            answer_text = messages.bus_alerts.private_chat_only
+            return
+
+        stop = await get_stop(stop_id)
+        await callback_query.bot.edit_message_text(
+            chat_id=callback_query.message.chat.id,
+            message_id=callback_query.message.message_id,
+            text=messages.bus_alerts.select_minutes.format(line=line, stop_id=stop.stop_id, stop_name=stop.name),
+            reply_markup=generate_bus_alert_minutes_buttons(stop_id=stop.stop_id, line=line)
+        )
+
+    finally:
+        await callback_query.bot.answer_callback_query(
+            callback_query_id=callback_query.id,
+            text=answer_text,
+            show_alert=bool(answer_text)
+        )
+
+
+@request_handler("Button bus_alert_create")
+async def bus_alert_create(callback_query: aiogram.types.CallbackQuery, callback_data: dict, *args, **kwargs):
+    """A minutes button on a Bus Alert creation message. Must create the Bus Alert and edit the message confirming it,
+    with a button for cancelling the alert.
+    """
+    messages = get_messages()
+    answer_text = None
+
+    try:
+        if not _is_private_chat(callback_query):
+            answer_text = messages.bus_alerts.private_chat_only
+            return
+
+        chat_id = callback_query.message.chat.id
+        message_id = callback_query.message.message_id
+        stop = await get_stop(int(callback_data["stop_id"]))
+        alert = create_alert(
+            chat_id=chat_id,
+            stop_id=stop.stop_id,
+            line=callback_data["line"],
+            minutes=int(callback_data["minutes"]),
+            message_id=message_id
+        )
+        if alert is None:
+            answer_text = messages.bus_alerts.limit_reached
+            return
+
+        await callback_query.bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=message_id,
+            text=messages.bus_alerts.created.format(
+                line=alert.line,
+                minutes=alert.minutes,
+                stop_id=stop.stop_id,
+                stop_name=stop.name,
+                expire_minutes=round(telegram_settings.bus_alerts_duration / 60)
+            ),
+            reply_markup=generate_bus_alert_cancel_buttons(alert_id=alert.alert_id)
+        )
+
+    finally:
+        await callback_query.bot.answer_callback_query(
+            callback_query_id=callback_query.id,
+            text=answer_text,
+            show_alert=bool(answer_text)
+        )
+
+
+@request_handler("Button bus_alert_cancel")
+async def bus_alert_cancel(callback_query: aiogram.types.CallbackQuery, callback_data: dict, *args, **kwargs):
+    """Cancel button on a Bus Alert confirmation message. Must cancel the Bus Alert (if still pending),
+    and edit the message removing the button.
+    """
+    messages = get_messages()
+    chat_id = callback_query.message.chat.id
+    message_id = callback_query.message.message_id
+    answer_text = None
+
+    try:
+        alert = cancel_alert(alert_id=callback_data["alert_id"], chat_id=chat_id)
+        if alert is None:
+            answer_text = messages.bus_alerts.not_pending
+            await callback_query.bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id)
+            return
+
+        stop = await get_stop(alert.stop_id)
+        await callback_query.bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=message_id,
+            text=messages.bus_alerts.cancelled.format(line=alert.line, stop_id=stop.stop_id, stop_name=stop.name)
+        )
+
+    finally:
+        await callback_query.bot.answer_callback_query(
+            callback_query_id=callback_query.id,
+            text=answer_text
+        )
+
+
 @request_handler("Generic callback handler")
 async def generic_callback_handler(callback_query: aiogram.types.CallbackQuery, *args, **kwargs):
     """Any deprecated button is handled by the Generic Handler, informing the user of this situation.
@@ -303,6 +559,15 @@ def register_handlers(dispatcher: aiogram.Dispatcher):
     # Stop show Less Buses button
     dispatcher.register_callback_query_handler(stop_show_less_buses, StopLessBusesCallbackData.filter())
 
+    # Stop Live Refresh button
+    dispatcher.register_callback_query_handler(stop_live_refresh, StopLiveRefreshCallbackData.filter())
+
+    # Stop Alert button, and Bus Alert creation/cancellation buttons
+    dispatcher.register_callback_query_handler(stop_alert, StopAlertCallbackData.filter())
+    dispatcher.register_callback_query_handler(bus_alert_line, BusAlertLineCallbackData.filter())
+    dispatcher.register_callback_query_handler(bus_alert_create, BusAlertCreateCallbackData.filter())
+    dispatcher.register_callback_query_handler(bus_alert_cancel, BusAlertCancelCallbackData.filter())
+
     # Rest of buttons (generic handler for deprecated buttons)
     dispatcher.register_callback_query_handler(
         generic_callback_handler,
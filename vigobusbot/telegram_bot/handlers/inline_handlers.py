@@ -10,6 +10,7 @@ from vigobusbot.telegram_bot.services.message_generators import generate_search_
 from vigobusbot.telegram_bot.services.message_generators import generate_stop_message
 from vigobusbot.telegram_bot.services.message_generators import SourceContext
 from vigobusbot.telegram_bot.services.sent_messages_persistence import persist_sent_message, PersistMessageTypes
+from vigobusbot.telegram_bot.services.message_editor import edit_message_text_if_changed
 from vigobusbot.telegram_bot.services import request_handler
 from vigobusbot.settings_handler import telegram_settings as settings
 from vigobusbot.logger import logger
@@ -43,7 +44,8 @@ async def stop_search_chosen_result(chosen_inline_query: aiogram.types.ChosenInl
     )
     text, markup = await generate_stop_message(context)
 
-    msg = await chosen_inline_query.bot.edit_message_text(
+    msg = await edit_message_text_if_changed(
+        bot=chosen_inline_query.bot,
         inline_message_id=chosen_inline_query.inline_message_id,
         text=text,
         reply_markup=markup
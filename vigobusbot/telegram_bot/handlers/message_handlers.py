@@ -19,6 +19,7 @@ from vigobusbot.telegram_bot.entities import Message
 from vigobusbot.telegram_bot.services.message_generators import SourceContext, FeedbackForceReply
 from vigobusbot.telegram_bot.services.message_generators import generate_stop_message, generate_saved_stops_message
 from vigobusbot.telegram_bot.services.message_generators import generate_search_stops_message
+from vigobusbot.telegram_bot.services.message_generators import generate_nearest_stops_message
 from vigobusbot.telegram_bot.services.sent_messages_persistence import persist_sent_stop_message
 from vigobusbot.persistence_api.saved_stops import delete_all_stops
 from vigobusbot.settings_handler import system_settings
@@ -169,6 +170,31 @@ async def command_search_stops(message: Message, *args, **kwargs):
         stop_typing(chat_id)
 
 
+@request_handler("Location message")
+async def location_nearest_stops(message: Message, *args, **kwargs):
+    """Location message handler must return the Stops nearest to the location sent by the user
+    """
+    chat_id = user_id = message.chat.id
+
+    await start_typing(bot=message.bot, chat_id=chat_id)
+
+    try:
+        text, markup = await generate_nearest_stops_message(
+            latitude=message.location.latitude,
+            longitude=message.location.longitude,
+            user_id=user_id
+        )
+
+        await message.bot.send_message(
+            chat_id=chat_id,
+            text=text,
+            reply_markup=markup
+        )
+
+    finally:
+        stop_typing(chat_id)
+
+
 @request_handler("Command /cancel")
 async def command_cancel(message: Message, *args, **kwargs):
     """Cancel command handler cancels a ForceReply operation, such as Stop Rename.
@@ -303,6 +329,9 @@ def register_handlers(dispatcher: aiogram.Dispatcher):
     # /feedback command
     dispatcher.register_message_handler(command_feedback, commands=("feedback", "comentarios"))
 
+    # Location messages
+    dispatcher.register_message_handler(location_nearest_stops, content_types=aiogram.types.ContentTypes.LOCATION)
+
     # Test handlers
     if system_settings.test:
         test_message_handlers.register_handlers(dispatcher)
@@ -0,0 +1,233 @@
+"""OUTGOING LIMITER
+Pace the messages sent (or edited) through the Bot API, within the Telegram limits: a global rate, and a rate per chat
+(lower for group chats), using token buckets. Requests waiting for sending are granted by priority (interactive replies
+before background edits), skipping those of throttled chats. When Telegram replies with 429 (retry after), the chat
+(or all the chats, if not chat-specific) is paused for the given time.
+"""
+
+# # Native # #
+import time
+import asyncio
+import bisect
+import itertools
+import contextlib
+import contextvars
+from typing import Optional, List, Dict, Set
+
+# # Installed # #
+import cachetools
+
+# # Project # #
+from vigobusbot.services.metrics import Counter, Gauge, Histogram
+from vigobusbot.logger import logger
+
+__all__ = ("OutgoingLimiter", "TokenBucket", "Priority", "background_priority", "get_priority")
+
+
+class Priority:
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+_limiters: Set["OutgoingLimiter"] = set()
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("outgoing_priority", default=Priority.INTERACTIVE)
+"""Priority of the messages sent from the current context"""
+
+_wait_time = Histogram(
+    "vigobusbot_outgoing_wait_seconds",
+    "Time the outgoing Bot API requests waited for the rate limits",
+    labels=("priority",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+_retry_after = Counter(
+    "vigobusbot_outgoing_retry_after_total",
+    "Outgoing Bot API requests rejected by Telegram due to flood control (429)"
+)
+
+
+@contextlib.contextmanager
+def background_priority():
+    """Send the messages from the context with background priority (i.e. periodic edits not requested by users)"""
+    token = _priority.set(Priority.BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def get_priority() -> int:
+    return _priority.get()
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        """
+        :param rate: tokens added per second
+        :param capacity: maximum tokens (burst)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_on = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        # updated_on can be in the future while paused
+        if now > self.updated_on:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_on) * self.rate)
+            self.updated_on = now
+
+    def get_wait_time(self, now: float) -> float:
+        """Return the time (seconds) until a token is available (0 if available now)"""
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def consume(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        """Do not give tokens for the given time; the bucket is emptied"""
+        now = time.monotonic()
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = 0
+        self.updated_on = self.paused_until
+
+
+class _Waiter:
+    __slots__ = ("sort_key", "chat_id", "future")
+
+    def __init__(self, sort_key, chat_id: Optional[int], future: asyncio.Future):
+        self.sort_key = sort_key
+        self.chat_id = chat_id
+        self.future = future
+
+    def __lt__(self, other: "_Waiter"):
+        return self.sort_key < other.sort_key
+
+
+class OutgoingLimiter:
+    CHAT_BUCKETS_TTL = 60
+    """Time (seconds) the bucket of an idle chat is kept (after this time, it would be full, as a new bucket)"""
+
+    def __init__(
+            self, global_rate: float, chat_rate: float, chat_burst: float, group_rate: float,
+            max_chats: int = 10000
+    ):
+        """
+        :param global_rate: messages per second, for all the chats
+        :param chat_rate: messages per second, for each private chat
+        :param chat_burst: messages that can be sent at once on each chat
+        :param group_rate: messages per second, for each group chat
+        """
+        self.global_bucket = TokenBucket(rate=global_rate, capacity=max(1.0, global_rate))
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self._chat_buckets: Dict[int, TokenBucket] = cachetools.TTLCache(maxsize=max_chats, ttl=self.CHAT_BUCKETS_TTL)
+        self._waiters: List[_Waiter] = list()
+        """Requests waiting for sending, sorted by (priority, arrival)"""
+        self._sequence = itertools.count()
+        self._waiters_changed: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        _limiters.add(self)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _get_chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Group chats have negative ids
+            rate = self.group_rate if chat_id < 0 else self.chat_rate
+            bucket = TokenBucket(rate=rate, capacity=self.chat_burst if chat_id >= 0 else 1)
+
+        # Re-set on each access, so the TTL counts from the last use
+        self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def acquire(self, chat_id: Optional[int], priority: Optional[int] = None):
+        """Wait until a message can be sent to the given chat (if None, only the global limit applies)"""
+        if priority is None:
+            priority = get_priority()
+
+        start = time.monotonic()
+        future = asyncio.get_event_loop().create_future()
+        waiter = _Waiter(sort_key=(priority, next(self._sequence)), chat_id=chat_id, future=future)
+        bisect.insort(self._waiters, waiter)
+        self._ensure_worker()
+        self._waiters_changed.set()
+
+        try:
+            await future
+        finally:
+            if not future.done() or future.cancelled():
+                with contextlib.suppress(ValueError):
+                    self._waiters.remove(waiter)
+            _wait_time.observe(time.monotonic() - start, priority=priority)
+
+    def pause(self, chat_id: Optional[int], seconds: float):
+        """Pause the sending to the given chat (or to all the chats, if None) for the given time (retry after)"""
+        _retry_after.inc()
+        logger.bind(chat_id=chat_id, retry_after=seconds).warning("Bot API flood control, pausing outgoing messages")
+        bucket = self.global_bucket if chat_id is None else self._get_chat_bucket(chat_id)
+        bucket.pause(seconds)
+        if self._waiters_changed is not None:
+            self._waiters_changed.set()
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._waiters_changed = asyncio.Event()
+            # Start the worker on an empty context, so it does not inherit the context of the current request
+            self._worker = contextvars.Context().run(asyncio.create_task, self._grant_worker())
+
+    def _grant_next(self, now: float) -> float:
+        """Grant the first waiter (by priority) whose chat can send now. Return 0 if granted, otherwise the time
+        until a waiter could be granted."""
+        global_wait = self.global_bucket.get_wait_time(now)
+        if global_wait > 0:
+            return global_wait
+
+        min_wait = float("inf")
+        for waiter in self._waiters:
+            if waiter.future.done():
+                continue
+
+            wait = 0.0 if waiter.chat_id is None else self._get_chat_bucket(waiter.chat_id).get_wait_time(now)
+            if wait <= 0:
+                if waiter.chat_id is not None:
+                    self._get_chat_bucket(waiter.chat_id).consume(now)
+                self.global_bucket.consume(now)
+                self._waiters.remove(waiter)
+                waiter.future.set_result(None)
+                return 0
+            min_wait = min(min_wait, wait)
+
+        return min_wait
+
+    async def _grant_worker(self):
+        while True:
+            self._waiters = [waiter for waiter in self._waiters if not waiter.future.done()]
+            if not self._waiters:
+                self._waiters_changed.clear()
+                await self._waiters_changed.wait()
+                continue
+
+            wait = self._grant_next(time.monotonic())
+            if wait <= 0:
+                # Let the granted request run before granting the next one
+                await asyncio.sleep(0)
+                continue
+
+            # Wait for a token, or for new waiters (that could be granted sooner)
+            self._waiters_changed.clear()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._waiters_changed.wait(), timeout=wait)
+
+
+Gauge("vigobusbot_outgoing_waiting", "Outgoing Bot API requests waiting for the rate limits").set_function(
+    lambda: sum(limiter.waiting for limiter in _limiters)
+)
@@ -6,11 +6,17 @@ Telegram bot executor using the Polling method
 import aiogram
 
 # # Project # #
-from vigobusbot.telegram_bot.bot import Bot
+from vigobusbot.telegram_bot.bot import Bot, Dispatcher
 from vigobusbot.settings_handler import telegram_settings as settings
 from vigobusbot.logger import logger
 
 
+async def _on_shutdown(dispatcher: Dispatcher):
+    # Stop receiving updates, then let the updates pending and in progress finish before the bot session is closed
+    await dispatcher.close_polling()
+    await dispatcher.update_scheduler.close(timeout=settings.updates_shutdown_timeout)
+
+
 def start_polling(bot: Bot):
     """Start the Telegram bot with the Polling method. Creates a new Bot instance if not exists.
     This is a blocking function (bot runs on foreground until shutdown).
@@ -20,6 +26,7 @@ def start_polling(bot: Bot):
         bot.dispatcher,
         skip_updates=settings.skip_prev_updates,
         timeout=settings.polling_timeout,
-        fast=settings.polling_fast
+        fast=settings.polling_fast,
+        on_shutdown=_on_shutdown
     )
     logger.debug("Bot polling finished!")
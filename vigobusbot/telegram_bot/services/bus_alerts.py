@@ -0,0 +1,338 @@
+"""BUS ALERTS
+Alerts requested by users, to be notified when a bus of a certain line is arriving to a Stop (at N minutes or less).
+The alerts are checked by Stop: a single request for the Buses of a Stop checks all the pending alerts of that Stop.
+The next check of each Stop is scheduled on a timer queue, adapted to the remaining time until the buses of its alerts
+would be close enough (checking less often while the buses are far). Pending alerts are persisted on a local file,
+so they survive restarts.
+"""
+
+# # Native # #
+import os
+import json
+import secrets
+import asyncio
+import contextvars
+from time import time
+from typing import Optional, Dict, Set, List
+
+# # Installed # #
+import aiogram
+import pydantic
+
+# # Project # #
+from vigobusbot.vigobus_api import get_buses, get_stop
+from vigobusbot.entities import BusesResponse
+from vigobusbot.exceptions import BusBotException
+from vigobusbot.services.timer_queue import TimerQueue
+from vigobusbot.services.metrics import Counter, Gauge
+from vigobusbot.static_handler import get_messages
+from vigobusbot.settings_handler import telegram_settings as settings
+from vigobusbot.logger import logger
+
+__all__ = ("BusAlert", "create_alert", "cancel_alert", "bus_alerts_worker", "save_bus_alerts")
+
+
+class BusAlert(pydantic.BaseModel):
+    alert_id: str
+    chat_id: int
+    stop_id: int
+    line: str
+    minutes: int
+    """Notify when a bus of the line arrives in this amount of minutes or less"""
+    created_on: float
+    expires_on: float
+    """time.time when the alert expires, if not notified before"""
+    message_id: Optional[int]
+    """Message where the alert was created; the notification replies to it"""
+
+    def is_line(self, line: str) -> bool:
+        return self.line.upper() == line.upper()
+
+
+_alerts: Dict[str, BusAlert] = dict()
+"""Pending alerts.
+Key=alert_id
+Value=BusAlert
+"""
+_stops_alerts: Dict[int, Set[str]] = dict()
+"""Key=stop_id ; Value=alert_id of the pending alerts of the Stop"""
+_chats_alerts: Dict[int, Set[str]] = dict()
+"""Key=chat_id ; Value=alert_id of the pending alerts of the chat"""
+_checks = TimerQueue()
+"""Next check of the Stops with pending alerts.
+Key=stop_id
+Time=time.time of the next check
+"""
+_changed = False
+"""True if the alerts changed since last persisted"""
+
+_alerts_finished = Counter(
+    "vigobusbot_bus_alerts_finished_total",
+    "Bus alerts finished",
+    labels=("result",)
+)
+_stops_checks = Counter(
+    "vigobusbot_bus_alerts_stops_checks_total",
+    "Checks of the Buses of Stops with pending alerts",
+    labels=("result",)
+)
+
+
+def _add_alert(alert: BusAlert):
+    global _changed
+    _alerts[alert.alert_id] = alert
+    _stops_alerts.setdefault(alert.stop_id, set()).add(alert.alert_id)
+    _chats_alerts.setdefault(alert.chat_id, set()).add(alert.alert_id)
+    _changed = True
+
+
+def _remove_alert(alert: BusAlert):
+    global _changed
+    _alerts.pop(alert.alert_id, None)
+    stop_alerts = _stops_alerts.get(alert.stop_id, set())
+    stop_alerts.discard(alert.alert_id)
+    if not stop_alerts:
+        _stops_alerts.pop(alert.stop_id, None)
+        _checks.cancel(alert.stop_id)
+
+    chat_alerts = _chats_alerts.get(alert.chat_id, set())
+    chat_alerts.discard(alert.alert_id)
+    if not chat_alerts:
+        _chats_alerts.pop(alert.chat_id, None)
+    _changed = True
+
+
+def create_alert(chat_id: int, stop_id: int, line: str, minutes: int, message_id: Optional[int]) -> Optional[BusAlert]:
+    """Create an alert, checking the Buses of its Stop as soon as possible.
+    Return None if the alert could not be created because the maximum alerts (of the chat, or in total) were reached.
+    """
+    chat_alerts = len(_chats_alerts.get(chat_id, ()))
+    if chat_alerts >= settings.bus_alerts_max_per_chat or len(_alerts) >= settings.bus_alerts_max:
+        return None
+
+    alert_id = secrets.token_hex(8)
+    while alert_id in _alerts:
+        alert_id = secrets.token_hex(8)
+
+    now = time()
+    alert = BusAlert(
+        alert_id=alert_id,
+        chat_id=chat_id,
+        stop_id=stop_id,
+        line=line,
+        minutes=minutes,
+        created_on=now,
+        expires_on=now + settings.bus_alerts_duration,
+        message_id=message_id
+    )
+    _add_alert(alert)
+    _checks.schedule_earliest(stop_id, now)
+
+    logger.bind(alert=alert.dict(exclude={"chat_id"})).debug("Created bus alert")
+    return alert
+
+
+def cancel_alert(alert_id: str, chat_id: int) -> Optional[BusAlert]:
+    """Cancel a pending alert of the given chat. Return the alert, if it was pending."""
+    alert = _alerts.get(alert_id)
+    if alert is None or alert.chat_id != chat_id:
+        return None
+
+    _remove_alert(alert)
+    _alerts_finished.inc(result="cancelled")
+    return alert
+
+
+def _get_next_check_delay(alert: BusAlert, arrival_minutes: Optional[int]) -> float:
+    """Return the time (seconds) until the Buses of the alert Stop should be checked again, for this alert: half the
+    time until the bus would arrive within the alert minutes (if no bus of the line is coming, the maximum delay)."""
+    if arrival_minutes is None:
+        delay = settings.bus_alerts_check_max_interval
+    else:
+        delay = (arrival_minutes - alert.minutes) * 60 / 2
+
+    delay = min(max(delay, settings.bus_alerts_check_min_interval), settings.bus_alerts_check_max_interval)
+    return min(delay, max(alert.expires_on - time(), 0))
+
+
+async def _check_stop_alerts(bot: aiogram.Bot, stop_id: int):
+    alerts = [_alerts[alert_id] for alert_id in _stops_alerts.get(stop_id, ())]
+    if not alerts:
+        return
+
+    with logger.contextualize(stop_id=stop_id):
+        # noinspection PyBroadException
+        try:
+            buses_response = await get_buses(stop_id=stop_id, get_all_buses=True)
+        except (Exception, BusBotException):
+            logger.opt(exception=True).warning("Failed fetching the buses for checking the bus alerts")
+            buses_response = None
+
+        # Outdated buses (served while the API is unavailable) are not used for notifying
+        buses_available = buses_response is not None and not buses_response.outdated_since
+        _stops_checks.inc(result="ok" if buses_available else "error")
+        now = time()
+        next_checks_delays: List[float] = list()
+
+        for alert in alerts:
+            if alert.alert_id not in _alerts:
+                # Cancelled while fetching the buses
+                continue
+
+            arrival_minutes = None
+            if buses_available:
+                arrival_minutes = _get_line_arrival_minutes(buses_response=buses_response, alert=alert)
+
+            if arrival_minutes is not None and arrival_minutes <= alert.minutes:
+                _remove_alert(alert)
+                _alerts_finished.inc(result="notified")
+                await _notify_alert(bot=bot, alert=alert, arrival_minutes=arrival_minutes)
+
+            elif alert.expires_on <= now:
+                # Expired alerts are finished even if the buses are not available
+                _remove_alert(alert)
+                _alerts_finished.inc(result="expired")
+                await _notify_alert(bot=bot, alert=alert, arrival_minutes=None)
+
+            elif buses_available:
+                next_checks_delays.append(_get_next_check_delay(alert=alert, arrival_minutes=arrival_minutes))
+
+            else:
+                # Retry soon (but not after the alert expires)
+                next_checks_delays.append(min(settings.bus_alerts_check_min_interval, alert.expires_on - now))
+
+        if next_checks_delays and stop_id in _stops_alerts:
+            _checks.schedule_earliest(stop_id, now + min(next_checks_delays))
+
+
+def _get_line_arrival_minutes(buses_response: BusesResponse, alert: BusAlert) -> Optional[int]:
+    """Return the minutes until the next bus of the alert line arrives (None if no buses of the line are coming)"""
+    times = [bus.time for bus in buses_response.buses if alert.is_line(bus.line)]
+    return min(times) if times else None
+
+
+async def _notify_alert(bot: aiogram.Bot, alert: BusAlert, arrival_minutes: Optional[int]):
+    """Send the notification of the alert (bus arriving, or alert expired, if arrival_minutes is None)"""
+    messages = get_messages()
+
+    # noinspection PyBroadException
+    try:
+        stop = await get_stop(alert.stop_id)
+        if arrival_minutes is not None:
+            text = messages.bus_alerts.notification.format(
+                line=alert.line,
+                minutes=arrival_minutes,
+                stop_id=stop.stop_id,
+                stop_name=stop.name
+            )
+        else:
+            text = messages.bus_alerts.expired.format(
+                line=alert.line,
+                stop_id=stop.stop_id,
+                stop_name=stop.name
+            )
+
+        await bot.send_message(
+            chat_id=alert.chat_id,
+            text=text,
+            reply_to_message_id=alert.message_id,
+            allow_sending_without_reply=True
+        )
+        logger.debug("Bus alert notified")
+
+    except (aiogram.exceptions.BotBlocked, aiogram.exceptions.ChatNotFound, aiogram.exceptions.UserDeactivated):
+        logger.debug("Bus alert not notified, the user is not available")
+
+    except (Exception, BusBotException):
+        logger.opt(exception=True).error("Failed notifying bus alert")
+
+
+def _read_alerts(path: str) -> List[BusAlert]:
+    with open(path, "r") as file:
+        return [BusAlert(**alert_json) for alert_json in json.load(file)]
+
+
+def _write_alerts(path: str, alerts: List[BusAlert]):
+    # Write on a temporary file and replace, to avoid leaving corrupted files
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump([alert.dict() for alert in alerts], file)
+    os.replace(tmp_path, path)
+
+
+async def load_bus_alerts(path: Optional[str] = settings.bus_alerts_persist_file):
+    """Load the pending alerts persisted on the file, scheduling the checks of their Stops"""
+    if not path or not os.path.isfile(path):
+        return
+
+    with logger.contextualize(bus_alerts_persist_file=path):
+        # noinspection PyBroadException
+        try:
+            alerts = await asyncio.to_thread(_read_alerts, path)
+        except Exception:
+            logger.opt(exception=True).warning("Could not load the bus alerts from file")
+            return
+
+        now = time()
+        for alert in alerts:
+            _add_alert(alert)
+            # Expired alerts are checked (and notified) as soon as possible
+            _checks.schedule_earliest(alert.stop_id, now)
+
+        logger.info(f"Loaded {len(alerts)} bus alerts from file")
+
+
+async def save_bus_alerts(path: Optional[str] = settings.bus_alerts_persist_file):
+    """Persist the pending alerts on the file, if they changed since last persisted"""
+    global _changed
+    if not path or not _changed:
+        return
+
+    _changed = False
+    # noinspection PyBroadException
+    try:
+        await asyncio.to_thread(_write_alerts, path, list(_alerts.values()))
+        logger.bind(bus_alerts_persist_file=path).debug("Saved bus alerts file")
+    except Exception:
+        _changed = True
+        logger.opt(exception=True).warning("Could not save the bus alerts file")
+
+
+async def _bus_alerts_persist_worker():
+    while True:
+        await asyncio.sleep(settings.bus_alerts_persist_interval)
+        await save_bus_alerts()
+
+
+async def _check_stop_alerts_limited(bot: aiogram.Bot, stop_id: int, semaphore: asyncio.Semaphore):
+    async with semaphore:
+        await _check_stop_alerts(bot=bot, stop_id=stop_id)
+
+
+async def bus_alerts_worker(bot: aiogram.Bot):
+    """Load the persisted alerts and check the Stops with pending alerts when due. Runs forever as a background task."""
+    if not settings.bus_alerts_enabled:
+        logger.info("Bus alerts are disabled")
+        return
+
+    await load_bus_alerts()
+    if settings.bus_alerts_persist_file:
+        # noinspection PyAsyncCall
+        asyncio.create_task(_bus_alerts_persist_worker())
+
+    semaphore = asyncio.Semaphore(settings.bus_alerts_max_concurrent_checks)
+    while True:
+        for stop_id in await _checks.wait_due():
+            # Start each check on an empty context, so it does not inherit the context of the worker
+            # noinspection PyAsyncCall
+            contextvars.Context().run(
+                asyncio.create_task, _check_stop_alerts_limited(bot=bot, stop_id=stop_id, semaphore=semaphore)
+            )
+
+
+Gauge("vigobusbot_bus_alerts_pending", "Bus alerts pending of notification").set_function(
+    lambda: len(_alerts)
+)
+Gauge("vigobusbot_bus_alerts_stops", "Stops with pending bus alerts").set_function(
+    lambda: len(_stops_alerts)
+)
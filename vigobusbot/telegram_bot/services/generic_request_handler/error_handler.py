@@ -8,7 +8,7 @@ import contextlib
 # # Project # #
 from vigobusbot.logger import logger, get_request_id
 from vigobusbot.static_handler import get_messages
-from vigobusbot.exceptions import StopNotExist, UserRateLimit
+from vigobusbot.exceptions import StopNotExist, UserRateLimit, CircuitOpen
 from vigobusbot.telegram_bot.entities import RequestSource, Message, CallbackQuery
 
 __all__ = ("handle_exceptions",)
@@ -67,6 +67,10 @@ async def handle_exceptions(request_source: RequestSource):
     except UserRateLimit:
         await notify_error(text=get_messages().generic.rate_limit_error, request_source=request_source)
 
+    except CircuitOpen:
+        logger.opt(exception=True).warning("Request failed fast, an upstream service is unavailable")
+        await notify_error(text=get_messages().generic.service_unavailable_error, request_source=request_source)
+
     except Exception:
         logger.opt(exception=True).error("Unidentified error while processing a client request")
         await notify_error(
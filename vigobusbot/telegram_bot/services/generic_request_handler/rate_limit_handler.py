@@ -8,6 +8,7 @@ import cachetools
 # # Project # #
 from vigobusbot.settings_handler import telegram_settings as settings
 from vigobusbot.exceptions import UserRateLimit
+from vigobusbot.services.metrics import Counter
 from vigobusbot.logger import logger
 
 __all__ = ("handle_user_rate_limit",)
@@ -18,6 +19,11 @@ Key=user_id
 Value=amount of requests
 """
 
+_rate_limit_rejections = Counter(
+    "vigobusbot_rate_limit_rejections_total",
+    "User requests rejected for exceeding the user rate limit"
+)
+
 
 def handle_user_rate_limit(user_id: int, weight: float):
     """Add +1 to the requests counter of the user (or create the counter if not exists or expired).
@@ -35,6 +41,7 @@ def handle_user_rate_limit(user_id: int, weight: float):
     ):
         if requests > settings.user_rate_limit_amount:
             logger.debug("User exceeded rate limit")
+            _rate_limit_rejections.inc()
             raise UserRateLimit()
         else:
             logger.debug(f"Request counter for the user")
@@ -1,21 +1,33 @@
 """SERVICES - GENERIC REQUEST HANDLER - REQUEST HANDLER
 """
 
+# # Native # #
+from time import perf_counter
+
 # # Package # #
 from .rate_limit_handler import handle_user_rate_limit
 from .error_handler import handle_exceptions
 
 # # Project # #
 from vigobusbot.telegram_bot.entities import RequestSource
+from vigobusbot.services.metrics import Histogram
+from vigobusbot.services.deadline import deadline
+from vigobusbot.settings_handler import telegram_settings as settings
 from vigobusbot.logger import logger, get_request_id, get_request_verb
 from vigobusbot.utils import *
 
 __all__ = ("request_handler",)
 
+_requests_duration = Histogram(
+    "vigobusbot_request_duration_seconds",
+    "Duration of the requests handled (excluding sub-requests)",
+    labels=("verb",)
+)
+
 
 def request_handler(verb: str, rate_limit_weight: float = 1):
     """Decorator that must be used by all the bot Request Handler async functions,
-    for logging and error handling purposes.
+    for logging and error handling purposes. Requests are limited by the request_deadline setting.
     :param verb: Descriptor of the request being processed (for logging purposes)
     :param rate_limit_weight: How many points are added to the user rate limit counter (default=1)
     """
@@ -30,14 +42,16 @@ def request_handler(verb: str, rate_limit_weight: float = 1):
             if not request_id:
                 request_id = get_uuid()
                 user_id = request_source.from_user.id
+                start_time = perf_counter()
 
-                with logger.contextualize(request_id=request_id, verb=verb):
+                with logger.contextualize(request_id=request_id, verb=verb), deadline(settings.request_deadline):
                     logger.info("Request started")
 
                     async with handle_exceptions(request_source=request_source):
                         handle_user_rate_limit(user_id=user_id, weight=rate_limit_weight)
                         result = await request_handler_function(*args, **kwargs)
 
+                    _requests_duration.observe(perf_counter() - start_time, verb=verb)
                     with logger.contextualize(last_record=True):
                         logger.info("Request finished")
 
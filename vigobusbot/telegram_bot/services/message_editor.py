@@ -0,0 +1,89 @@
+"""MESSAGE EDITOR
+Edit messages, skipping the edits that would not change them (same text & markup as the last edit sent for the message),
+before calling the Bot API. All the edits of the messages edited through here (Stop messages) must go through here,
+so the last content remembered for each message is the actual content of the message.
+"""
+
+# # Native # #
+from typing import Optional, Hashable, Union
+
+# # Installed # #
+import aiogram
+import cachetools
+
+# # Project # #
+from vigobusbot.exceptions import MessageNotModified
+from vigobusbot.services.metrics import Counter
+from vigobusbot.logger import logger
+
+__all__ = ("get_message_key", "edit_message_text_if_changed", "edit_message_reply_markup")
+
+_last_contents = cachetools.TTLCache(maxsize=10000, ttl=3600)
+"""Content of the last edit sent for each message.
+Key=message key (chat_id, message_id) or inline_message_id
+Value=hash of (text, reply markup)
+"""
+
+_edits_skipped = Counter(
+    "vigobusbot_message_edits_skipped_total",
+    "Message edits not sent, because the message content would not change"
+)
+
+
+def get_message_key(
+        chat_id: Optional[int] = None, message_id: Optional[int] = None, inline_message_id: Optional[str] = None
+) -> Hashable:
+    """Return the key that identifies a message, sent to a chat (chat_id & message_id) or from inline mode"""
+    if inline_message_id:
+        return inline_message_id
+    return chat_id, message_id
+
+
+async def edit_message_text_if_changed(
+        bot: aiogram.Bot, text: str,
+        chat_id: Optional[int] = None, message_id: Optional[int] = None, inline_message_id: Optional[str] = None,
+        reply_markup: Optional[aiogram.types.InlineKeyboardMarkup] = None
+) -> Union[aiogram.types.Message, bool, None]:
+    """Edit the text (and markup) of a message, unless they are the same as the last edit sent for the message.
+    Return the result of the edit (the Message, or True for inline messages), or None if the edit was not performed.
+    """
+    key = get_message_key(chat_id=chat_id, message_id=message_id, inline_message_id=inline_message_id)
+    content = hash((text, reply_markup.as_json() if reply_markup else None))
+    if _last_contents.get(key) == content:
+        _edits_skipped.inc()
+        logger.debug("Message edit skipped, the content did not change")
+        return None
+
+    try:
+        result = await bot.edit_message_text(
+            text=text,
+            chat_id=chat_id,
+            message_id=message_id,
+            inline_message_id=inline_message_id,
+            reply_markup=reply_markup
+        )
+    except MessageNotModified:
+        _last_contents[key] = content
+        return None
+
+    _last_contents[key] = content
+    return result
+
+
+async def edit_message_reply_markup(
+        bot: aiogram.Bot,
+        chat_id: Optional[int] = None, message_id: Optional[int] = None, inline_message_id: Optional[str] = None,
+        reply_markup: Optional[aiogram.types.InlineKeyboardMarkup] = None
+) -> Union[aiogram.types.Message, bool]:
+    """Edit the markup of a message, forgetting the last content sent for the message
+    (so the next edit of its text is not skipped)."""
+    key = get_message_key(chat_id=chat_id, message_id=message_id, inline_message_id=inline_message_id)
+    try:
+        return await bot.edit_message_reply_markup(
+            chat_id=chat_id,
+            message_id=message_id,
+            inline_message_id=inline_message_id,
+            reply_markup=reply_markup
+        )
+    finally:
+        _last_contents.pop(key, None)
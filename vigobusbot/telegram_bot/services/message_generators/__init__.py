@@ -7,7 +7,9 @@ from .stop_message_text import *
 from .stop_message_buttons import *
 from .search_stops_message import *
 from .search_stops_inline import *
+from .nearest_stops_message import *
 from .callback_data_extractor import *
 from .saved_stops_message import *
+from .bus_alerts_message import *
 from .source_context import *
 from .entities import *
@@ -0,0 +1,60 @@
+"""BUS ALERTS MESSAGE
+Generators of the keyboard markups used while creating a Bus Alert (selecting the line, the minutes),
+and for cancelling it.
+"""
+
+# # Native # #
+from typing import Iterable
+
+# # Installed # #
+import aiogram
+
+# # Package # #
+from .entities import *
+
+# # Project # #
+from vigobusbot.static_handler import get_messages
+
+__all__ = (
+    "generate_bus_alert_lines_buttons", "generate_bus_alert_minutes_buttons", "generate_bus_alert_cancel_buttons",
+    "BUS_ALERT_MINUTES_OPTIONS"
+)
+
+BUS_ALERT_MINUTES_OPTIONS = (2, 5, 10, 15)
+"""Minutes the users can choose for being notified before a bus arrives"""
+BUS_ALERT_LINES_PER_ROW = 4
+
+
+def generate_bus_alert_lines_buttons(stop_id: int, lines: Iterable[str]) -> aiogram.types.InlineKeyboardMarkup:
+    messages = get_messages()
+    markup = aiogram.types.InlineKeyboardMarkup(row_width=BUS_ALERT_LINES_PER_ROW)
+    markup.add(*[
+        aiogram.types.InlineKeyboardButton(
+            text=messages.bus_alerts.buttons.line.format(line=line),
+            callback_data=BusAlertLineCallbackData.new(stop_id=stop_id, line=line)
+        )
+        for line in lines
+    ])
+    return markup
+
+
+def generate_bus_alert_minutes_buttons(stop_id: int, line: str) -> aiogram.types.InlineKeyboardMarkup:
+    messages = get_messages()
+    markup = aiogram.types.InlineKeyboardMarkup()
+    markup.row(*[
+        aiogram.types.InlineKeyboardButton(
+            text=messages.bus_alerts.buttons.minutes.format(minutes=minutes),
+            callback_data=BusAlertCreateCallbackData.new(stop_id=stop_id, line=line, minutes=minutes)
+        )
+        for minutes in BUS_ALERT_MINUTES_OPTIONS
+    ])
+    return markup
+
+
+def generate_bus_alert_cancel_buttons(alert_id: str) -> aiogram.types.InlineKeyboardMarkup:
+    markup = aiogram.types.InlineKeyboardMarkup()
+    markup.row(aiogram.types.InlineKeyboardButton(
+        text=get_messages().bus_alerts.buttons.cancel,
+        callback_data=BusAlertCancelCallbackData.new(alert_id=alert_id)
+    ))
+    return markup
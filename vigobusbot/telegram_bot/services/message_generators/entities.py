@@ -11,7 +11,8 @@ from aiogram.types.force_reply import ForceReply
 __all__ = (
     "StopUpdateCallbackData", "StopGetCallbackData",
     "StopSaveCallbackData", "StopDeleteCallbackData", "StopRenameCallbackData",
-    "StopMoreBusesCallbackData", "StopLessBusesCallbackData",
+    "StopMoreBusesCallbackData", "StopLessBusesCallbackData", "StopLiveRefreshCallbackData", "StopAlertCallbackData",
+    "BusAlertLineCallbackData", "BusAlertCreateCallbackData", "BusAlertCancelCallbackData",
     "RenameStopForceReply", "FeedbackForceReply"
 )
 
@@ -26,6 +27,13 @@ StopRenameCallbackData = CallbackData("rename", *CommonCallbackDataKeys)
 StopMoreBusesCallbackData = CallbackData("more_buses", *CommonCallbackDataKeys)
 StopLessBusesCallbackData = CallbackData("less_buses", *CommonCallbackDataKeys)
 
+StopLiveRefreshCallbackData = CallbackData("live", *CommonCallbackDataKeys)
+StopAlertCallbackData = CallbackData("alert", *CommonCallbackDataKeys)
+
+BusAlertLineCallbackData = CallbackData("alert_line", "stop_id", "line")
+BusAlertCreateCallbackData = CallbackData("alert_new", "stop_id", "line", "minutes")
+BusAlertCancelCallbackData = CallbackData("alert_cancel", "alert_id")
+
 StopGetCallbackData = CallbackData("get", "stop_id")
 
 RenameStopForceReply = ForceReply()
@@ -0,0 +1,78 @@
+"""NEAREST STOPS MESSAGE
+Generator of Nearest Stops message body (text and keyboard markup), sent when users share a location.
+Have the responsability of finding the Stops nearest to the location and if they are saved on user list.
+"""
+
+# # Native # #
+from typing import Tuple
+
+# # Installed # #
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+# # Project # #
+from vigobusbot.vigobus_api import search_nearest_stops
+from vigobusbot.persistence_api.saved_stops import get_user_saved_stops
+from vigobusbot.settings_handler import telegram_settings as settings
+from vigobusbot.static_handler import get_messages
+
+# # Package # #
+from .entities import StopGetCallbackData
+
+__all__ = ("generate_nearest_stops_message",)
+
+
+def _generate_distance_text(distance: float) -> str:
+    messages = get_messages()
+    if distance < 1000:
+        return messages.nearest_stops.distance_meters.format(distance=int(round(distance, -1)))
+    return messages.nearest_stops.distance_kilometers.format(distance=distance / 1000)
+
+
+async def generate_nearest_stops_message(
+        latitude: float, longitude: float, user_id: int
+) -> Tuple[str, InlineKeyboardMarkup]:
+    messages = get_messages()
+    found_stops = search_nearest_stops(
+        lat=latitude,
+        lon=longitude,
+        limit=settings.nearest_stops_limit,
+        max_distance=settings.nearest_stops_max_distance or None
+    )
+
+    # Add custom Stop Name for stops saved by the user
+    if found_stops:
+        user_saved_stops = await get_user_saved_stops(user_id)
+        user_saved_stops_dict = {saved_stop.stop_id: saved_stop for saved_stop in user_saved_stops}
+
+        for found_stop, _ in found_stops:
+            try:
+                found_stop_user_saved = user_saved_stops_dict[found_stop.stop_id]
+            except KeyError:
+                continue
+
+            if found_stop_user_saved.stop_name:
+                found_stop.name = messages.nearest_stops.buttons.stop_custom_name.format(
+                    stop_original_name=found_stop.name,
+                    stop_custom_name=found_stop_user_saved.stop_name
+                )
+
+    # Generate text
+    if found_stops:
+        text = messages.nearest_stops.message_stops_found
+    else:
+        text = messages.nearest_stops.message_no_stops
+
+    # Generate buttons
+    markup = InlineKeyboardMarkup()
+    for stop, distance in found_stops:
+        button = InlineKeyboardButton(
+            text=messages.nearest_stops.buttons.stop.format(
+                stop_name=stop.name,
+                stop_id=stop.stop_id,
+                distance=_generate_distance_text(distance)
+            ),
+            callback_data=StopGetCallbackData.new(stop_id=stop.stop_id)
+        )
+        markup.row(button)
+
+    return text, markup
@@ -25,6 +25,12 @@ class SourceContext(pydantic.BaseModel):
     more_buses_available: bool = False
     """True if the Bus API returned that more buses were available on last call to Buses endpoint"""
     from_inline: bool = False
+    live_refresh: bool = False
+    """True if the Stop message is subscribed to the live refresh (auto-refreshed periodically)"""
+
+    @property
+    def from_private_chat(self) -> bool:
+        return self.source_message is not None and self.source_message.chat.type == aiogram.types.ChatType.PRIVATE
 
     class Config:
         arbitrary_types_allowed = True
@@ -5,7 +5,7 @@ Have the responsability of finding the Stop, Buses and if the Stop is saved on u
 
 # # Native # #
 import asyncio
-from typing import Tuple
+from typing import Tuple, Optional
 
 # # Installed # #
 from aiogram.types import InlineKeyboardMarkup
@@ -28,8 +28,16 @@ async def dummy_get_saved_stops(*args, **kwargs):
     return None
 
 
-async def generate_stop_message(context: SourceContext) -> Tuple[str, InlineKeyboardMarkup]:
-    """Generate the Text body and Markup buttons to send as a Stop message, given a SourceContext
+async def dummy_get_buses(buses_response: BusesResponse) -> BusesResponse:
+    return buses_response
+
+
+async def generate_stop_message(
+        context: SourceContext, buses_response: Optional[BusesResponse] = None
+) -> Tuple[str, InlineKeyboardMarkup]:
+    """Generate the Text body and Markup buttons to send as a Stop message, given a SourceContext.
+    If buses_response is given, it is used instead of getting the Buses of the Stop (i.e. when the Buses are
+    fetched once for many messages of the same Stop).
     """
     stop: Stop
     buses_response: BusesResponse
@@ -41,7 +49,8 @@ async def generate_stop_message(context: SourceContext) -> Tuple[str, InlineKeyb
 
     stop, buses_response, user_saved_stop = await asyncio.gather(
         get_stop(context.stop_id),
-        get_buses(stop_id=context.stop_id, get_all_buses=context.get_all_buses),
+        get_buses(stop_id=context.stop_id, get_all_buses=context.get_all_buses)
+        if buses_response is None else dummy_get_buses(buses_response),
         get_saved_stops_coro
     )
 
@@ -11,6 +11,7 @@ from .entities import *
 
 # # Project # #
 from vigobusbot.static_handler import *
+from vigobusbot.settings_handler import telegram_settings
 
 __all__ = ("generate_stop_message_buttons",)
 
@@ -70,7 +71,29 @@ def generate_stop_message_buttons(context: SourceContext, is_stop_saved: bool) -
             row1.append(button_delete)
             row1.append(button_rename)
 
+    row2 = list()
+
+    # # # Live Refresh (enable/disable) Button # # #
+    if telegram_settings.stop_messages_live_refresh_interval > 0:
+        button_live_refresh = aiogram.types.InlineKeyboardButton(
+            text=messages.stop.buttons.live_refresh_disable if context.live_refresh
+            else messages.stop.buttons.live_refresh_enable,
+            callback_data=StopLiveRefreshCallbackData.new(**common_callback_data)
+        )
+        row2.append(button_live_refresh)
+
+    # # # Bus Alert Button # # #
+    # Alerts are notified on the private chat with the user
+    if telegram_settings.bus_alerts_enabled and context.from_private_chat:
+        button_alert = aiogram.types.InlineKeyboardButton(
+            text=messages.stop.buttons.alert,
+            callback_data=StopAlertCallbackData.new(**common_callback_data)
+        )
+        row2.append(button_alert)
+
     markup = aiogram.types.InlineKeyboardMarkup()
     markup.row(*row1)
+    if row2:
+        markup.row(*row2)
 
     return markup
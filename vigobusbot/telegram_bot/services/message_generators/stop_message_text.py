@@ -30,14 +30,18 @@ def generate_stop_message_text(
         stop_name_text = stop.name
 
     buses_text = "\n".join(_generate_buses_text_lines(buses_response.buses))
-    last_update_text = datetime.datetime.now().strftime(messages.stop.time_format)
+    last_update = buses_response.outdated_since or datetime.datetime.now()
+    last_update_text = last_update.strftime(messages.stop.time_format)
 
-    return messages.stop.message.format(
+    text = messages.stop.message.format(
         stop_id=stop.stop_id,
         stop_name=stop_name_text,
         buses=buses_text,
         last_update=last_update_text
     )
+    if buses_response.outdated_since:
+        text += "\n" + messages.stop.outdated_warning
+    return text
 
 
 def _generate_buses_text_lines(buses: List[Bus]) -> List[str]:
@@ -10,6 +10,9 @@ import pydantic
 from aiogram.types.message import Message
 
 from vigobusbot.persistence_api.saved_stops.services.encoder import encode_user_id
+from vigobusbot.services.metrics import Gauge
+from vigobusbot.services.timer_queue import TimerQueue
+from vigobusbot.settings_handler import telegram_settings as settings
 from vigobusbot.utils import get_datetime_now_utc
 
 
@@ -46,6 +49,15 @@ class MessagePersist(pydantic.BaseModel):
 sent_messages_cache: Dict[str, MessagePersist] = dict()
 """`{ message_key : message }`"""
 sent_messages_cache_lock = asyncio.Lock()
+sent_messages_deprecations = TimerQueue()
+"""Time when each sent message is considered deprecated (rescheduled when the message is persisted again).
+Key=message_key
+Time=timestamp of published_on + stop_messages_deprecation_reminder_after_seconds
+"""
+
+Gauge("vigobusbot_sent_messages_cache_size", "Sent messages kept in memory").set_function(
+    lambda: len(sent_messages_cache)
+)
 
 
 async def persist_sent_message(msg_type: str, message: Message):
@@ -54,8 +66,14 @@ async def persist_sent_message(msg_type: str, message: Message):
         message=message,
         published_on=get_datetime_now_utc(),
     )
+    ttl = settings.stop_messages_deprecation_reminder_after_seconds
     async with sent_messages_cache_lock:
         sent_messages_cache[message_persist.message_key] = message_persist
+        if ttl > 0:
+            sent_messages_deprecations.schedule(
+                key=message_persist.message_key,
+                when=message_persist.published_on.timestamp() + ttl
+            )
 
 
 async def persist_sent_stop_message(message: Message):
@@ -14,6 +14,7 @@ from aiogram.types import ChatActions
 
 # # Project # #
 from vigobusbot.settings_handler import telegram_settings as settings
+from vigobusbot.services.metrics import Gauge
 from vigobusbot.logger import logger
 
 __all__ = ("start_typing", "stop_typing")
@@ -21,6 +22,8 @@ __all__ = ("start_typing", "stop_typing")
 _typing_chats: Dict[int, asyncio.Event] = dict()
 """key=chat_id ; value=asyncio.Event"""
 
+Gauge("vigobusbot_typing_tasks", "Typing chat actions in progress").set_function(lambda: len(_typing_chats))
+
 
 async def _typing_service(bot: aiogram.Bot, chat_id: int, stop_event: asyncio.Event):
     """This coroutine runs as an async background task from start_typing, and can be stopped
@@ -6,10 +6,12 @@ import asyncio
 
 import aiogram
 
-from .sent_messages_persistence import sent_messages_cache, sent_messages_cache_lock, MessagePersist, PersistMessageTypes
+from .sent_messages_persistence import sent_messages_cache, sent_messages_cache_lock, sent_messages_deprecations
+from .sent_messages_persistence import MessagePersist, PersistMessageTypes
+from .message_editor import edit_message_text_if_changed
+from vigobusbot.telegram_bot.outgoing_limiter import background_priority
 from vigobusbot.static_handler import get_messages
 from vigobusbot.settings_handler import telegram_settings
-from vigobusbot.utils import get_datetime_now_utc
 from vigobusbot.logger import logger
 
 
@@ -18,21 +20,21 @@ async def stop_messages_deprecation_reminder_worker(bot: aiogram.Bot):
         logger.info("Stop messages deprecation reminder is disabled")
         return
 
-    while True:
-        await asyncio.sleep(telegram_settings.stop_messages_deprecation_reminder_loop_delay_seconds)
+    # The edits of deprecated messages are sent with background priority (after the replies to users)
+    with background_priority():
+        while True:
+            await asyncio.sleep(telegram_settings.stop_messages_deprecation_reminder_loop_delay_seconds)
 
-        now = get_datetime_now_utc()
-        ttl = telegram_settings.stop_messages_deprecation_reminder_after_seconds
+            # Only the messages due for deprecation are touched, not all the cached messages
+            async with sent_messages_cache_lock:
+                deprecated_messages = [
+                    sent_messages_cache.pop(message_key) for message_key in sent_messages_deprecations.pop_due()
+                ]
 
-        async with sent_messages_cache_lock:
-            cached_messages = list(sent_messages_cache.values())
-
-        for msg in cached_messages:
-            if msg.message_type == PersistMessageTypes.STOP and msg.is_expired(now=now, ttl_seconds=ttl):
-                async with sent_messages_cache_lock:
+            for msg in deprecated_messages:
+                if msg.message_type == PersistMessageTypes.STOP:
                     # noinspection PyAsyncCall
                     asyncio.create_task(_process_deprecated_stop_message(bot, msg))
-                    sent_messages_cache.pop(msg.message_key)
 
 
 async def _process_deprecated_stop_message(bot: aiogram.Bot, message: MessagePersist):
@@ -43,7 +45,8 @@ async def _process_deprecated_stop_message(bot: aiogram.Bot, message: MessagePer
 
         # noinspection PyBroadException
         try:
-            await bot.edit_message_text(
+            await edit_message_text_if_changed(
+                bot=bot,
                 chat_id=message.message.chat.id,
                 message_id=message.message.message_id,
                 text=text,
@@ -0,0 +1,203 @@
+"""STOP MESSAGES LIVE REFRESH
+Stop messages that users opted in to refresh automatically, every few seconds, for a limited time.
+A single poller runs per Stop with subscribed messages: on each tick it fetches the Buses of the Stop once,
+and edits all the messages subscribed to that Stop (with background priority, paced by the outgoing rate limits).
+When a subscription expires, the message is edited a last time, showing the button to enable the live refresh again.
+"""
+
+# # Native # #
+import asyncio
+import contextvars
+from time import monotonic
+from typing import Optional, Hashable, Dict, List
+
+# # Installed # #
+import aiogram
+
+# # Package # #
+from .message_editor import edit_message_text_if_changed
+from .message_generators import SourceContext, generate_stop_message
+from .sent_messages_persistence import persist_sent_stop_message
+
+# # Project # #
+from vigobusbot.telegram_bot.outgoing_limiter import background_priority
+from vigobusbot.vigobus_api import get_buses
+from vigobusbot.exceptions import BusBotException
+from vigobusbot.services.metrics import Counter, Gauge
+from vigobusbot.settings_handler import telegram_settings as settings
+from vigobusbot.logger import logger
+
+__all__ = (
+    "LiveRefreshSubscription", "subscribe_live_refresh", "unsubscribe_live_refresh", "get_live_refresh_subscription"
+)
+
+
+class LiveRefreshSubscription:
+    def __init__(
+            self, message_key: Hashable, context: SourceContext,
+            chat_id: Optional[int] = None, message_id: Optional[int] = None, inline_message_id: Optional[str] = None
+    ):
+        self.message_key = message_key
+        self.context = context
+        """Context of the Stop message; updated when the user changes it (i.e. requesting more buses)"""
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.inline_message_id = inline_message_id
+        self.expires_on = monotonic() + settings.stop_messages_live_refresh_duration
+        """time.monotonic when the subscription expires"""
+
+    @property
+    def stop_id(self) -> int:
+        return self.context.stop_id
+
+
+_subscriptions: Dict[int, Dict[Hashable, LiveRefreshSubscription]] = dict()
+"""Subscribed messages of each Stop.
+Key=stop_id
+Value={message_key: subscription}
+"""
+_subscriptions_stops: Dict[Hashable, int] = dict()
+"""Key=message_key ; Value=stop_id"""
+_pollers: Dict[int, asyncio.Task] = dict()
+"""Key=stop_id ; Value=poller task"""
+
+_edits = Counter(
+    "vigobusbot_live_refresh_edits_total",
+    "Stop messages edits sent by the live refresh",
+    labels=("result",)
+)
+
+
+def get_live_refresh_subscription(message_key: Hashable) -> Optional[LiveRefreshSubscription]:
+    stop_id = _subscriptions_stops.get(message_key)
+    if stop_id is None:
+        return None
+    return _subscriptions.get(stop_id, dict()).get(message_key)
+
+
+def subscribe_live_refresh(bot: aiogram.Bot, subscription: LiveRefreshSubscription) -> bool:
+    """Subscribe a Stop message to the live refresh, starting the poller of its Stop if not running.
+    If the message was already subscribed, the subscription is replaced (renewing its expiration).
+    Return False if the subscription was not possible because the maximum subscriptions were reached.
+    """
+    unsubscribe_live_refresh(subscription.message_key)
+    if len(_subscriptions_stops) >= settings.stop_messages_live_refresh_max_subscriptions:
+        logger.warning("Stop messages live refresh subscriptions limit reached")
+        return False
+
+    _subscriptions.setdefault(subscription.stop_id, dict())[subscription.message_key] = subscription
+    _subscriptions_stops[subscription.message_key] = subscription.stop_id
+
+    poller = _pollers.get(subscription.stop_id)
+    if poller is None or poller.done():
+        # Start the poller on an empty context, so it does not inherit the context of the current request
+        _pollers[subscription.stop_id] = contextvars.Context().run(
+            asyncio.create_task, _stop_poller(bot=bot, stop_id=subscription.stop_id)
+        )
+
+    logger.bind(stop_id=subscription.stop_id).debug("Stop message subscribed to live refresh")
+    return True
+
+
+def unsubscribe_live_refresh(message_key: Hashable) -> Optional[LiveRefreshSubscription]:
+    """Unsubscribe a Stop message from the live refresh. Return the subscription, if it was subscribed.
+    The poller of the Stop ends by itself on its next tick, if no messages remain subscribed.
+    """
+    stop_id = _subscriptions_stops.pop(message_key, None)
+    if stop_id is None:
+        return None
+
+    stop_subscriptions = _subscriptions.get(stop_id, dict())
+    subscription = stop_subscriptions.pop(message_key, None)
+    if not stop_subscriptions:
+        _subscriptions.pop(stop_id, None)
+    return subscription
+
+
+async def _stop_poller(bot: aiogram.Bot, stop_id: int):
+    # The edits of live messages are sent with background priority (after the replies to users)
+    with background_priority(), logger.contextualize(stop_id=stop_id):
+        logger.debug("Stop live refresh poller started")
+        try:
+            while _subscriptions.get(stop_id):
+                await asyncio.sleep(settings.stop_messages_live_refresh_interval)
+
+                now = monotonic()
+                subscriptions = list(_subscriptions.get(stop_id, dict()).values())
+                expired = [subscription for subscription in subscriptions if subscription.expires_on <= now]
+                for subscription in expired:
+                    unsubscribe_live_refresh(subscription.message_key)
+
+                if subscriptions:
+                    # The edits are awaited, so a tick does not start while the edits of the previous one are
+                    # waiting for the outgoing rate limits
+                    await _refresh_subscriptions(bot=bot, stop_id=stop_id, subscriptions=subscriptions)
+
+        finally:
+            if _pollers.get(stop_id) is asyncio.current_task():
+                _pollers.pop(stop_id)
+            logger.debug("Stop live refresh poller ended")
+
+
+async def _refresh_subscriptions(bot: aiogram.Bot, stop_id: int, subscriptions: List[LiveRefreshSubscription]):
+    """Fetch the Buses of the Stop once (for each list length requested by the subscriptions: short and/or complete),
+    and edit all the subscribed messages with them."""
+    buses_lists = list({subscription.context.get_all_buses for subscription in subscriptions})
+    # noinspection PyBroadException
+    try:
+        buses_responses = dict(zip(buses_lists, await asyncio.gather(*[
+            get_buses(stop_id=stop_id, get_all_buses=get_all_buses) for get_all_buses in buses_lists
+        ])))
+    except (Exception, BusBotException):
+        logger.opt(exception=True).warning("Failed fetching the buses for the Stop messages live refresh")
+        return
+
+    await asyncio.gather(*[
+        _refresh_subscription(
+            bot=bot,
+            subscription=subscription,
+            buses_response=buses_responses[subscription.context.get_all_buses]
+        )
+        for subscription in subscriptions
+    ])
+
+
+async def _refresh_subscription(bot: aiogram.Bot, subscription: LiveRefreshSubscription, buses_response):
+    # Expired (unsubscribed) messages are edited a last time, showing the button to enable the live refresh again
+    context = subscription.context.copy(update={
+        "live_refresh": get_live_refresh_subscription(subscription.message_key) is subscription
+    })
+
+    # noinspection PyBroadException
+    try:
+        text, markup = await generate_stop_message(context, buses_response=buses_response)
+        msg = await edit_message_text_if_changed(
+            bot=bot,
+            text=text,
+            chat_id=subscription.chat_id,
+            message_id=subscription.message_id,
+            inline_message_id=subscription.inline_message_id,
+            reply_markup=markup
+        )
+
+        _edits.inc(result="edited" if msg else "skipped")
+        # Edits of inline messages return True instead of the Message
+        if isinstance(msg, aiogram.types.Message):
+            await persist_sent_stop_message(msg)
+
+    except aiogram.exceptions.MessageToEditNotFound:
+        logger.debug("Live Stop message deleted by the user")
+        _edits.inc(result="deleted")
+        unsubscribe_live_refresh(subscription.message_key)
+
+    except (Exception, BusBotException):
+        logger.opt(exception=True).warning("Failed editing live Stop message")
+        _edits.inc(result="error")
+
+
+Gauge("vigobusbot_live_refresh_subscriptions", "Stop messages subscribed to the live refresh").set_function(
+    lambda: len(_subscriptions_stops)
+)
+Gauge("vigobusbot_live_refresh_pollers", "Stops with a live refresh poller running").set_function(
+    lambda: len(_pollers)
+)
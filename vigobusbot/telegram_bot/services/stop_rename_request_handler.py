@@ -14,6 +14,8 @@ from vigobusbot.telegram_bot.services.message_generators import generate_stop_me
 from vigobusbot.vigobus_api import get_stop
 from vigobusbot.persistence_api.saved_stops import save_stop
 from vigobusbot.telegram_bot.services.sent_messages_persistence import persist_sent_stop_message
+from vigobusbot.telegram_bot.services.message_editor import get_message_key, edit_message_text_if_changed
+from vigobusbot.telegram_bot.services.stop_messages_live_refresh import get_live_refresh_subscription
 from vigobusbot.static_handler import get_messages
 from vigobusbot.settings_handler import telegram_settings as settings
 from vigobusbot.logger import logger
@@ -132,19 +134,23 @@ async def handle_stop_rename_request_reply(user_reply_message: aiogram.types.Mes
 
     # Edit original Stop message
     logger.debug("Stop successfully renamed. Editing the original Stop message after renaming the Stop")
+    source_message_key = get_message_key(chat_id=chat_id, message_id=rename_context.source_message.message_id)
     source_context = SourceContext(
         stop_id=rename_context.stop_id,
         user_id=chat_id,
-        source_message=rename_context.source_message
+        source_message=rename_context.source_message,
+        live_refresh=bool(get_live_refresh_subscription(source_message_key))
     )
     text, buttons = await generate_stop_message(context=source_context)
 
-    msg = await user_reply_message.bot.edit_message_text(
+    msg = await edit_message_text_if_changed(
+        bot=user_reply_message.bot,
         chat_id=chat_id,
         text=text,
         message_id=rename_context.source_message.message_id,
         reply_markup=buttons
     )
-    await persist_sent_stop_message(msg)
+    if msg:
+        await persist_sent_stop_message(msg)
 
     logger.debug("Edited the original Stop message after renaming the Stop")
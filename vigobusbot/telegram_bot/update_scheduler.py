@@ -0,0 +1,169 @@
+"""UPDATE SCHEDULER
+Process the updates received from Telegram concurrently across chats, while keeping a strict order within each chat
+(an update is not processed until the previous updates of the same chat finished), with a global concurrency limit.
+Updates equivalent to another update still queued on the same chat (i.e. repeated presses of the same button)
+can be coalesced, discarding them.
+"""
+
+# # Native # #
+import asyncio
+import contextvars
+import collections
+from time import perf_counter
+from typing import Callable, Awaitable, Optional, Dict, Deque, Hashable, Set, Tuple
+
+# # Installed # #
+import aiogram
+
+# # Project # #
+from vigobusbot.exceptions import BusBotException
+from vigobusbot.services.metrics import Counter, Gauge, Histogram
+from vigobusbot.logger import logger
+
+__all__ = ("UpdateScheduler", "get_update_chat_key")
+
+UpdateProcessor = Callable[[aiogram.types.Update], Awaitable]
+UpdateCoalesceKeyGetter = Callable[[aiogram.types.Update], Optional[Hashable]]
+QueuedUpdate = Tuple[aiogram.types.Update, float, Optional[Hashable]]
+"""(update, time.perf_counter when submitted, coalesce key)"""
+
+_schedulers: Set["UpdateScheduler"] = set()
+
+_update_wait = Histogram(
+    "vigobusbot_update_wait_seconds",
+    "Time the updates waited since received until their processing started",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+_updates_coalesced = Counter(
+    "vigobusbot_updates_coalesced_total",
+    "Updates discarded, because an equivalent update was queued on the same chat"
+)
+
+
+def get_update_chat_key(update: aiogram.types.Update) -> Hashable:
+    """Return the key that identifies the chat (or user) of an update, for ordering the updates of the same chat"""
+    for message in (update.message, update.edited_message, update.channel_post, update.edited_channel_post):
+        if message is not None:
+            return message.chat.id
+
+    if update.callback_query is not None:
+        if update.callback_query.message is not None:
+            return update.callback_query.message.chat.id
+        return update.callback_query.from_user.id
+
+    for user_update in (update.inline_query, update.chosen_inline_result):
+        if user_update is not None:
+            return user_update.from_user.id
+
+    # Other updates are not ordered
+    return "update", update.update_id
+
+
+class UpdateScheduler:
+    def __init__(
+            self, process: UpdateProcessor, max_concurrency: int,
+            get_coalesce_key: Optional[UpdateCoalesceKeyGetter] = None
+    ):
+        """
+        :param process: async function that processes an update
+        :param max_concurrency: maximum updates processed at the same time (across all chats)
+        :param get_coalesce_key: optional function that returns the key identifying equivalent updates (or None if
+                                 the update must always be processed). Updates submitted while an update with the same
+                                 key is queued on their chat (not being processed yet) are discarded
+        """
+        self._process = process
+        self._get_coalesce_key = get_coalesce_key
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._chats: Dict[Hashable, Deque[QueuedUpdate]] = dict()
+        """Updates pending to process, by chat. Chats are removed when they have no pending updates.
+        Key=chat key
+        Value=queue of updates not being processed yet (waiting for the previous update of the chat to finish,
+        or for the concurrency limit)
+        """
+        self._tasks: Set[asyncio.Task] = set()
+        self.pending = 0
+        """Updates waiting to be processed"""
+        self._pending_decreased = asyncio.Event()
+        self.in_progress = 0
+        """Updates being processed"""
+        _schedulers.add(self)
+
+    def submit(self, update: aiogram.types.Update):
+        """Schedule an update for processing, after the previous updates of its chat"""
+        key = get_update_chat_key(update)
+        coalesce_key = self._get_coalesce_key(update) if self._get_coalesce_key else None
+
+        queue = self._chats.get(key)
+        if queue is not None:
+            if coalesce_key is not None and any(queued[2] == coalesce_key for queued in queue):
+                _updates_coalesced.inc()
+                logger.bind(update_id=update.update_id).debug("Update coalesced with an equivalent queued update")
+                return
+
+            self.pending += 1
+            queue.append((update, perf_counter(), coalesce_key))
+            return
+
+        self.pending += 1
+        self._chats[key] = collections.deque([(update, perf_counter(), coalesce_key)])
+        # Start the chat task on an empty context, so it does not inherit the context of the receiver of the update
+        task = contextvars.Context().run(asyncio.create_task, self._process_chat(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process_chat(self, key: Hashable):
+        queue = self._chats[key]
+        try:
+            while queue:
+                async with self._semaphore:
+                    update, submitted_on, _ = queue.popleft()
+                    self.pending -= 1
+                    self._pending_decreased.set()
+                    self.in_progress += 1
+                    _update_wait.observe(perf_counter() - submitted_on)
+
+                    # noinspection PyBroadException
+                    try:
+                        await self._process(update)
+                    except (Exception, BusBotException):
+                        logger.opt(exception=True).bind(update_id=update.update_id).error("Error processing update")
+                    finally:
+                        self.in_progress -= 1
+
+        finally:
+            self.pending -= len(queue)
+            self._pending_decreased.set()
+            self._chats.pop(key, None)
+
+    async def wait_pending_below(self, size: int):
+        """Wait until the updates waiting to be processed are less than the given size"""
+        while self.pending >= size:
+            self._pending_decreased.clear()
+            await self._pending_decreased.wait()
+
+    async def close(self, timeout: float):
+        """Wait for the pending updates to be processed (for a limited time), and cancel the remaining ones"""
+        if self._tasks:
+            done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            if pending:
+                logger.bind(pending_updates=self.pending + self.in_progress).warning(
+                    "Updates not processed before closing, discarding them"
+                )
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    def dict(self) -> dict:
+        return {
+            "pending": self.pending,
+            "in_progress": self.in_progress,
+            "chats": len(self._chats)
+        }
+
+
+Gauge("vigobusbot_updates_pending", "Updates received, waiting to be processed").set_function(
+    lambda: sum(scheduler.pending for scheduler in _schedulers)
+)
+Gauge("vigobusbot_updates_in_progress", "Updates being processed").set_function(
+    lambda: sum(scheduler.in_progress for scheduler in _schedulers)
+)
@@ -1,3 +1,149 @@
 """WEBHOOK
-Telegram bot executor using the Webhook method
+Telegram bot executor using the Webhook method.
+Updates are received by an HTTP server, which acknowledges them immediately and schedules them for processing on the
+UpdateScheduler of the dispatcher. The pending updates are bounded: when reached, updates are rejected (503), so Telegram
+delivers them again later.
 """
+
+# # Native # #
+import hmac
+import signal
+import asyncio
+import contextlib
+from typing import Optional
+
+# # Installed # #
+import aiogram
+from aiohttp import web
+
+# # Project # #
+from vigobusbot.telegram_bot.bot import Bot
+from vigobusbot.telegram_bot.update_scheduler import UpdateScheduler
+from vigobusbot.services.metrics import Counter
+from vigobusbot.settings_handler import telegram_settings as settings
+from vigobusbot.logger import logger
+
+__all__ = ("WebhookServer", "start_webhook", "SECRET_TOKEN_HEADER")
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+_updates_received = Counter(
+    "vigobusbot_webhook_updates_total",
+    "Updates received through the webhook, by result (queued, rejected due to the queue being full, unauthorized...)",
+    labels=("result",)
+)
+
+
+class WebhookServer:
+    def __init__(
+            self, bot: Bot, host: str, port: int, path: str, secret_token: Optional[str], queue_size: int,
+            scheduler: Optional[UpdateScheduler] = None
+    ):
+        """
+        :param queue_size: maximum updates pending to process
+        :param scheduler: scheduler for processing the updates (if not given, the one of the bot dispatcher)
+        """
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.queue_size = queue_size
+        self.scheduler = scheduler or bot.dispatcher.update_scheduler
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self):
+        """Start the HTTP server"""
+        app = web.Application()
+        app.router.add_post(self.path, self._webhook_endpoint)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.bind(webhook_host=self.host, webhook_port=self.port, webhook_path=self.path).info(
+            "Webhook server started"
+        )
+
+    async def stop(self, timeout: float):
+        """Stop receiving updates, and wait for the pending updates to be processed (for a limited time)"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+        await self.scheduler.close(timeout=timeout)
+        logger.info("Webhook server stopped")
+
+    def _is_authorized(self, request: web.Request) -> bool:
+        if not self.secret_token:
+            return True
+        received = request.headers.get(SECRET_TOKEN_HEADER, "")
+        return hmac.compare_digest(received.encode(), self.secret_token.encode())
+
+    async def _webhook_endpoint(self, request: web.Request):
+        if not self._is_authorized(request):
+            _updates_received.inc(result="unauthorized")
+            logger.bind(remote=request.remote).warning("Webhook request with invalid secret token")
+            return web.Response(status=401)
+
+        try:
+            update = aiogram.types.Update.to_object(await request.json())
+        except (ValueError, TypeError) as error:
+            _updates_received.inc(result="invalid")
+            logger.bind(error=str(error)).warning("Webhook request with invalid update")
+            return web.Response(status=400)
+
+        if self.scheduler.pending >= self.queue_size:
+            # Telegram will deliver the update again later
+            _updates_received.inc(result="rejected")
+            logger.bind(update_id=update.update_id).warning("Webhook queue full, update rejected")
+            return web.Response(status=503)
+
+        self.scheduler.submit(update)
+        _updates_received.inc(result="queued")
+        return web.Response()
+
+
+async def _run_webhook(bot: Bot):
+    server = WebhookServer(
+        bot=bot,
+        host=settings.webhook_host,
+        port=settings.webhook_port,
+        path=settings.webhook_path,
+        secret_token=settings.webhook_secret_token,
+        queue_size=settings.webhook_queue_size
+    )
+    if not settings.webhook_secret_token:
+        logger.warning("Webhook secret token not set, updates will not be validated")
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(signum, stop_event.set)
+
+    await server.start()
+    try:
+        if settings.webhook_url:
+            # Only set when the webhook URL is given: when scaled horizontally, it can be set by one of the instances
+            await bot.set_webhook(
+                url=settings.webhook_url,
+                secret_token=settings.webhook_secret_token,
+                max_connections=settings.webhook_max_connections,
+                drop_pending_updates=settings.skip_prev_updates
+            )
+            logger.bind(webhook_url=settings.webhook_url).info("Webhook set on Telegram")
+
+        await stop_event.wait()
+
+    finally:
+        await server.stop(timeout=settings.updates_shutdown_timeout)
+        session = await bot.get_session()
+        await session.close()
+
+
+def start_webhook(bot: Bot):
+    """Start the Telegram bot with the Webhook method.
+    This is a blocking function (bot runs on foreground until shutdown, with SIGINT/SIGTERM).
+    """
+    logger.debug("Bot webhook starting now!")
+    asyncio.get_event_loop().run_until_complete(_run_webhook(bot))
+    logger.debug("Bot webhook finished!")
@@ -4,3 +4,4 @@ Functions to fetch Stop and real-time Bus data from the VigoBusAPI
 
 from .stop_getter import *
 from .bus_getter import *
+from .stops_catalogue import *
@@ -1,18 +1,69 @@
 """BUS GETTER
-Get Buses using the API
+Get Buses using the API.
+Buses are cached locally for a short time, with separate caches for the short and the complete (get_all_buses) lists.
+When the API is unavailable, the last buses fetched (if not too old) are served, marked as outdated.
 """
 
+# # Native # #
+import datetime
+import functools
+
 # # Package # #
 from .requester import http_get
 from .exceptions import manage_stop_exceptions
 
 # # Project # #
 from vigobusbot.entities import Bus, BusesResponse
+from vigobusbot.exceptions import GetterException, CircuitOpen
+from vigobusbot.services.cache import AsyncCache
+from vigobusbot.services.single_flight import single_flight
+from vigobusbot.settings_handler import api_settings as settings
 
 __all__ = ("get_buses",)
 
 
+def _mark_outdated(buses_response: BusesResponse, fetched_on: float) -> BusesResponse:
+    return buses_response.copy(update={"outdated_since": datetime.datetime.fromtimestamp(fetched_on)})
+
+
+_buses_cache = AsyncCache(
+    name="buses",
+    ttl=settings.buses_cache_ttl,
+    maxsize=settings.buses_cache_size,
+    refresh_ahead=settings.buses_cache_refresh_ahead,
+    stale_ttl=settings.buses_cache_stale_ttl,
+    stale_on=(GetterException, CircuitOpen),
+    stale_mapper=_mark_outdated
+)
+"""Cache for the BusesResponse of stops, when requested with get_all_buses=False.
+Key=stop_id
+Value=BusesResponse
+"""
+_all_buses_cache = AsyncCache(
+    name="buses_all",
+    ttl=settings.buses_all_cache_ttl,
+    maxsize=settings.buses_cache_size,
+    refresh_ahead=settings.buses_cache_refresh_ahead,
+    stale_ttl=settings.buses_cache_stale_ttl,
+    stale_on=(GetterException, CircuitOpen),
+    stale_mapper=_mark_outdated
+)
+"""Cache for the BusesResponse of stops, when requested with get_all_buses=True.
+Key=stop_id
+Value=BusesResponse
+"""
+
+
 async def get_buses(stop_id: int, get_all_buses=False) -> BusesResponse:
+    cache = _all_buses_cache if get_all_buses else _buses_cache
+    return await cache.get(
+        key=stop_id,
+        loader=functools.partial(_fetch_buses, stop_id=stop_id, get_all_buses=get_all_buses)
+    )
+
+
+@single_flight(lambda stop_id, get_all_buses=False: (stop_id, bool(get_all_buses)))
+async def _fetch_buses(stop_id: int, get_all_buses=False) -> BusesResponse:
     with manage_stop_exceptions(stop_id):
         query_params = {
             "get_all_buses": int(get_all_buses)
@@ -4,16 +4,73 @@ Helpers to request HTTP sources
 
 # # Native # #
 import urllib.parse
+from typing import Dict, Optional
+
+# # Installed # #
+import httpx
 
 # # Project # #
-from vigobusbot.services.http import http_request, Methods, Response
+from vigobusbot.services.http import http_request, get_http_client, Methods, Response
+from vigobusbot.services.latency import AdaptiveTimeout
+from vigobusbot.services.circuit_breaker import CircuitBreaker, get_circuit_breaker as _get_circuit_breaker
 from vigobusbot.settings_handler import api_settings as settings
 
 __all__ = ("http_get",)
 
+_adaptive_timeouts: Dict[str, AdaptiveTimeout] = dict()
+"""Storage for the adaptive timeouts, one per API endpoint (latency differs between endpoints).
+Key=endpoint name (first segment of its path)
+Value=AdaptiveTimeout
+"""
+
+
+def get_client() -> httpx.AsyncClient:
+    return get_http_client(
+        name="vigobus_api",
+        max_connections=settings.pool_max_connections,
+        max_keepalive_connections=settings.pool_max_keepalive_connections,
+        keepalive_expiry=settings.pool_keepalive_expiry
+    )
+
+
+def get_circuit_breaker() -> Optional[CircuitBreaker]:
+    if not settings.circuit_breaker_enabled:
+        return None
+    return _get_circuit_breaker(
+        name="vigobus_api",
+        error_rate=settings.circuit_breaker_error_rate,
+        min_requests=settings.circuit_breaker_min_requests,
+        window=settings.circuit_breaker_window,
+        open_seconds=settings.circuit_breaker_open_seconds
+    )
+
+
+def get_adaptive_timeout(endpoint: str) -> Optional[AdaptiveTimeout]:
+    if not settings.adaptive_timeout_enabled:
+        return None
+
+    name = endpoint.strip("/").split("/")[0]
+    try:
+        return _adaptive_timeouts[name]
+    except KeyError:
+        adaptive_timeout = _adaptive_timeouts[name] = AdaptiveTimeout(
+            name="vigobus_api/" + name,
+            window=settings.latency_window,
+            multiplier=settings.adaptive_timeout_multiplier,
+            min_timeout=settings.timeout_min,
+            # GET requests are idempotent, thus can be hedged
+            hedge=settings.hedge_enabled,
+            hedge_min_delay=settings.hedge_min_delay
+        )
+        return adaptive_timeout
+
 
 async def http_get(
         endpoint, query_params=None, timeout=settings.timeout, retries=settings.retries
 ) -> Response:
     url = urllib.parse.urljoin(settings.url, endpoint)
-    return await http_request(method=Methods.GET, url=url, query_params=query_params, timeout=timeout, retries=retries)
+    return await http_request(
+        method=Methods.GET, url=url, query_params=query_params, timeout=timeout, retries=retries,
+        client=get_client(), adaptive_timeout=get_adaptive_timeout(endpoint),
+        circuit_breaker=get_circuit_breaker()
+    )
@@ -1,30 +1,68 @@
 """STOP GETTER
-Get Stop information using the API
+Get Stop information using the API.
+Stops are cached locally for a long time, since their information is practically static
+(the cache is also filled in bulk by the Stops Catalogue). When the API is unavailable, expired stops are served.
 """
 
 # # Native # #
 import json
 import asyncio
-from typing import Union
+import functools
+from typing import Union, Optional
 
 # # Package # #
 from .requester import http_get
 from .exceptions import manage_stop_exceptions
+from .stops_search_index import stops_search_index
+from .stops_geo_index import stops_geo_index, StopsDistances
 
 # # Project # #
 from vigobusbot.entities import Stop, Stops, StopsDict
+from vigobusbot.exceptions import GetterException, CircuitOpen
+from vigobusbot.services.cache import AsyncCache
+from vigobusbot.services.single_flight import single_flight
+from vigobusbot.settings_handler import api_settings as settings
+from vigobusbot.logger import logger
 from ..persistence_api.saved_stops.entities import *
 
-__all__ = ("get_stop", "get_multiple_stops", "search_stops_by_name", "fill_saved_stops_info")
+__all__ = (
+    "get_stop", "get_all_stops", "get_multiple_stops", "search_stops_by_name", "search_nearest_stops",
+    "fill_saved_stops_info"
+)
+
+SEARCH_STOPS_LIMIT = 50
+"""Maximum results returned when searching stops (Telegram Bot API limit for inline query results)"""
+
+stops_cache = AsyncCache(
+    name="stops",
+    ttl=settings.stops_cache_ttl,
+    stale_ttl=settings.stops_cache_stale_ttl,
+    stale_on=(GetterException, CircuitOpen)
+)
+"""Cache for the Stops.
+Key=stop_id
+Value=Stop
+"""
 
 
 async def get_stop(stop_id: int) -> Stop:
+    return await stops_cache.get(key=stop_id, loader=functools.partial(_fetch_stop, stop_id=stop_id))
+
+
+@single_flight(lambda stop_id: stop_id)
+async def _fetch_stop(stop_id: int) -> Stop:
     with manage_stop_exceptions(stop_id):
         result = await http_get(endpoint=f"/stop/{stop_id}")
         stop = Stop(**result.json())
         return stop
 
 
+async def get_all_stops() -> Stops:
+    """Get the complete listing of Stops from the API"""
+    result = await http_get(endpoint="/stops")
+    return [Stop(**single_result) for single_result in result.json()]
+
+
 async def get_multiple_stops(*stops_ids: int, return_dict: bool = False) -> Union[Stops, StopsDict]:
     result: Stops = await asyncio.gather(
         *[get_stop(stop_id) for stop_id in stops_ids]
@@ -37,10 +75,26 @@ async def get_multiple_stops(*stops_ids: int, return_dict: bool = False) -> Unio
 
 
 async def search_stops_by_name(search_term: str) -> Stops:
-    result = await http_get(endpoint="/stops", query_params={"stop_name": search_term, "limit": 50})
+    """Search Stops by name on the local search index, or on the API if the index is not available.
+    """
+    if stops_search_index.ready:
+        return stops_search_index.search(search_term, limit=SEARCH_STOPS_LIMIT)
+
+    logger.debug("Stops search index not available, searching on the API")
+    result = await http_get(endpoint="/stops", query_params={"stop_name": search_term, "limit": SEARCH_STOPS_LIMIT})
     return [Stop(**single_result) for single_result in result.json()]
 
 
+def search_nearest_stops(lat: float, lon: float, limit: int, max_distance: Optional[float] = None) -> StopsDistances:
+    """Search the Stops nearest to the given location on the local geo index (empty if the index is not available).
+    Return the found Stops (copies) with their distances (meters), sorted by distance.
+    """
+    return [
+        (stop.copy(), distance)
+        for stop, distance in stops_geo_index.nearest(lat=lat, lon=lon, limit=limit, max_distance=max_distance)
+    ]
+
+
 async def fill_saved_stops_info(saved_stops: SavedStops) -> SavedStops:
     """Given multiple SavedStops read from database, modify these SavedStops in-place with the remaining stop info
     (the original stop name) that is not persisted on DB, but on the Bus API.
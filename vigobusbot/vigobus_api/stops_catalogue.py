@@ -0,0 +1,121 @@
+"""STOPS CATALOGUE
+Local catalogue with all the Stops, loaded in bulk into the Stops cache, so Stop lookups are served locally.
+The catalogue is loaded on startup from a local snapshot file (if any) and from the API Stops listing,
+and then revalidated periodically from the API on background.
+"""
+
+# # Native # #
+import os
+import json
+import asyncio
+from typing import Optional
+
+# # Package # #
+from .stop_getter import get_all_stops, stops_cache
+from .stops_search_index import stops_search_index
+from .stops_geo_index import stops_geo_index
+
+# # Project # #
+from vigobusbot.entities import Stop, Stops, StopsDict
+from vigobusbot.exceptions import BusBotException
+from vigobusbot.settings_handler import api_settings as settings
+from vigobusbot.logger import logger
+
+__all__ = ("stops_catalogue_worker", "get_stops_catalogue")
+
+_catalogue: StopsDict = dict()
+"""All the Stops known from the last bulk load.
+Key=stop_id
+Value=Stop
+"""
+
+
+def get_stops_catalogue() -> StopsDict:
+    """Return all the Stops from the catalogue (empty if the catalogue was never loaded)"""
+    return _catalogue
+
+
+def _set_catalogue(stops: Stops):
+    global _catalogue
+    _catalogue = {stop.stop_id: stop for stop in stops}
+
+    for stop in stops:
+        stops_cache.set(stop.stop_id, stop)
+
+    stops_search_index.build(stops)
+    stops_geo_index.build(stops)
+
+
+def _read_snapshot(path: str) -> Stops:
+    with open(path, "r") as file:
+        return [Stop(**stop_json) for stop_json in json.load(file)]
+
+
+def _write_snapshot(path: str, stops: Stops):
+    # Write on a temporary file and replace, to avoid leaving corrupted snapshots
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump([stop.dict() for stop in stops], file, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+async def load_stops_catalogue_from_snapshot(path: Optional[str] = settings.stops_catalogue_snapshot_file) -> bool:
+    """Load the catalogue from the local snapshot file. Return True if loaded."""
+    if not path or not os.path.isfile(path):
+        return False
+
+    with logger.contextualize(stops_catalogue_snapshot_file=path):
+        # noinspection PyBroadException
+        try:
+            stops = await asyncio.to_thread(_read_snapshot, path)
+            _set_catalogue(stops)
+            logger.info(f"Loaded {len(stops)} Stops into the catalogue from snapshot file")
+            return True
+
+        except Exception:
+            logger.opt(exception=True).warning("Could not load the Stops catalogue from snapshot file")
+            return False
+
+
+async def load_stops_catalogue_from_api() -> bool:
+    """Load the catalogue from the API Stops listing, and persist it on the snapshot file (if any).
+    Return True if loaded."""
+    # noinspection PyBroadException
+    try:
+        stops = await get_all_stops()
+        if not stops:
+            logger.warning("The API returned no Stops for the catalogue")
+            return False
+
+        _set_catalogue(stops)
+        logger.info(f"Loaded {len(stops)} Stops into the catalogue from the API")
+
+    except (Exception, BusBotException):
+        logger.opt(exception=True).warning("Could not load the Stops catalogue from the API")
+        return False
+
+    path = settings.stops_catalogue_snapshot_file
+    if path:
+        # noinspection PyBroadException
+        try:
+            await asyncio.to_thread(_write_snapshot, path, stops)
+            logger.bind(stops_catalogue_snapshot_file=path).debug("Saved Stops catalogue snapshot file")
+        except Exception:
+            logger.opt(exception=True).warning("Could not save the Stops catalogue snapshot file")
+
+    return True
+
+
+async def stops_catalogue_worker():
+    """Load the Stops catalogue on startup and revalidate it periodically. Runs forever as a background task."""
+    if not settings.stops_catalogue_enabled:
+        logger.info("Stops catalogue is disabled")
+        return
+
+    await load_stops_catalogue_from_snapshot()
+
+    while True:
+        loaded = await load_stops_catalogue_from_api()
+        await asyncio.sleep(
+            settings.stops_catalogue_refresh_seconds if loaded else settings.stops_catalogue_retry_seconds
+        )
@@ -0,0 +1,130 @@
+"""STOPS GEO INDEX
+In-memory spatial index for the Stops catalogue, used to find the Stops nearest to a location.
+Stops are projected into a flat plane (in meters, accurate enough at city scale) and bucketed on a grid of square
+cells. Lookups only visit the cells around the given location, in rings of increasing distance.
+"""
+
+# # Native # #
+import math
+import heapq
+from collections import defaultdict
+from typing import Dict, List, Tuple, Optional
+
+# # Project # #
+from vigobusbot.entities import Stop, Stops
+
+__all__ = ("stops_geo_index", "StopsGeoIndex", "StopsDistances")
+
+METERS_PER_DEGREE_LATITUDE = 111_320
+DEFAULT_CELL_SIZE_METERS = 250
+
+StopsDistances = List[Tuple[Stop, float]]
+"""List of (Stop, distance in meters)"""
+_IndexedStop = Tuple[float, float, Stop]
+"""Stop with its projected coordinates: (x, y, Stop)"""
+
+
+class StopsGeoIndex:
+    def __init__(self, cell_size: float = DEFAULT_CELL_SIZE_METERS):
+        self.cell_size = cell_size
+        self._cells: Dict[Tuple[int, int], List[_IndexedStop]] = dict()
+        self._reference_latitude_cos = 1
+        self._cells_bounds = (0, 0, 0, 0)
+        """min cell x, min cell y, max cell x, max cell y"""
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._cells)
+
+    def _project(self, lat: float, lon: float) -> Tuple[float, float]:
+        return (
+            lon * METERS_PER_DEGREE_LATITUDE * self._reference_latitude_cos,
+            lat * METERS_PER_DEGREE_LATITUDE
+        )
+
+    def _get_cell(self, x: float, y: float) -> Tuple[int, int]:
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def build(self, stops: Stops):
+        """(Re)build the index with the given Stops, replacing the current content. Stops without location are ignored.
+        """
+        located_stops = [stop for stop in stops if stop.lat is not None and stop.lon is not None]
+        if not located_stops:
+            self._cells = dict()
+            return
+
+        # The mean latitude of all the stops is used as reference for the projection
+        reference_latitude = sum(stop.lat for stop in located_stops) / len(located_stops)
+        self._reference_latitude_cos = math.cos(math.radians(reference_latitude))
+
+        cells = defaultdict(list)
+        for stop in located_stops:
+            x, y = self._project(stop.lat, stop.lon)
+            cells[self._get_cell(x, y)].append((x, y, stop))
+
+        cells_x = [cell[0] for cell in cells.keys()]
+        cells_y = [cell[1] for cell in cells.keys()]
+        self._cells_bounds = (min(cells_x), min(cells_y), max(cells_x), max(cells_y))
+        self._cells = dict(cells)
+
+    def nearest(self, lat: float, lon: float, limit: int, max_distance: Optional[float] = None) -> StopsDistances:
+        """Return up to `limit` Stops nearest to the given location, sorted by distance (in meters).
+        If max_distance (meters) is given, Stops further than it are not returned.
+        """
+        if not self._cells or limit <= 0:
+            return []
+
+        x, y = self._project(lat, lon)
+        cell_x, cell_y = self._get_cell(x, y)
+        min_x, min_y, max_x, max_y = self._cells_bounds
+
+        # Rings before reaching the grid bounds are empty; rings after covering all the grid are not required
+        first_ring = max(0, min_x - cell_x, cell_x - max_x, min_y - cell_y, cell_y - max_y)
+        last_ring = max(cell_x - min_x, max_x - cell_x, cell_y - min_y, max_y - cell_y)
+        if max_distance is not None:
+            last_ring = min(last_ring, math.ceil(max_distance / self.cell_size) + 1)
+
+        nearest: List[Tuple[float, int, Stop]] = list()
+        """Max-heap (negative distances) with the nearest stops found: (-distance, stop_id, Stop)"""
+
+        for ring in range(first_ring, last_ring + 1):
+            # All the cells from this ring are, at least, this distance away from the location
+            if len(nearest) == limit and -nearest[0][0] <= (ring - 1) * self.cell_size:
+                break
+
+            for cell in self._iterate_ring_cells(cell_x, cell_y, ring):
+                for stop_x, stop_y, stop in self._cells.get(cell, ()):
+                    distance = math.hypot(stop_x - x, stop_y - y)
+                    if max_distance is not None and distance > max_distance:
+                        continue
+
+                    item = (-distance, stop.stop_id, stop)
+                    if len(nearest) < limit:
+                        heapq.heappush(nearest, item)
+                    elif item > nearest[0]:
+                        heapq.heapreplace(nearest, item)
+
+        return [(stop, -negative_distance) for negative_distance, _, stop in sorted(nearest, reverse=True)]
+
+    def _iterate_ring_cells(self, cell_x: int, cell_y: int, ring: int):
+        """Iterate the cells at the given ring (square perimeter) around a cell, limited to the grid bounds"""
+        if ring == 0:
+            yield cell_x, cell_y
+            return
+
+        min_x, min_y, max_x, max_y = self._cells_bounds
+        range_x = range(max(cell_x - ring, min_x), min(cell_x + ring, max_x) + 1)
+        range_y = range(max(cell_y - ring + 1, min_y), min(cell_y + ring - 1, max_y) + 1)
+
+        for row_y in (cell_y - ring, cell_y + ring):
+            if min_y <= row_y <= max_y:
+                for x in range_x:
+                    yield x, row_y
+        for column_x in (cell_x - ring, cell_x + ring):
+            if min_x <= column_x <= max_x:
+                for y in range_y:
+                    yield column_x, y
+
+
+stops_geo_index = StopsGeoIndex()
+"""Geo index for the Stops catalogue (built when the catalogue is loaded)"""
@@ -0,0 +1,151 @@
+"""STOPS SEARCH INDEX
+In-memory full-text search index for the Stops catalogue, used to search Stops by name locally.
+Stop names are normalized (lowercase, without accents or symbols) and indexed by:
+- tokens (words), searched by prefix: all the words of the search term must match the start of a word of the Stop name
+- trigrams of the words, for fuzzy matching when the words do not match (typos, partial words)
+"""
+
+# # Native # #
+import re
+import bisect
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+
+# # Project # #
+from vigobusbot.entities import Stop, Stops
+
+__all__ = ("stops_search_index", "StopsSearchIndex", "normalize_text")
+
+_non_alphanumeric_regex = re.compile(r"[^a-z0-9]+")
+
+FUZZY_MIN_COVERAGE = 0.5
+"""Minimum ratio of the search term trigrams that must be found on a Stop name, for fuzzy matches"""
+TOKEN_MATCH_BASE_SCORE = 2
+"""Base score for Stops matching all the search term words (so they rank above any fuzzy match)"""
+
+
+def normalize_text(text: str) -> str:
+    """Normalize the given text for searching: lowercase, without accents, and with symbols replaced by spaces"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return _non_alphanumeric_regex.sub(" ", text).strip()
+
+
+def _get_trigrams(normalized_text: str) -> Set[str]:
+    trigrams = set()
+    for token in normalized_text.split():
+        padded = f" {token} "
+        trigrams.update(padded[i:i+3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+class StopsSearchIndex:
+    def __init__(self):
+        self._stops: Dict[int, Stop] = dict()
+        self._tokens_postings: Dict[str, Set[int]] = dict()
+        """Key=token ; Value=stop_ids having the token on their names"""
+        self._tokens_sorted: List[str] = list()
+        """All the indexed tokens, sorted for prefix search"""
+        self._trigrams_postings: Dict[str, Set[int]] = dict()
+        """Key=trigram ; Value=stop_ids having the trigram on their names"""
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._stops)
+
+    def __len__(self):
+        return len(self._stops)
+
+    def build(self, stops: Stops):
+        """(Re)build the index with the given Stops, replacing the current content"""
+        stops_dict = dict()
+        tokens_postings = defaultdict(set)
+        trigrams_postings = defaultdict(set)
+
+        for stop in stops:
+            stops_dict[stop.stop_id] = stop
+            normalized_name = normalize_text(stop.name)
+
+            for token in normalized_name.split():
+                tokens_postings[token].add(stop.stop_id)
+            for trigram in _get_trigrams(normalized_name):
+                trigrams_postings[trigram].add(stop.stop_id)
+
+        # Replace all at once, so concurrent searches never see a partial index
+        self._stops, self._tokens_postings, self._trigrams_postings, self._tokens_sorted = (
+            stops_dict, dict(tokens_postings), dict(trigrams_postings), sorted(tokens_postings.keys())
+        )
+
+    def search(self, search_term: str, limit: int) -> Stops:
+        """Search Stops by name. Results are sorted by relevance, and returned as copies of the indexed Stops.
+        """
+        normalized_term = normalize_text(search_term)
+        if not normalized_term:
+            return []
+
+        scores = self._search_tokens(normalized_term.split())
+        if len(scores) < limit:
+            for stop_id, score in self._search_trigrams(normalized_term).items():
+                scores.setdefault(stop_id, score)
+
+        ranking: List[Tuple[float, int, int]] = sorted(
+            (-score, len(self._stops[stop_id].name), stop_id)
+            for stop_id, score in scores.items()
+        )
+        return [self._stops[stop_id].copy() for _, _, stop_id in ranking[:limit]]
+
+    def _search_tokens(self, search_tokens: List[str]) -> Dict[int, float]:
+        """Return the stops where all the search tokens match (as prefix) any word of the stop name.
+        Exact word matches score more than prefix matches.
+        """
+        scores: Dict[int, float] = dict()
+
+        for i, search_token in enumerate(search_tokens):
+            token_scores: Dict[int, float] = dict()
+
+            position = bisect.bisect_left(self._tokens_sorted, search_token)
+            while position < len(self._tokens_sorted) and self._tokens_sorted[position].startswith(search_token):
+                token = self._tokens_sorted[position]
+                token_score = 1 if token == search_token else 0.5 * len(search_token) / len(token)
+                for stop_id in self._tokens_postings[token]:
+                    if token_scores.get(stop_id, 0) < token_score:
+                        token_scores[stop_id] = token_score
+                position += 1
+
+            if i == 0:
+                scores = token_scores
+            else:
+                scores = {
+                    stop_id: score + token_scores[stop_id]
+                    for stop_id, score in scores.items()
+                    if stop_id in token_scores
+                }
+
+            if not scores:
+                break
+
+        return {
+            stop_id: TOKEN_MATCH_BASE_SCORE + score / len(search_tokens)
+            for stop_id, score in scores.items()
+        }
+
+    def _search_trigrams(self, normalized_term: str) -> Dict[int, float]:
+        """Return the stops that contain most of the trigrams of the search term, scored by trigram coverage (0~1)"""
+        search_trigrams = _get_trigrams(normalized_term)
+        shared_trigrams: Dict[int, int] = defaultdict(int)
+
+        for trigram in search_trigrams:
+            for stop_id in self._trigrams_postings.get(trigram, ()):
+                shared_trigrams[stop_id] += 1
+
+        scores = dict()
+        for stop_id, shared in shared_trigrams.items():
+            coverage = shared / len(search_trigrams)
+            if coverage >= FUZZY_MIN_COVERAGE:
+                scores[stop_id] = coverage
+        return scores
+
+
+stops_search_index = StopsSearchIndex()
+"""Search index for the Stops catalogue (built when the catalogue is loaded)"""